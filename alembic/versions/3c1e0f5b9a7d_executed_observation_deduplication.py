@@ -0,0 +1,41 @@
+"""executed observation deduplication index
+
+Revision ID: 3c1e0f5b9a7d
+Revises: a61279cf14c6
+Create Date: 2026-10-18 14:02:17.482910
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1e0f5b9a7d'
+down_revision = 'a61279cf14c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # remove duplicated observations, keeping the first one ingested
+    op.execute(
+        """
+        DELETE FROM executedobservations a
+        USING executedobservations b
+        WHERE a.instrument_id = b.instrument_id
+        AND a.observation_id = b.observation_id
+        AND a.id > b.id
+        """
+    )
+    op.create_index(
+        'executedobservations_deduplication_index',
+        'executedobservations',
+        ['instrument_id', 'observation_id'],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'executedobservations_deduplication_index',
+        table_name='executedobservations',
+    )
@@ -2,22 +2,31 @@
 #
 # curl -X POST http://localhost:64510 -d '{"method": "GET", "endpoint": "http://localhost:9980"}'
 #
+# The queue status and metrics are available with
+#
+# curl http://localhost:64510
+#
 
+from collections import defaultdict
 from datetime import datetime, timedelta
+import heapq
 import time
+from urllib.parse import urlparse
 
 import tornado.ioloop
 import tornado.web
 import asyncio
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.httputil import url_concat
 from tornado.ioloop import IOLoop
 import tornado.escape
 import json
-import requests
 
 import sqlalchemy as sa
 
 from baselayer.app.models import init_db
 from baselayer.app.env import load_env
+from baselayer.log import make_log
 from skyportal.models import (
     DBSession,
     FollowupRequest,
@@ -28,104 +37,265 @@ env, cfg = load_env()
 
 init_db(**cfg['database'])
 
-request_session = requests.Session()
-request_session.trust_env = (
-    False  # Otherwise pre-existing netrc config will override auth headers
-)
+log = make_log('facility_queue')
 
 WAIT_TIME_BETWEEN_QUERIES = timedelta(seconds=120)
+MAX_CONCURRENT_REQUESTS = cfg.get('facility_queue.max_concurrent_requests', 16)
+MAX_REQUESTS_PER_HOST = cfg.get('facility_queue.max_requests_per_host', 4)
+REQUEST_TIMEOUT_SECONDS = cfg.get('facility_queue.request_timeout_seconds', 60)
+
+# statuses of the requests that are not queried anymore
+FINAL_STATUSES = ('complete', 'failed')
+
+
+class FacilityRequestFailed(Exception):
+    """The facility rejected a request, or cannot be queried at all:
+    the request is not re-queued."""
+
+
+def load_request(req_id):
+    """Query parameters of a pending request, or None if it is complete,
+    failed (or was deleted)."""
+    with DBSession() as session:
+        req = session.query(FacilityTransactionRequest).get(req_id)
+        if req is None or req.status in FINAL_STATUSES:
+            return None
+        return {
+            'method': req.method,
+            'endpoint': req.endpoint,
+            'data': req.data,
+            'params': req.params,
+            'headers': req.headers,
+            'due': req.last_query + WAIT_TIME_BETWEEN_QUERIES,
+        }
+
+
+def handle_response(req_id, status_code, body):
+    """Update a request (and its follow-up request) from the response of
+    the facility. Returns when to query it again, or None if it is done.
+    Raises FacilityRequestFailed if the facility returned an error."""
+
+    next_due = None
+    with DBSession() as session:
+        req = session.query(FacilityTransactionRequest).get(req_id)
+        followup_request = session.query(FollowupRequest).get(req.followup_request_id)
+        instrument = followup_request.allocation.instrument
+        altdata = followup_request.allocation.altdata
+
+        if instrument.name == "ATLAS":
+            from skyportal.facility_apis.atlas import commit_photometry
+
+            if status_code == 200:
+                try:
+                    json_response = json.loads(body)
+                except Exception:
+                    raise ValueError('No JSON data returned in request')
+
+                if json_response['finishtimestamp']:
+                    req.status = "Committing photometry to database"
+                    commit_photometry(
+                        json_response,
+                        altdata,
+                        followup_request.id,
+                        instrument.id,
+                        followup_request.requester.id,
+                    )
+                    req.status = 'complete'
+                    session.add(req)
+                    log(f"Request {req.id} completed")
+
+                elif json_response['starttimestamp']:
+                    followup_request.status = f"Task is running (started at {json_response['starttimestamp']})"
+                    req.last_query = datetime.utcnow()
+                    session.add(req)
+                    next_due = req.last_query + WAIT_TIME_BETWEEN_QUERIES
+                else:
+                    followup_request.status = f"Waiting for job to start (queued at {json_response['timestamp']})"
+                    req.last_query = datetime.utcnow()
+                    session.add(req)
+                    next_due = req.last_query + WAIT_TIME_BETWEEN_QUERIES
+            else:
+                followup_request.status = f'error: {body}'
+
+            session.add(followup_request)
+            session.commit()
 
+            if status_code != 200:
+                raise FacilityRequestFailed(
+                    f'{instrument.name} returned status {status_code}'
+                )
+
+        else:
+            req.status = 'failed'
+            session.add(req)
+            session.commit()
+            raise FacilityRequestFailed(f'API for {instrument.name} unknown')
+
+    return next_due
+
+
+class FacilityQueue:
+    """Scheduler of the facility transaction requests, ordered by the time
+    at which they are due to be queried. Due requests are queried
+    concurrently, with at most MAX_REQUESTS_PER_HOST requests in flight
+    to each facility."""
+
+    def __init__(self):
+        self._heap = []  # (due time, request ID)
+        self._scheduled = set()
+        self._wakeup = asyncio.Event()
+        self._host_semaphores = defaultdict(
+            lambda: asyncio.Semaphore(MAX_REQUESTS_PER_HOST)
+        )
+        self._http_client = AsyncHTTPClient(max_clients=MAX_CONCURRENT_REQUESTS)
+
+        self.started_at = time.time()
+        self.in_flight = defaultdict(int)
+        self.n_queries = 0
+        self.n_completed = 0
+        self.n_failed = 0
+
+    def put(self, req_id, due=None):
+        """Schedule a request, by default as soon as possible."""
+        if req_id in self._scheduled:
+            return
+        heapq.heappush(self._heap, (due or datetime.utcnow(), req_id))
+        self._scheduled.add(req_id)
+        self._wakeup.set()
+
+    def qsize(self):
+        return len(self._heap)
+
+    def metrics(self):
+        now = datetime.utcnow()
+        uptime = time.time() - self.started_at
+        return {
+            "queue_length": self.qsize(),
+            "due": sum(due <= now for due, _ in self._heap),
+            "in_flight": sum(self.in_flight.values()),
+            "in_flight_per_host": {
+                host: n for host, n in self.in_flight.items() if n > 0
+            },
+            "queries": self.n_queries,
+            "completed": self.n_completed,
+            "failed": self.n_failed,
+            "queries_per_minute": 60 * self.n_queries / uptime,
+            "uptime_seconds": uptime,
+        }
 
-class FacilityQueue(asyncio.Queue):
     async def load_from_db(self):
         # Load items from database into queue
 
         with DBSession() as session:
-            requests = (
-                session.query(FacilityTransactionRequest)
-                .where(FacilityTransactionRequest.status != "complete")
-                .all()
+            requests = session.execute(
+                sa.select(
+                    FacilityTransactionRequest.id,
+                    FacilityTransactionRequest.last_query,
+                ).where(FacilityTransactionRequest.status.notin_(FINAL_STATUSES))
+            ).all()
+        for req_id, last_query in requests:
+            self.put(req_id, last_query + WAIT_TIME_BETWEEN_QUERIES)
+
+    async def _next_due(self):
+        while True:
+            now = datetime.utcnow()
+            if len(self._heap) > 0 and self._heap[0][0] <= now:
+                _, req_id = heapq.heappop(self._heap)
+                self._scheduled.discard(req_id)
+                return req_id
+
+            timeout = (
+                (self._heap[0][0] - now).total_seconds()
+                if len(self._heap) > 0
+                else None
             )
-            for req in requests:
-                await self.put(req.id)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def process(self, req_id):
+        """Query a due request, and return when to query it again
+        (or None)."""
+        loop = IOLoop.current()
+
+        req = await loop.run_in_executor(None, load_request, req_id)
+        if req is None:
+            return None
+        if req['due'] > datetime.utcnow():
+            # e.g., queried after being (re)submitted
+            return req['due']
+
+        log(f"Executing request {req_id}")
+        headers = dict(req['headers'] or {})
+        body = None
+        if req['data'] is not None:
+            body = json.dumps(req['data'])
+            headers.setdefault('Content-Type', 'application/json')
+
+        host = urlparse(req['endpoint']).netloc
+        async with self._host_semaphores[host]:
+            self.in_flight[host] += 1
+            try:
+                response = await self._http_client.fetch(
+                    HTTPRequest(
+                        url_concat(req['endpoint'], req['params']),
+                        method=req['method'],
+                        headers=headers,
+                        body=body,
+                        allow_nonstandard_methods=True,
+                        request_timeout=REQUEST_TIMEOUT_SECONDS,
+                    ),
+                    raise_error=False,
+                )
+            finally:
+                self.in_flight[host] -= 1
+        self.n_queries += 1
+
+        if response.code == 599:
+            # connection error or timeout, try again later
+            raise ConnectionError(str(response.error))
+
+        # database updates (and photometry ingestion) off the event loop
+        next_due = await loop.run_in_executor(
+            None,
+            handle_response,
+            req_id,
+            response.code,
+            response.body.decode() if response.body else '',
+        )
+        if next_due is None:
+            self.n_completed += 1
+        return next_due
+
+    async def worker(self):
+        while True:
+            req_id = await self._next_due()
+            try:
+                next_due = await self.process(req_id)
+            except FacilityRequestFailed as e:
+                log(f"Request {req_id} failed: {e}")
+                self.n_failed += 1
+                next_due = None
+            except Exception as e:
+                log(f"Error processing request {req_id}: {e}")
+                self.n_failed += 1
+                next_due = datetime.utcnow() + WAIT_TIME_BETWEEN_QUERIES
+            if next_due is not None:
+                self.put(req_id, next_due)
 
     async def service(self):
-        while True:
+        await asyncio.gather(*[self.worker() for _ in range(MAX_CONCURRENT_REQUESTS)])
 
-            req_id = await queue.get()
-            with DBSession() as session:
-                req = session.query(FacilityTransactionRequest).get(req_id)
-                dt = datetime.utcnow() - req.last_query
-                if dt < WAIT_TIME_BETWEEN_QUERIES:
-                    await self.put(req.id)
-                else:
-                    print(f"Executing request {req.id}")
-                    followup_request = session.query(FollowupRequest).get(
-                        req.followup_request_id
-                    )
-                    instrument = followup_request.allocation.instrument
-                    altdata = followup_request.allocation.altdata
-
-                    response = request_session.request(
-                        req.method,
-                        req.endpoint,
-                        json=req.data,
-                        params=req.params,
-                        headers=req.headers,
-                    )
 
-                    if instrument.name == "ATLAS":
-                        from skyportal.facility_apis.atlas import commit_photometry
-
-                        if response.status_code == 200:
-                            try:
-                                json_response = response.json()
-                            except Exception:
-                                raise ('No JSON data returned in request')
-
-                            if json_response['finishtimestamp']:
-                                req.status = "Committing photometry to database"
-                                commit_photometry(
-                                    json_response,
-                                    altdata,
-                                    followup_request.id,
-                                    instrument.id,
-                                    followup_request.requester.id,
-                                )
-                                req.status = 'complete'
-                                session.add(req)
-                                print(f"Request {req.id} completed")
-
-                            elif json_response['starttimestamp']:
-                                followup_request.status = f"Task is running (started at {json_response['starttimestamp']})"
-                                req.last_query = datetime.utcnow()
-                                session.add(req)
-                                await self.put(req.id)
-                            else:
-                                followup_request.status = f"Waiting for job to start (queued at {json_response['timestamp']})"
-                                req.last_query = datetime.utcnow()
-                                session.add(req)
-                                await self.put(req.id)
-                        else:
-                            followup_request.status = f'error: {response.content}'
-
-                        session.add(followup_request)
-                        session.commit()
-
-                    else:
-                        raise ValueError(f'API for {instrument.name} unknown')
-
-                # Pause between requests
-                time.sleep(10)
-
-
-queue = FacilityQueue()
+queue = None
 
 
 class QueueHandler(tornado.web.RequestHandler):
     def get(self):
         self.set_header("Content-Type", "application/json")
-        self.write({"status": "success", "data": {"queue_length": queue.qsize()}})
+        self.write({"status": "success", "data": queue.metrics()})
 
     async def post(self):
 
@@ -183,7 +353,7 @@ class QueueHandler(tornado.web.RequestHandler):
             session.add(req)
             session.commit()
 
-            await queue.put(req.id)
+            queue.put(req.id, req.last_query + WAIT_TIME_BETWEEN_QUERIES)
 
             self.set_status(200)
             return self.write(
@@ -200,6 +370,7 @@ if __name__ == "__main__":
     app.listen(cfg["ports.facility_queue"])
 
     loop = IOLoop.current()
+    queue = FacilityQueue()
     loop.add_callback(queue.load_from_db)
     loop.add_callback(queue.service)
     loop.start()
@@ -1,11 +1,18 @@
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from gcn_kafka import Consumer
+import threading
 import uuid
 
 from baselayer.log import make_log
 from baselayer.app.models import init_db
 from baselayer.app.env import load_env
 
-from skyportal.handlers.api.gcn import post_gcnevent_from_xml
+from skyportal.handlers.api.gcn import (
+    parse_voevent,
+    post_gcnnotice_from_xml,
+    post_skymap_from_notice,
+)
 
 from skyportal.models import (
     DBSession,
@@ -23,6 +30,56 @@ notice_types = [
 
 log = make_log('gcnserver')
 
+# number of ingested ivorns remembered, to skip re-delivered notices
+# without querying the database
+MAX_RECENT_IVORNS = 10000
+
+# one lock per GcnEvent, so that the skymaps of an event
+# are posted one at a time (in the order of the notices)
+skymap_locks = defaultdict(threading.Lock)
+
+
+def ingest_skymap(gcn_notice_id, user_id, lock):
+    """Fetch the skymap of a notice and generate its tiles,
+    properties and contour, in a worker thread."""
+    with lock:
+        with DBSession() as session:
+            localization_id = post_skymap_from_notice(
+                gcn_notice_id, user_id, session, asynchronous=False
+            )
+    if localization_id is not None:
+        log(f'Ingested skymap of notice {gcn_notice_id}')
+
+
+def log_skymap_error(future):
+    if future.exception() is not None:
+        log(f'Failed to ingest skymap: {future.exception()}')
+
+
+def ingest_notice(payload, user_id, executor, recent_ivorns):
+    """Ingest a notice in stages: parse it and skip it if it was already
+    ingested, then validate and save it (with its event) to the database,
+    and finally fetch and tile its skymap in the worker pool."""
+    root = parse_voevent(payload)
+    ivorn = root.attrib['ivorn']
+    if ivorn in recent_ivorns:
+        log(f'Skipping notice {ivorn}: already ingested')
+        return
+
+    with DBSession() as session:
+        gcn_notice = post_gcnnotice_from_xml(payload, user_id, session, root=root)
+        gcn_notice_id, dateobs = gcn_notice.id, gcn_notice.dateobs
+    log(f'Ingested notice {ivorn}')
+
+    recent_ivorns[ivorn] = None
+    if len(recent_ivorns) > MAX_RECENT_IVORNS:
+        recent_ivorns.popitem(last=False)
+
+    future = executor.submit(
+        ingest_skymap, gcn_notice_id, user_id, skymap_locks[dateobs]
+    )
+    future.add_done_callback(log_skymap_error)
+
 
 def service():
     if client_id is None or client_id == '':
@@ -59,14 +116,19 @@ def service():
     except Exception as e:
         log(f'Failed to subscribe to gcn events: {e}')
         return
+
+    executor = ThreadPoolExecutor(max_workers=cfg.get('gcn.max_skymap_workers', 4))
+    recent_ivorns = OrderedDict()
     while True:
         try:
             for message in consumer.consume():
                 payload = message.value()
                 consumer.commit(message)
                 user_id = 1
-                with DBSession() as session:
-                    post_gcnevent_from_xml(payload, user_id, session)
+                try:
+                    ingest_notice(payload, user_id, executor, recent_ivorns)
+                except Exception as e:
+                    log(f'Failed to ingest gcn notice: {e}')
 
         except Exception as e:
             log(f'Failed to consume gcn event: {e}')
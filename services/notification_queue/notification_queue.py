@@ -0,0 +1,136 @@
+# Sends the Slack/email/SMS/phone/WhatsApp notifications recorded in the
+# notification_deliveries table (the outbox filled when UserNotifications
+# are created), one thread per channel so that a slow provider does not
+# delay the others.
+
+from datetime import datetime, timedelta
+import threading
+import time
+
+import numpy as np
+import sqlalchemy as sa
+
+from baselayer.app.env import load_env
+from baselayer.app.models import init_db
+from baselayer.log import make_log
+from skyportal.models import DBSession, NotificationDelivery, UserNotification
+from skyportal.models.user_notification import DELIVERY_CHANNELS
+
+env, cfg = load_env()
+
+init_db(**cfg['database'])
+
+log = make_log('notification_queue')
+
+DISPATCH_INTERVAL_SECONDS = cfg['notifications.dispatch_interval_seconds']
+BATCH_SIZE = cfg['notifications.batch_size']
+MAX_ATTEMPTS = cfg['notifications.max_attempts']
+RETRY_DELAY = timedelta(seconds=cfg['notifications.retry_delay_seconds'])
+
+
+def dispatch(channel):
+    """Send a batch of pending deliveries of a channel.
+
+    The deliveries are locked (skipping those locked by another dispatcher)
+    until the batch is committed. Each delivery runs in its own savepoint.
+    Returns the number of deliveries processed."""
+
+    deliver = DELIVERY_CHANNELS[channel]
+    latencies, n_failed, n_skipped = [], 0, 0
+
+    with DBSession() as session:
+        deliveries = session.scalars(
+            sa.select(NotificationDelivery)
+            .where(
+                NotificationDelivery.channel == channel,
+                NotificationDelivery.status == 'pending',
+                NotificationDelivery.next_attempt_at <= datetime.utcnow(),
+            )
+            .order_by(NotificationDelivery.id)
+            .limit(BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if len(deliveries) == 0:
+            return 0
+
+        notification_ids = {delivery.notification_id for delivery in deliveries}
+        notifications = {
+            notification.id: notification
+            for notification in session.scalars(
+                sa.select(UserNotification).where(
+                    UserNotification.id.in_(notification_ids)
+                )
+            )
+        }
+
+        for delivery in deliveries:
+            delivery.attempts += 1
+            try:
+                # in a savepoint, so that a database error in one delivery
+                # does not roll back the status of the others in the batch
+                with session.begin_nested():
+                    sent = deliver(session, notifications[delivery.notification_id])
+            except Exception as e:
+                delivery.last_error = str(e)
+                if delivery.attempts >= MAX_ATTEMPTS:
+                    delivery.status = 'failed'
+                    log(
+                        f"Giving up {channel} notification {delivery.notification_id} "
+                        f"after {delivery.attempts} attempts: {e}"
+                    )
+                else:
+                    delivery.next_attempt_at = datetime.utcnow() + RETRY_DELAY * (
+                        2 ** (delivery.attempts - 1)
+                    )
+                n_failed += 1
+                continue
+
+            if sent:
+                delivery.status = 'sent'
+                delivery.sent_at = datetime.utcnow()
+                latencies.append(
+                    (delivery.sent_at - delivery.created_at).total_seconds()
+                )
+            else:
+                delivery.status = 'skipped'
+                n_skipped += 1
+
+        session.commit()
+
+    message = (
+        f"{channel}: {len(latencies)} sent, {n_skipped} skipped, {n_failed} failed"
+    )
+    if len(latencies) > 0:
+        message += (
+            f", latency mean {np.mean(latencies):.1f} s,"
+            f" max {np.max(latencies):.1f} s"
+        )
+    log(message)
+    return len(deliveries)
+
+
+def channel_service(channel):
+    while True:
+        try:
+            processed = dispatch(channel)
+        except Exception as e:
+            log(f"Error dispatching {channel} notifications: {e}")
+            processed = 0
+        # keep going while there is a backlog, otherwise wait
+        if processed < BATCH_SIZE:
+            time.sleep(DISPATCH_INTERVAL_SECONDS)
+
+
+def service():
+    threads = [
+        threading.Thread(target=channel_service, args=(channel,), daemon=True)
+        for channel in DELIVERY_CHANNELS
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    service()
@@ -17,6 +17,7 @@ from skyportal.handlers.api import (
     AllocationReportHandler,
     AssignmentHandler,
     CandidateHandler,
+    BulkCandidateHandler,
     CatalogQueryHandler,
     ClassificationHandler,
     ClassificationVotesHandler,
@@ -217,6 +218,7 @@ skyportal_handlers = [
         AnalysisProductsHandler,
     ),
     (r'/api/assignment(/.*)?', AssignmentHandler),
+    (r'/api/candidates/bulk', BulkCandidateHandler),
     (r'/api/candidates(/[0-9A-Za-z-_]+)/([0-9]+)', CandidateHandler),
     (r'/api/candidates(/.*)?', CandidateHandler),
     (r'/api/catalogs/swift_lsxps', SwiftLSXPSQueryHandler),
@@ -10,6 +10,7 @@ import numpy as np
 import os
 from requests import Request, Session
 from skyportal.utils import http
+from skyportal.utils.coverage import coverage, union_ranges
 import paramiko
 from paramiko import SSHClient
 from scp import SCPClient
@@ -33,37 +34,20 @@ default_filters = cfg['app.observation_plan.default_filters']
 
 def combine_healpix_tuples(input_tiles):
     """
-    Combine (adjacent?) healpix tiles, given as tuples of (lower,upper).
-    Returns a list of tuples that do not overlap.
-    """
-
-    # set upper bound to make sure this algorithm isn't crazy expensive
-    for i in range(100000):
-
-        input_tiles.sort()
-        # check each tuple against all other tuples:
-        for j1, t1 in enumerate(input_tiles):
-            for j2 in range(j1 + 1, len(input_tiles)):
-                t2 = input_tiles[j2]
-                # check if overlapping with any of the combined tiles
-                if t2[0] < t1[1] and t1[0] < t2[1]:
-                    # if overlapping, grow to the union of both tiles
-                    input_tiles[j1] = (min(t1[0], t2[0]), max(t1[1], t2[1]))
-                    input_tiles[j2] = input_tiles[j1]  # grow both tiles in the list!
-                else:
-                    # if not overlapping, no need to scan next tiles,
-                    # since they are sorted by lower bound
-                    break
-        output_tiles = list(set(input_tiles))  # remove duplicates
+    Combine healpix tiles, given as tuples of (lower,upper).
+    Returns a list of tuples that do not overlap, sorted by lower bound.
 
-        # when none of the tiles are overlapping,
-        # none will be removed by the actions of the loop
-        if len(output_tiles) == len(input_tiles):
-            return output_tiles
+    Overlapping and adjacent tiles are merged in a single pass
+    over the sorted bounds (see `skyportal.utils.coverage.union_ranges`,
+    which returns the merged bounds as arrays).
+    """
 
-        input_tiles = output_tiles
+    if len(input_tiles) == 0:
+        return []
 
-    raise RuntimeError("Too many iterations (1000) to combine_healpix_tuples!")
+    bounds = np.asarray(input_tiles, dtype=np.int64).reshape(-1, 2)
+    lower, upper = union_ranges(bounds[:, 0], bounds[:, 1])
+    return list(zip(lower.tolist(), upper.tolist()))
 
 
 def generate_observation_plan_statistics(
@@ -162,10 +146,13 @@ def generate_observation_plan_statistics(
         if stats_method == 'python':
 
             t0 = time.time()
-            localization_tiles = session.scalars(
-                sa.select(LocalizationTile)
+            localization_tiles = session.execute(
+                sa.select(
+                    LocalizationTile.healpix.lower,
+                    LocalizationTile.healpix.upper,
+                    LocalizationTile.probdensity,
+                )
                 .where(LocalizationTile.localization_id == request.localization_id)
-                .order_by(LocalizationTile.probdensity.desc())
                 .distinct()
             ).all()
             if stats_logging:
@@ -175,10 +162,13 @@ def generate_observation_plan_statistics(
                     f"{request.localization_id} retrieved in {time.time() - t0:.2f}s. ",
                 )
 
-            # get the instrument field tiles as python objects
+            # get the instrument field tiles bounds
             t0 = time.time()
-            instrument_field_tiles = session.scalars(
-                sa.select(InstrumentFieldTile)
+            instrument_field_tiles = session.execute(
+                sa.select(
+                    InstrumentFieldTile.healpix.lower,
+                    InstrumentFieldTile.healpix.upper,
+                )
                 .where(
                     InstrumentField.instrument_id == plan.instrument_id,
                     InstrumentFieldTile.instrument_field_id == InstrumentField.id,
@@ -196,47 +186,14 @@ def generate_observation_plan_statistics(
 
             # calculate the area and integrated probability directly:
             t0 = time.time()
-            intarea = 0  # total area covered by instrument field tiles
-            intprob = 0  # total probability covered by instrument field tiles
-            field_lower_bounds = np.array(
-                [f.healpix.lower for f in instrument_field_tiles]
-            )
-            field_upper_bounds = np.array(
-                [f.healpix.upper for f in instrument_field_tiles]
+            intarea, intprob = coverage(
+                np.array([f[0] for f in instrument_field_tiles], dtype=np.int64),
+                np.array([f[1] for f in instrument_field_tiles], dtype=np.int64),
+                np.array([t[0] for t in localization_tiles], dtype=np.int64),
+                np.array([t[1] for t in localization_tiles], dtype=np.int64),
+                np.array([t[2] for t in localization_tiles], dtype=float),
             )
 
-            for i, t in enumerate(localization_tiles):
-                # has True values where tile t has any overlap with one of the fields
-                overlap_array = np.logical_and(
-                    t.healpix.lower <= field_upper_bounds,
-                    t.healpix.upper >= field_lower_bounds,
-                )
-
-                # only add area/prob if there's any overlap
-                overlap = 0
-                if np.any(overlap_array):
-                    lower_upper = zip(
-                        field_lower_bounds[overlap_array],
-                        field_upper_bounds[overlap_array],
-                    )
-                    # tuples of (lower, upper) for all fields that overlap with tile t
-                    new_fields = [(l, u) for (l, u) in lower_upper]
-
-                    # combine any overlapping fields
-                    output_fields = combine_healpix_tuples(new_fields)
-
-                    # get the area of the combined fields that overlaps with tile t
-                    for lower, upper in output_fields:
-                        mx = np.minimum(t.healpix.upper, upper)
-                        mn = np.maximum(t.healpix.lower, lower)
-                        overlap += mx - mn
-
-                intarea += overlap
-                intprob += t.probdensity * overlap
-
-            intarea *= ha.constants.PIXEL_AREA
-            intprob *= ha.constants.PIXEL_AREA
-
             if stats_logging:
                 log(
                     "STATS: ",
@@ -477,10 +434,11 @@ def generate_plan(
                 end_time.mjd - event_time.mjd,
             ]
 
+            # copies, as the cached maps are read-only
             params['map_struct'] = dict(
                 zip(
                     ['prob', 'distmu', 'distsigma', 'distnorm'],
-                    request.localization.flat,
+                    [np.array(m) for m in request.localization.flat],
                 )
             )
 
@@ -6,7 +6,7 @@ from .analysis import (
     AnalysisHandler,
     AnalysisProductsHandler,
 )
-from .candidate import CandidateHandler
+from .candidate import CandidateHandler, BulkCandidateHandler
 from .classification import (
     ClassificationHandler,
     ClassificationVotesHandler,
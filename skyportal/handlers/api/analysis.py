@@ -36,7 +36,7 @@ from ...models import (
     Comment,
     ObjAnalysis,
 )
-from .photometry import serialize
+from .photometry import serialize_photometry
 
 log = make_log('app/analysis')
 
@@ -849,9 +849,7 @@ class AnalysisHandler(BaseHandler):
                     )
                     input_data = session.scalars(stmt).all()
                     if input_type == 'photometry':
-                        input_data = [
-                            serialize(phot, 'ab', 'both') for phot in input_data
-                        ]
+                        input_data = serialize_photometry(input_data, 'ab', 'both')
                         df = pd.DataFrame(input_data)[
                             associated_resource['allowed_export_columns']
                         ]
@@ -1,8 +1,8 @@
 import datetime
 from copy import copy
+import io
 import re
 import json
-import uuid
 from astropy.time import Time
 import astropy.units as u
 import operator  # noqa: F401
@@ -14,11 +14,12 @@ import time
 from tornado.ioloop import IOLoop
 
 import sqlalchemy as sa
+from sqlalchemy import event
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.sql.expression import case, func, cast
 from sqlalchemy.sql import column, Values
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
 from sqlalchemy.types import Float, Boolean, String, Integer
 from sqlalchemy.exc import IntegrityError
 from marshmallow.exceptions import ValidationError
@@ -47,22 +48,80 @@ from ...models import (
     Classification,
     Listing,
     Comment,
+    Thumbnail,
 )
-from ...utils.cache import Cache, array_to_bytes
+from ...utils.cache import Cache, SQLiteCache, array_to_bytes, query_fingerprint
+from ...utils.inserts import INSERT_CHUNK_SIZE, insert_values
 from ...utils.sizeof import sizeof, SIZE_WARNING_THRESHOLD
 
 
 _, cfg = load_env()
+
+MAX_CANDIDATES_PER_BATCH = 1000
+
 cache_dir = "cache/candidates_queries"
-cache = Cache(
-    cache_dir=cache_dir,
-    max_age=cfg["misc.minutes_to_keep_candidate_query_cache"] * 60,
-)
+if cfg.get("misc.candidate_query_cache_backend", "sqlite") == "files":
+    cache = Cache(
+        cache_dir=cache_dir,
+        max_age=cfg["misc.minutes_to_keep_candidate_query_cache"] * 60,
+    )
+else:
+    # shared by all the app processes, and invalidated
+    # when the sources/candidates of a group change
+    cache = SQLiteCache(
+        cache_file=f"{cache_dir}/queries.sqlite",
+        max_items=cfg.get("misc.max_items_in_candidate_query_cache", 1000),
+        max_age=cfg["misc.minutes_to_keep_candidate_query_cache"] * 60,
+    )
 log = make_log('api/candidate')
 
 Session = scoped_session(sessionmaker())
 
 
+def query_cache_group_tag(group_id):
+    return f"group:{group_id}"
+
+
+@event.listens_for(sa.orm.Session, "after_flush")
+def _collect_query_cache_invalidations(session, flush_context):
+    """Record the groups whose sources or candidates changed in this flush."""
+    group_ids = set()
+    filter_ids = set()
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, Source):
+            group_ids.add(instance.group_id)
+        elif isinstance(instance, Candidate):
+            filter_ids.add(instance.filter_id)
+    if filter_ids:
+        group_ids.update(
+            session.connection()
+            .execute(sa.select(Filter.group_id).where(Filter.id.in_(filter_ids)))
+            .scalars()
+        )
+    group_ids.discard(None)
+    if group_ids:
+        session.info.setdefault("query_cache_group_ids", set()).update(group_ids)
+
+
+@event.listens_for(sa.orm.Session, "after_commit")
+def _invalidate_query_cache(session):
+    group_ids = session.info.pop("query_cache_group_ids", None)
+    if group_ids:
+        # the changes are already committed: a failure here must not
+        # fail the request, the cached queries expire eventually anyway
+        try:
+            cache.invalidate([query_cache_group_tag(gid) for gid in group_ids])
+        except Exception as e:
+            log(f"Unable to invalidate cached queries of groups {group_ids}: {e}")
+
+
+@event.listens_for(sa.orm.Session, "after_soft_rollback")
+def _discard_query_cache_invalidations(session, previous_transaction):
+    # rolling back a savepoint keeps the changes flushed before it
+    if previous_transaction.parent is None:
+        session.info.pop("query_cache_group_ids", None)
+
+
 def add_linked_thumbnails_and_push_ws_msg(obj_id, user_id):
 
     if Session.registry.has():
@@ -91,6 +150,48 @@ def add_linked_thumbnails_and_push_ws_msg(obj_id, user_id):
         Session.remove()
 
 
+def add_linked_thumbnails_and_push_ws_msgs(obj_ids, user_id):
+    """Add the linked thumbnails of a batch of new Objs in a single
+    transaction, then push the refresh messages for all of them."""
+
+    if Session.registry.has():
+        session = Session()
+    else:
+        session = Session(bind=DBSession.session_factory.kw["bind"])
+
+    try:
+        user = session.query(User).get(user_id)
+        objs = session.scalars(Obj.select(user).where(Obj.id.in_(obj_ids))).all()
+        if len(objs) < len(set(obj_ids)):
+            log(
+                f"Insufficient permissions for User {user_id} to read "
+                f"{len(set(obj_ids)) - len(objs)} of the Objs"
+            )
+        for obj in objs:
+            session.add_all(
+                [
+                    Thumbnail(obj=obj, public_url=obj.sdss_url, type='sdss'),
+                    Thumbnail(obj=obj, public_url=obj.legacysurvey_dr9_url, type='ls'),
+                ]
+            )
+        session.commit()
+
+        flow = Flow()
+        for obj in objs:
+            flow.push(
+                '*', "skyportal/REFRESH_SOURCE", payload={"obj_key": obj.internal_key}
+            )
+            flow.push(
+                '*', "skyportal/REFRESH_CANDIDATE", payload={"id": obj.internal_key}
+            )
+    except Exception as e:
+        log(f"Unable to add linked thumbnails to {len(obj_ids)} Objs: {e}")
+        session.rollback()
+    finally:
+        session.close()
+        Session.remove()
+
+
 def update_redshift_history_if_relevant(request_data, obj, user):
     if "redshift" in request_data:
         if obj.redshift_history is None:
@@ -1127,6 +1228,8 @@ class CandidateHandler(BaseHandler):
                     query_id=query_id,
                     use_cache=True,
                     include_detection_stats=True,
+                    # the savedStatus filters depend on all the accessible groups
+                    cache_group_ids=set(group_ids).union(user_accessible_group_ids),
                 )
             except ValueError as e:
                 if "Page number out of range" in str(e):
@@ -1144,8 +1247,13 @@ class CandidateHandler(BaseHandler):
                 .unique()
                 .all()
             )
+            derived_columns = Obj.derived_columns(
+                [obj for obj, in query_results["candidates"]]
+            )
             candidate_list = []
-            for (obj,) in query_results["candidates"]:
+            for (obj,), obj_derived_columns in zip(
+                query_results["candidates"], derived_columns
+            ):
                 with session.no_autoflush:
                     obj.is_source = obj.id in matching_source_ids
                     if obj.is_source:
@@ -1248,13 +1356,7 @@ class CandidateHandler(BaseHandler):
                             candidate_list[-1]["last_detected_at"] = None
                     else:
                         candidate_list[-1]["last_detected_at"] = None
-                    candidate_list[-1]["gal_lat"] = obj.gal_lat_deg
-                    candidate_list[-1]["gal_lon"] = obj.gal_lon_deg
-                    candidate_list[-1]["luminosity_distance"] = obj.luminosity_distance
-                    candidate_list[-1]["dm"] = obj.dm
-                    candidate_list[-1][
-                        "angular_diameter_distance"
-                    ] = obj.angular_diameter_distance
+                    candidate_list[-1].update(obj_derived_columns)
 
             query_results["candidates"] = candidate_list
             query_results = recursive_to_dict(query_results)
@@ -1442,6 +1544,293 @@ class CandidateHandler(BaseHandler):
             return self.success()
 
 
+class BulkCandidateHandler(BaseHandler):
+    @permissions(["Upload data"])
+    def post(self):
+        """
+        ---
+        description: |
+          Create new candidates for a batch of Objs (one per filter and Obj),
+          creating the Objs that do not exist yet.
+        tags:
+          - candidates
+        requestBody:
+          content:
+            application/json:
+              schema:
+                type: object
+                properties:
+                  candidates:
+                    type: array
+                    items:
+                      allOf:
+                        - $ref: '#/components/schemas/ObjPost'
+                        - type: object
+                          properties:
+                            filter_ids:
+                              type: array
+                              items:
+                                type: integer
+                              description: List of associated filter IDs
+                            passing_alert_id:
+                              type: integer
+                              description: ID of associated filter that created candidate
+                              nullable: true
+                            passed_at:
+                              type: string
+                              description: Arrow-parseable datetime string indicating when passed filter.
+                          required:
+                            - filter_ids
+                            - passed_at
+                    description: |
+                      Candidates to create (at most 1000). Existing Objs are left
+                      unchanged.
+                required:
+                  - candidates
+        responses:
+          200:
+            content:
+              application/json:
+                schema:
+                  allOf:
+                    - $ref: '#/components/schemas/Success'
+                    - type: object
+                      properties:
+                        data:
+                          type: object
+                          properties:
+                            candidates:
+                              type: array
+                              items:
+                                type: object
+                                properties:
+                                  obj_id:
+                                    type: string
+                                  status:
+                                    type: string
+                                    enum: [success, error]
+                                  ids:
+                                    type: array
+                                    items:
+                                      type: integer
+                                    description: List of new candidate IDs
+                                  message:
+                                    type: string
+                                    description: Reason the candidate was not created
+                              description: Status of each candidate, in the order of the request
+          400:
+            content:
+              application/json:
+                schema: Error
+        """
+        data = self.get_json()
+        packets = data.get("candidates")
+        if not isinstance(packets, list) or len(packets) == 0:
+            return self.error("candidates must be a non-empty list of candidates")
+        if len(packets) > MAX_CANDIDATES_PER_BATCH:
+            return self.error(
+                f"Cannot post more than {MAX_CANDIDATES_PER_BATCH} candidates at once"
+            )
+        if not all(isinstance(packet, dict) for packet in packets):
+            return self.error("Each candidate must be an object")
+
+        user = self.associated_user_object
+        user_id = user.id
+        results = [
+            {"obj_id": packet.get("id"), "status": "success", "ids": []}
+            for packet in packets
+        ]
+
+        def item_error(i, message):
+            results[i] = {
+                "obj_id": packets[i].get("id"),
+                "status": "error",
+                "message": message,
+            }
+
+        with self.Session() as session:
+            filter_ids = {
+                filter_id
+                for packet in packets
+                if isinstance(packet.get("filter_ids"), list)
+                for filter_id in packet["filter_ids"]
+                if isinstance(filter_id, int)
+            }
+            filter_group_ids = dict(
+                session.execute(
+                    Filter.select(
+                        session.user_or_token, columns=[Filter.id, Filter.group_id]
+                    ).where(Filter.id.in_(list(filter_ids)))
+                ).all()
+            )
+
+            obj_ids = list({packet.get("id") for packet in packets} - {None})
+            existing_obj_ids = set(
+                session.scalars(sa.select(Obj.id).where(Obj.id.in_(obj_ids))).all()
+            )
+            accessible_obj_ids = set(
+                session.scalars(
+                    Obj.select(session.user_or_token, columns=[Obj.id]).where(
+                        Obj.id.in_(list(existing_obj_ids))
+                    )
+                ).all()
+            )
+
+            schema = Obj.__schema__()
+            new_objs = {}
+            candidate_rows = []
+            item_candidates = {}
+            for i, packet in enumerate(packets):
+                packet = dict(packet)
+                obj_id = packet.get("id")
+                passing_alert_id = packet.pop("passing_alert_id", None)
+                passed_at = packet.pop("passed_at", None)
+                filter_ids = packet.pop("filter_ids", None)
+
+                if passed_at is None:
+                    item_error(i, "Missing required parameter: `passed_at`.")
+                    continue
+                try:
+                    passed_at = arrow.get(passed_at).to('utc').datetime
+                except (ValueError, TypeError) as e:
+                    item_error(i, f"Invalid passed_at: {e}")
+                    continue
+                passed_at = passed_at.replace(tzinfo=None)
+
+                if not isinstance(filter_ids, list):
+                    item_error(i, "Missing required filter_ids parameter.")
+                    continue
+                filter_ids = [fid for fid in filter_ids if fid in filter_group_ids]
+                if len(filter_ids) == 0:
+                    item_error(i, "At least one valid filter ID must be provided.")
+                    continue
+
+                if obj_id in existing_obj_ids:
+                    if obj_id not in accessible_obj_ids:
+                        item_error(
+                            i,
+                            f"Failed to post candidate for object {obj_id}: "
+                            "insufficient permissions",
+                        )
+                        continue
+                elif obj_id not in new_objs:
+                    if packet.get("ra") is None:
+                        item_error(i, "RA must not be null for a new Obj")
+                        continue
+                    if packet.get("dec") is None:
+                        item_error(i, "Dec must not be null for a new Obj")
+                        continue
+                    try:
+                        obj = schema.load(packet)
+                    except ValidationError as e:
+                        item_error(
+                            i,
+                            "Invalid/missing parameters: " f"{e.normalized_messages()}",
+                        )
+                        continue
+                    update_redshift_history_if_relevant(packet, obj, user)
+                    new_objs[obj_id] = obj
+
+                item_candidates[i] = [
+                    (obj_id, filter_id, passed_at) for filter_id in filter_ids
+                ]
+                candidate_rows.extend(
+                    insert_values(
+                        Candidate.__table__,
+                        {
+                            "obj_id": obj_id,
+                            "filter_id": filter_id,
+                            "passed_at": passed_at,
+                            "passing_alert_id": passing_alert_id,
+                            "uploader_id": user_id,
+                        },
+                    )
+                    for filter_id in filter_ids
+                )
+
+            # only create Objs that have at least one valid candidate
+            candidate_obj_ids = {row["obj_id"] for row in candidate_rows}
+            objs = [obj for obj in new_objs.values() if obj.id in candidate_obj_ids]
+            new_obj_ids = []
+            inserted = {}
+            try:
+                if len(objs) > 0:
+                    healpix = ha.constants.HPX.lonlat_to_healpix(
+                        np.array([obj.ra for obj in objs], dtype=float) * u.deg,
+                        np.array([obj.dec for obj in objs], dtype=float) * u.deg,
+                    )
+                    for obj, hpx in zip(objs, healpix):
+                        obj.healpix = int(hpx)
+                    obj_rows = [
+                        insert_values(
+                            Obj.__table__,
+                            {
+                                col.key: getattr(obj, col.key)
+                                for col in Obj.__table__.columns
+                            },
+                        )
+                        for obj in objs
+                    ]
+                    for start in range(0, len(obj_rows), INSERT_CHUNK_SIZE):
+                        new_obj_ids.extend(
+                            session.scalars(
+                                pg_insert(Obj)
+                                .values(obj_rows[start : start + INSERT_CHUNK_SIZE])
+                                .on_conflict_do_nothing(index_elements=[Obj.id])
+                                .returning(Obj.id)
+                            ).all()
+                        )
+
+                for start in range(0, len(candidate_rows), INSERT_CHUNK_SIZE):
+                    for cand_id, obj_id, filter_id, passed_at in session.execute(
+                        pg_insert(Candidate)
+                        .values(candidate_rows[start : start + INSERT_CHUNK_SIZE])
+                        .on_conflict_do_nothing(
+                            index_elements=[
+                                Candidate.obj_id,
+                                Candidate.filter_id,
+                                Candidate.passed_at,
+                            ]
+                        )
+                        .returning(
+                            Candidate.id,
+                            Candidate.obj_id,
+                            Candidate.filter_id,
+                            Candidate.passed_at,
+                        )
+                    ):
+                        inserted[(obj_id, filter_id, passed_at)] = cand_id
+
+                # the bulk inserts bypass the ORM, so the query cache
+                # invalidation is recorded here
+                session.info.setdefault("query_cache_group_ids", set()).update(
+                    filter_group_ids[row["filter_id"]] for row in candidate_rows
+                )
+                session.commit()
+            except IntegrityError as e:
+                session.rollback()
+                return self.error(f"Failed to post candidates: {e.args[0]}")
+
+        for i, keys in item_candidates.items():
+            ids = [inserted[key] for key in keys if key in inserted]
+            if len(ids) == 0:
+                item_error(
+                    i,
+                    f"Failed to post candidate for object {keys[0][0]}: "
+                    "candidate already exists",
+                )
+            else:
+                results[i]["ids"] = ids
+
+        if len(new_obj_ids) > 0:
+            IOLoop.current().run_in_executor(
+                None,
+                lambda: add_linked_thumbnails_and_push_ws_msgs(new_obj_ids, user_id),
+            )
+
+        return self.success(data={"candidates": results})
+
+
 def get_obj_id_values(obj_ids):
     """Return a Postgres VALUES representation of ordered list of Obj IDs
     to be returned by the Candidates/Sources query.
@@ -1488,11 +1877,16 @@ def grab_query_results(
     query_id=None,
     use_cache=False,
     current_user=None,
+    cache_group_ids=None,
 ):
     """
     Returns a SQLAlchemy Query object (which is iterable) for the sorted Obj IDs desired.
     If there are no matching Objs, an empty list [] is returned instead.
     include_detection_stats is added to the pagination query directly here.
+    If use_cache is set, the sorted Obj IDs are cached under a fingerprint of the
+    query and the user, and reused for later pages (requested with the returned
+    queryID). The cached IDs are invalidated when the sources or candidates of any
+    of the cache_group_ids change.
     """
     # The query will return multiple rows per candidate object if it has multiple
     # annotations associated with it, with rows appearing at the end of the query
@@ -1538,14 +1932,22 @@ def grab_query_results(
 
     if page:
         if use_cache:
-            cache_filename = cache[query_id]
-            if cache_filename is not None:
-                all_ids = np.load(cache_filename)
+            # a new search (without a queryID) always refreshes the results
+            refresh = query_id is None
+            user = current_user if current_user is not None else session.user_or_token
+            fingerprint = query_fingerprint(ordered_ids, session.get_bind().dialect)
+            query_id = f"{items_name}:{user.id}:{fingerprint}"
+            cached_ids = None if refresh else cache.get(query_id)
+            if cached_ids is not None:
+                all_ids = np.load(io.BytesIO(cached_ids))
             else:
-                # Cache expired/removed/non-existent; create new cache file
-                query_id = str(uuid.uuid4())
+                # Cache expired/removed/invalidated/non-existent
                 all_ids = session.scalars(ordered_ids).unique().all()
-                cache[query_id] = array_to_bytes(all_ids)
+                cache.set(
+                    query_id,
+                    array_to_bytes(all_ids),
+                    tags=[query_cache_group_tag(gid) for gid in cache_group_ids or []],
+                )
             totalMatches = len(all_ids)
             obj_ids_in_page = all_ids[
                 ((page - 1) * n_items_per_page) : (page * n_items_per_page)
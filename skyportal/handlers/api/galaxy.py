@@ -4,23 +4,32 @@ from geojson import Point, Feature
 import sqlalchemy as sa
 from sqlalchemy import func
 from sqlalchemy.orm import sessionmaker, scoped_session
-import astropy.units as u
-from astropy.io import ascii
-import healpix_alchemy as ha
-import numpy as np
+from astropy.utils.data import download_file
 import pandas as pd
 from io import StringIO
 import time
 from baselayer.app.access import permissions, auth_or_token
+from baselayer.app.env import load_env
 from baselayer.log import make_log
 
 from ..base import BaseHandler
 from ...models import DBSession, Galaxy, Localization, LocalizationTile
-import datetime
+from ...utils.galaxy import (
+    IngestionProgress,
+    copy_galaxies,
+    file_chunks,
+    galaxies_to_csv,
+    parse_glade_chunks,
+    prepare_galaxies,
+)
 
 
 log = make_log('api/galaxy')
 
+_, cfg = load_env()
+
+progress_dir = "cache/galaxy_ingestion"
+
 Session = scoped_session(sessionmaker())
 
 MAX_GALAXIES = 10000
@@ -256,15 +265,18 @@ class GalaxyCatalogHandler(BaseHandler):
             'redshift_error',
         ]
         for key in positive_definite_parameters:
-            if any([(x is not None) and (x < 0) for x in catalog_data[key]]):
+            values = pd.to_numeric(pd.Series(catalog_data[key]), errors='coerce')
+            if (values < 0).any():
                 return self.error(f"{key} should be positive definite.")
 
         # check RA bounds
-        if any([(x < 0) or (x >= 360) for x in catalog_data['ra']]):
+        ra = pd.to_numeric(pd.Series(catalog_data['ra']), errors='coerce')
+        if ((ra < 0) | (ra >= 360)).any():
             return self.error("ra should span 0=<ra<360.")
 
         # check Declination bounds
-        if any([(x > 90) or (x < -90) for x in catalog_data['dec']]):
+        dec = pd.to_numeric(pd.Series(catalog_data['dec']), errors='coerce')
+        if ((dec > 90) | (dec < -90)).any():
             return self.error("declination should span -90<dec<90.")
 
         IOLoop.current().run_in_executor(
@@ -440,11 +452,17 @@ class GalaxyCatalogHandler(BaseHandler):
                 schema: Error
         """
 
+        from .gcn import GALAXIES_SUMMARY_TAG, summary_cache
+
         with self.Session() as session:
             session.execute(
                 sa.delete(Galaxy).where(Galaxy.catalog_name == catalog_name)
             )
             session.commit()
+            try:
+                summary_cache.invalidate([GALAXIES_SUMMARY_TAG])
+            except Exception as e:
+                log(f"Unable to invalidate cached GCN summary galaxies: {e}")
             return self.success()
 
 
@@ -456,50 +474,10 @@ def add_galaxies(catalog_name, catalog_data):
         session = Session(bind=DBSession.session_factory.kw["bind"])
 
     try:
-        galaxies = [
-            Galaxy(
-                catalog_name=catalog_name,
-                ra=ra,
-                dec=dec,
-                name=name,
-                alt_name=alt_name,
-                distmpc=distmpc,
-                distmpc_unc=distmpc_unc,
-                redshift=redshift,
-                redshift_error=redshift_error,
-                sfr_fuv=sfr_fuv,
-                mstar=mstar,
-                magk=magk,
-                magb=magb,
-                a=a,
-                b2a=b2a,
-                pa=pa,
-                btc=btc,
-                healpix=ha.constants.HPX.lonlat_to_healpix(ra * u.deg, dec * u.deg),
-            )
-            for ra, dec, name, alt_name, distmpc, distmpc_unc, redshift, redshift_error, sfr_fuv, mstar, magb, magk, a, b2a, pa, btc in zip(
-                catalog_data['ra'],
-                catalog_data['dec'],
-                catalog_data['name'],
-                catalog_data['alt_name'],
-                catalog_data['distmpc'],
-                catalog_data['distmpc_unc'],
-                catalog_data['redshift'],
-                catalog_data['redshift_error'],
-                catalog_data['sfr_fuv'],
-                catalog_data['mstar'],
-                catalog_data['magb'],
-                catalog_data['magk'],
-                catalog_data['a'],
-                catalog_data['b2a'],
-                catalog_data['pa'],
-                catalog_data['btc'],
-            )
-        ]
-
-        session.add_all(galaxies)
+        df = prepare_galaxies(pd.DataFrame(catalog_data), catalog_name)
+        n_galaxies = copy_galaxies(session, galaxies_to_csv(df))
         session.commit()
-        return log("Generated galaxy table")
+        return log(f"Generated galaxy table ({n_galaxies} galaxies)")
     except Exception as e:
         return log(f"Unable to generate galaxy table: {e}")
     finally:
@@ -580,15 +558,18 @@ class GalaxyASCIIFileHandler(BaseHandler):
             'redshift_error',
         ]
         for key in positive_definite_parameters:
-            if any([(x is not None) and (x < 0) for x in catalog_data[key]]):
+            values = pd.to_numeric(pd.Series(catalog_data[key]), errors='coerce')
+            if (values < 0).any():
                 return self.error(f"{key} should be positive definite.")
 
         # check RA bounds
-        if any([(x < 0) or (x >= 360) for x in catalog_data['ra']]):
+        ra = pd.to_numeric(pd.Series(catalog_data['ra']), errors='coerce')
+        if ((ra < 0) | (ra >= 360)).any():
             return self.error("ra should span 0=<ra<360.")
 
         # check Declination bounds
-        if any([(x > 90) or (x < -90) for x in catalog_data['dec']]):
+        dec = pd.to_numeric(pd.Series(catalog_data['dec']), errors='coerce')
+        if ((dec > 90) | (dec < -90)).any():
             return self.error("declination should span -90<dec<90.")
 
         IOLoop.current().run_in_executor(
@@ -600,49 +581,6 @@ class GalaxyASCIIFileHandler(BaseHandler):
 
 def add_glade(file_path=None, file_url=None):
 
-    column_names = [
-        'GLADE_no',
-        'PGC_no',
-        'GWGC_name',
-        'HyperLEDA_name',
-        '2MASS_name',
-        'WISExSCOS_name',
-        'SDSS-DR16Q_name',
-        'Object_type',
-        'RA',
-        'Dec',
-        'B',
-        'B_err',
-        'B_flag',
-        'B_Abs',
-        'J',
-        'J_err',
-        'H',
-        'H_err',
-        'K',
-        'K_err',
-        'W1',
-        'W1_err',
-        'W2',
-        'W2_err',
-        'W1_flag',
-        'B_J',
-        'B_J_err',
-        'z_helio',
-        'z_cmb',
-        'z_flag',
-        'v_err',
-        'z_err',
-        'd_L',
-        'd_L_err',
-        'dist',
-        'Mstar',
-        'Mstar_err',
-        'Mstar_flag',
-        'Merger_rate',
-        'Merger_rate_error',
-    ]
-
     if file_path is not None:
         datafile = file_path
     elif file_url is not None:
@@ -652,190 +590,63 @@ def add_glade(file_path=None, file_url=None):
 
     if datafile.startswith("http"):
         log(f"add_glade - Downloading {datafile}")
+        start_dl_timer = time.perf_counter()
+        # kept in the astropy cache, so that an interrupted ingestion can be
+        # resumed without downloading the catalog again
+        datafile = download_file(datafile, cache=True)
+        log(
+            f"add_glade - Downloaded {datafile} in {time.perf_counter() - start_dl_timer:0.4f} seconds"
+        )
     else:
         log(f"add_glade - Reading {datafile}")
 
-    start_dl_timer = time.perf_counter()
-    tbls = ascii.read(
-        datafile,
-        names=column_names,
-        guess=False,
-        delimiter=' ',
-        format='no_header',
-        fast_reader={'chunk_size': int(10 * 1e7), 'chunk_generator': True},  # 100 MB
-    )
-    if datafile.startswith('http'):
-        end_dl_timer = time.perf_counter()
-        print(
-            f"add_glade - Downloaded {datafile} in {end_dl_timer - start_dl_timer:0.4f} seconds"
+    chunks = file_chunks(datafile)
+    progress = IngestionProgress(progress_dir, datafile, chunks)
+    todo = [ii for ii in range(len(chunks)) if ii not in progress.done]
+    if len(progress.done) > 0:
+        log(
+            f"add_glade - Resuming: {len(progress.done)} of {len(chunks)} file parts already added"
         )
+
+    if Session.registry.has():
+        session = Session()
+    else:
+        session = Session(bind=DBSession.session_factory.kw["bind"])
+
     full_length = 0
     full_blueshift_length = 0
     start_loop_timer = time.perf_counter()
-    for ii, df in enumerate(tbls):
-
-        try:
-            start_timer = time.perf_counter()
-            df = df.to_pandas()
-            df = df.replace({'null': np.nan})
-            # df['GLADE_name'] = ['GLADE-' + str(n) for n in df['GLADE_no']]
-            # create a GLADE_name column, where names are: GLADE-<GLADE_no> with GLADE_no as a string using pandas
-            df['GLADE_name'] = 'GLADE-' + df['GLADE_no'].astype(str)
-            df.rename(
-                columns={
-                    'RA': 'ra',
-                    'Dec': 'dec',
-                    'GLADE_name': 'name',
-                    'Mstar': 'mstar',
-                    'K': 'magk',
-                    'B': 'magb',
-                    'z_helio': 'redshift',
-                    'z_err': 'redshift_error',
-                    'd_L': 'distmpc',
-                    'd_L_err': 'distmpc_unc',
-                },
-                inplace=True,
-            )
-
-            float_columns = [
-                'ra',
-                'dec',
-                'mstar',
-                'magk',
-                'magb',
-                'redshift',
-                'redshift_error',
-                'distmpc',
-                'distmpc_unc',
-            ]
-            for col in float_columns:
-                df[col] = df[col].astype(float)
-
-            drop_columns = list(
-                set(df.columns.values)
-                - {
-                    'ra',
-                    'dec',
-                    'name',
-                    'mstar',
-                    'magk',
-                    'magb',
-                    'redshift',
-                    'redshift_error',
-                    'distmpc',
-                    'distmpc_unc',
-                }
-            )
+    try:
+        results = parse_glade_chunks(
+            datafile,
+            [chunks[ii] for ii in todo],
+            max_processes=cfg['misc.max_galaxy_ingestion_processes'],
+        )
+        for ii, (csv, blueshift_length) in zip(todo, results):
+            try:
+                start_timer = time.perf_counter()
+                length = copy_galaxies(session, csv)
+                session.commit()
+                progress.add(ii)
+                full_length += length
+                full_blueshift_length += blueshift_length
+                log(
+                    f"add_glade - File part {ii}: Added {length} galaxies (including {blueshift_length} with a negative redshift) in {time.perf_counter() - start_timer:0.4f} seconds"
+                )
+            except Exception as e:
+                session.rollback()
+                log(f"add_glade - File part {ii}: Error: {e}")
+                continue
+    finally:
+        session.close()
+        Session.remove()
 
-            df.drop(
-                columns=drop_columns,
-                inplace=True,
-            )
-            df = df.replace({np.nan: None})
-            positive_definite_parameters = [
-                'distmpc',
-                'distmpc_unc',
-                'redshift_error',
-            ]
-            # remove rows where any of the positive definite parameters are negative using pandas
-            for key in positive_definite_parameters:
-                df = df.drop(df.index[df[key] < 0])
-            # if ra, dec or name are missing, remove the row
-            required_columns = ['ra', 'dec', 'name']
-            df = df[df[required_columns].notnull().all(axis=1)]
-
-            # fill in any missing optional parameters
-            optional_parameters = [
-                'alt_name',
-                'distmpc',
-                'distmpc_unc',
-                'redshift',
-                'redshift_error',
-                'sfr_fuv',
-                'mstar',
-                'magk',
-                'magb',
-                'a',
-                'b2a',
-                'pa',
-                'btc',
-            ]
-
-            # for the optional parameters, if a row is missing a value, fill it in with None
-            for key in optional_parameters:
-                if key not in df.columns.values:
-                    df[key] = None
-            # remove rows with incorrect ra or dec
-            df = df[(df['ra'] >= 0) & (df['ra'] < 360)]
-            df = df[(df['dec'] >= -90) & (df['dec'] <= 90)]
-
-            # add a healpix column where healpix = ha.constants.HPX.lonlat_to_healpix(ra * u.deg, dec * u.deg)
-            df['healpix'] = [
-                ha.constants.HPX.lonlat_to_healpix(ra * u.deg, dec * u.deg)
-                for ra, dec in zip(df['ra'], df['dec'])
-            ]
-            # add a catalog_name column where catalog_name = 'GLADE'
-            df['catalog_name'] = 'GLADE'
-            utcnow = datetime.datetime.utcnow().isoformat()
-            df['created_at'] = utcnow
-            df['modified_at'] = utcnow
-            blueshift_length = len(df[(df['redshift'] < 0)])
-            length = len(df)
-            full_length += length
-            full_blueshift_length += blueshift_length
-            columns = (
-                "ra",
-                "dec",
-                "magb",
-                "magk",
-                "redshift",
-                "redshift_error",
-                "distmpc",
-                "distmpc_unc",
-                "mstar",
-                "name",
-                "alt_name",
-                "sfr_fuv",
-                "a",
-                "b2a",
-                "pa",
-                "btc",
-                "healpix",
-                "catalog_name",
-                'created_at',
-                'modified',
-            )
-            output = StringIO()
-            df.replace("NaN", "null", inplace=True)
-            df.replace(np.nan, "NaN", inplace=True)
-            df.to_csv(
-                output,
-                index=False,
-                sep='\t',
-                header=False,
-                encoding='utf8',
-                quotechar="'",
-            )
-            output.seek(0)
-            connection = DBSession().connection().connection
-            cursor = connection.cursor()
-            cursor.copy_from(
-                output,
-                "galaxys",
-                sep='\t',
-                null='',
-                columns=columns,
-            )
-            cursor.close()
-            output.close()
-            DBSession().commit()
-            end_timer = time.perf_counter()
-            log(
-                f"add_glade - File part {ii}: Added {length} galaxies (including {blueshift_length} with a negative redshift) in {end_timer - start_timer:0.4f} seconds"
-            )
-        except Exception as e:
-            log(f"add_glade - File part {ii}: Error: {e}")
-            continue
+    if len(progress.done) == len(chunks):
+        progress.clear()
+    else:
+        log(
+            f"add_glade - {len(chunks) - len(progress.done)} file parts could not be added, run the ingestion again to retry them"
+        )
     log(
         f"add_glade - Added a total of {full_length} galaxies (including {full_blueshift_length} with a negative redshift) to the database in {time.perf_counter() - start_loop_timer:0.4f} seconds"
     )
@@ -881,6 +692,7 @@ class GalaxyGladeHandler(BaseHandler):
 
         try:
             file_name = None
+            file_path = None
             file_url = None
             data = self.get_json()
             if 'file_name' in data:
@@ -894,7 +706,6 @@ class GalaxyGladeHandler(BaseHandler):
                 )
                 if not os.path.isfile(file_path):
                     return self.error("File does not exist.")
-                file_url = file_path
             elif 'file_url' in data:
                 file_url = data['file_url']
                 if not file_url.endswith('.txt'):
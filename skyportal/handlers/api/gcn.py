@@ -5,17 +5,16 @@ import ast
 from astropy.time import Time
 from astropy.table import Table
 import binascii
-import healpy as hp
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
 import io
+import json
 import os
 import gcn
-import ligo.skymap.bayestar as ligo_bayestar
-import ligo.skymap.io
-import ligo.skymap.postprocess
 import lxml
 import xmlschema
 from urllib.parse import urlparse
-import tempfile
 from tornado.ioloop import IOLoop
 import arrow
 import astropy
@@ -39,6 +38,9 @@ import pandas as pd
 from tabulate import tabulate
 import datetime
 from ...utils.UTCTZnaiveDateTime import UTCTZnaiveDateTime
+from ...utils.cache import SQLiteCache
+from ...utils.moc import product, to_fits
+from ...utils.tiles import copy_tiles, uniq_to_ranges
 
 from baselayer.app.access import auth_or_token
 from baselayer.log import make_log
@@ -57,6 +59,8 @@ from ...models import (
     CatalogQuery,
     DefaultObservationPlanRequest,
     EventObservationPlan,
+    ExecutedObservation,
+    Galaxy,
     GcnEvent,
     GcnNotice,
     GcnProperty,
@@ -70,7 +74,9 @@ from ...models import (
     LocalizationTile,
     LocalizationTag,
     MMADetector,
+    Obj,
     ObservationPlanRequest,
+    Source,
     User,
     Group,
     UserNotification,
@@ -99,30 +105,64 @@ Session = scoped_session(sessionmaker())
 
 MAX_GCNEVENTS = 1000
 
+# sections of GCN summaries, shared by all the app processes
+summary_cache = SQLiteCache(
+    cache_file="cache/gcn_summaries/sections.sqlite",
+    max_items=cfg.get("misc.max_items_in_gcn_summary_cache", 1000),
+    max_age=cfg["misc.minutes_to_keep_gcn_summary_cache"] * 60,
+)
+# tag of the cached galaxies sections, invalidated when a catalog is deleted
+GALAXIES_SUMMARY_TAG = "galaxies"
 
-def post_gcnevent_from_xml(payload, user_id, session):
-    """Post GcnEvent to database from voevent xml.
+
+VOEVENT_SCHEMA = f'{os.path.dirname(__file__)}/../../utils/schema/VOEvent-v2.0.xsd'
+
+
+@functools.lru_cache(maxsize=None)
+def get_voevent_schema():
+    """The VOEvent schema validator.
+    Compiling the schema takes much longer than
+    validating a notice, so it is done once per process.
+    """
+    return xmlschema.XMLSchema(VOEVENT_SCHEMA)
+
+
+def parse_voevent(payload):
+    """Parse a VOEvent, without validating it against the schema.
+    payload: str or bytes
+        VOEvent readable string
+    Returns the root element of the VOEvent.
+    """
+    try:
+        payload = payload.encode('ascii')
+    except AttributeError:
+        pass
+    try:
+        return lxml.etree.fromstring(payload)
+    except lxml.etree.XMLSyntaxError:
+        raise ValueError("xml file is not valid VOEvent")
+
+
+def post_gcnnotice_from_xml(payload, user_id, session, root=None):
+    """Post GcnNotice (and its GcnEvent) to database from voevent xml,
+    without its skymap (see post_skymap_from_notice).
+    Notices whose ivorn is already in the database are rejected
+    before validating them against the VOEvent schema.
     payload: str
         VOEvent readable string
     user_id : int
-        SkyPortal ID of User posting the GcnEvent
+        SkyPortal ID of User posting the GcnNotice
     session: sqlalchemy.Session
         Database session for this transaction
+    root: lxml.etree.Element, optional
+        Root element of the VOEvent, if it was already parsed
+    Returns the GcnNotice, committed to the database.
     """
 
     user = session.query(User).get(user_id)
 
-    schema = f'{os.path.dirname(__file__)}/../../utils/schema/VOEvent-v2.0.xsd'
-    voevent_schema = xmlschema.XMLSchema(schema)
-    if voevent_schema.is_valid(payload):
-        # check if is string
-        try:
-            payload = payload.encode('ascii')
-        except AttributeError:
-            pass
-        root = lxml.etree.fromstring(payload)
-    else:
-        raise ValueError("xml file is not valid VOEvent")
+    if root is None:
+        root = parse_voevent(payload)
 
     gcn_notice = session.scalars(
         GcnNotice.select(user).where(GcnNotice.ivorn == root.attrib['ivorn'])
@@ -130,6 +170,14 @@ def post_gcnevent_from_xml(payload, user_id, session):
     if gcn_notice is not None:
         raise ValueError(f"GcnNotice with ivorn {root.attrib['ivorn']} already exists.")
 
+    if not get_voevent_schema().is_valid(payload):
+        raise ValueError("xml file is not valid VOEvent")
+    # check if is string
+    try:
+        payload = payload.encode('ascii')
+    except AttributeError:
+        pass
+
     dateobs = get_dateobs(root)
     trigger_id = get_trigger(root)
 
@@ -189,11 +237,42 @@ def post_gcnevent_from_xml(payload, user_id, session):
     event.detectors = detectors
     session.commit()
 
+    return gcn_notice
+
+
+def post_skymap_from_notice(gcn_notice_id, user_id, session, asynchronous=True):
+    """Fetch the skymap of a GcnNotice, if it has one, and post
+    it as a Localization of the notice's GcnEvent.
+    gcn_notice_id : int
+        SkyPortal ID of the GcnNotice
+    user_id : int
+        SkyPortal ID of User posting the Localization
+    session: sqlalchemy.Session
+        Database session for this transaction
+    asynchronous : bool
+        Whether to generate the tiles, properties and contour of
+        a new Localization in the background (True, the default),
+        or before returning (False).
+    Returns the ID of the Localization, or None if there is no skymap.
+    """
+
+    user = session.query(User).get(user_id)
+
+    gcn_notice = session.scalars(
+        GcnNotice.select(user).where(GcnNotice.id == gcn_notice_id)
+    ).first()
+    if gcn_notice is None:
+        raise ValueError(f"No GcnNotice with ID {gcn_notice_id}.")
+
+    root = lxml.etree.fromstring(gcn_notice.content)
+    dateobs = get_dateobs(root)
+    tags = list(get_tags(root))
+
     skymap = get_skymap(root, gcn_notice)
     if skymap is None:
-        return event.id
+        return None
 
-    skymap["dateobs"] = event.dateobs
+    skymap["dateobs"] = gcn_notice.dateobs
     skymap["sent_by_id"] = user.id
 
     try:
@@ -206,7 +285,7 @@ def post_gcnevent_from_xml(payload, user_id, session):
                     'ra': ra,
                     'dec': dec,
                 }
-            elif any([True if 'GRB' in tag.text.upper() else False for tag in tags]):
+            elif any([True if 'GRB' in tag.upper() else False for tag in tags]):
                 dateobs_txt = Time(dateobs).isot
                 source_name = f"GRB{dateobs_txt[2:4]}{dateobs_txt[5:7]}{dateobs_txt[8:10]}.{dateobs_txt[11:13]}{dateobs_txt[14:16]}{dateobs_txt[17:19]}"
                 source = {
@@ -214,7 +293,7 @@ def post_gcnevent_from_xml(payload, user_id, session):
                     'ra': ra,
                     'dec': dec,
                 }
-            elif any([True if 'GW' in tag.text.upper() else False for tag in tags]):
+            elif any([True if 'GW' in tag.upper() else False for tag in tags]):
                 dateobs_txt = Time(dateobs).isot
                 source_name = f"GW{dateobs_txt[2:4]}{dateobs_txt[5:7]}{dateobs_txt[8:10]}.{dateobs_txt[11:13]}{dateobs_txt[14:16]}{dateobs_txt[17:19]}"
                 source = {
@@ -224,7 +303,7 @@ def post_gcnevent_from_xml(payload, user_id, session):
                 }
             else:
                 source = {
-                    'id': Time(event.dateobs).isot.replace(":", "-"),
+                    'id': Time(gcn_notice.dateobs).isot.replace(":", "-"),
                     'ra': ra,
                     'dec': dec,
                 }
@@ -242,18 +321,40 @@ def post_gcnevent_from_xml(payload, user_id, session):
         localization = Localization(**skymap)
         session.add(localization)
         session.commit()
+        localization_id = localization.id
 
-        log(f"Generating tiles/properties/contours for localization {localization.id}")
+        log(f"Generating tiles/properties/contours for localization {localization_id}")
 
-        IOLoop.current().run_in_executor(
-            None,
-            lambda: add_tiles_and_properties_and_observation_plans(
-                localization.id, user_id
-            ),
-        )
-        IOLoop.current().run_in_executor(None, lambda: add_contour(localization.id))
+        if asynchronous:
+            IOLoop.current().run_in_executor(
+                None,
+                lambda: add_tiles_and_properties_and_observation_plans(
+                    localization_id, user_id
+                ),
+            )
+            IOLoop.current().run_in_executor(None, lambda: add_contour(localization_id))
+        else:
+            add_tiles_and_properties_and_observation_plans(localization_id, user_id)
+            add_contour(localization_id)
 
-    return event.id
+    return localization.id
+
+
+def post_gcnevent_from_xml(payload, user_id, session):
+    """Post GcnEvent to database from voevent xml.
+    payload: str
+        VOEvent readable string
+    user_id : int
+        SkyPortal ID of User posting the GcnEvent
+    session: sqlalchemy.Session
+        Database session for this transaction
+    """
+    gcn_notice = post_gcnnotice_from_xml(payload, user_id, session)
+    event_id = session.scalar(
+        sa.select(GcnEvent.id).where(GcnEvent.dateobs == gcn_notice.dateobs)
+    )
+    post_skymap_from_notice(gcn_notice.id, user_id, session)
+    return event_id
 
 
 def post_gcnevent_from_dictionary(payload, user_id, session):
@@ -1165,15 +1266,16 @@ def add_tiles_and_properties_and_observation_plans(localization_id, user_id):
         ]
         session.add_all(tags)
 
-        tiles = [
-            LocalizationTile(
-                localization_id=localization.id, healpix=uniq, probdensity=probdensity
-            )
-            for uniq, probdensity in zip(localization.uniq, localization.probdensity)
-        ]
-
         session.add(localization)
-        session.add_all(tiles)
+        lower, upper = uniq_to_ranges(localization.uniq)
+        copy_tiles(
+            session,
+            LocalizationTile,
+            lower,
+            upper,
+            localization_id=localization.id,
+            probdensity=localization.probdensity,
+        )
         session.commit()
 
         config_gcn_observation_plans_all = [
@@ -1507,6 +1609,518 @@ class LocalizationTagsHandler(BaseHandler):
             return self.success(data=tags)
 
 
+def summary_section_session():
+    if Session.registry.has():
+        return Session()
+    return Session(bind=DBSession.session_factory.kw["bind"])
+
+
+def cached_summary_section(session, name, params, fingerprint, compute, tags=()):
+    """Return the result of `compute()`, cached for the given parameters as
+    long as the fingerprint queries of its inputs return the same values
+    (and no entry with one of its tags is invalidated).
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.Session
+        Database session.
+    name : str
+        Name of the section.
+    params : dict
+        Parameters of the section (JSON-serializable).
+    fingerprint : list of sqlalchemy.sql.Select
+        Cheap aggregate queries (e.g., count and latest modification)
+        over the data used by the section.
+    compute : callable
+        Computes the section, returning a JSON-serializable result.
+    tags : list of str, optional
+        Tags of the cached result, see `SQLiteCache.invalidate`.
+    """
+    values = [[str(v) for v in session.execute(stmt).first()] for stmt in fingerprint]
+    m = hashlib.sha256()
+    m.update(json.dumps([params, values], sort_keys=True, default=str).encode('utf-8'))
+    key = f'{name}:{m.hexdigest()}'
+
+    data = summary_cache.get(key)
+    if data is not None:
+        return json.loads(data)
+    result = compute()
+    summary_cache.set(key, json.dumps(result, default=str).encode("utf-8"), tags=tags)
+    return result
+
+
+def localizations_fingerprint(dateobs):
+    return sa.select(
+        sa.func.count(Localization.id), sa.func.max(Localization.modified)
+    ).where(Localization.dateobs == dateobs)
+
+
+def gcn_summary_sources(
+    user_id,
+    dateobs,
+    start_date,
+    end_date,
+    localization_name,
+    localization_cumprob,
+    number_of_detections,
+    no_text,
+    photometry_in_window,
+):
+    """Sources section of a GCN summary: the sources in the localization
+    within the date range, and their photometry."""
+
+    session = summary_section_session()
+    try:
+        user = session.query(User).get(user_id)
+        session.user_or_token = user
+
+        start_date_mjd = Time(arrow.get(start_date).datetime).mjd
+        end_date_mjd = Time(arrow.get(end_date).datetime).mjd
+
+        def query_sources():
+            sources = []
+            source_page_number = 1
+            loop = asyncio.new_event_loop()
+            try:
+                while True:
+                    # get the sources in the event
+                    sources_data = loop.run_until_complete(
+                        get_sources(
+                            user_id=user.id,
+                            session=session,
+                            first_detected_date=start_date,
+                            last_detected_date=end_date,
+                            localization_dateobs=dateobs,
+                            localization_name=localization_name,
+                            localization_cumprob=localization_cumprob,
+                            number_of_detections=number_of_detections,
+                            page_number=source_page_number,
+                            num_per_page=MAX_SOURCES_PER_PAGE,
+                        )
+                    )
+                    sources.extend(
+                        {
+                            key: source.get(key)
+                            for key in [
+                                'id',
+                                'alias',
+                                'ra',
+                                'dec',
+                                'redshift',
+                                'redshift_error',
+                            ]
+                        }
+                        for source in sources_data['sources']
+                    )
+                    source_page_number += 1
+
+                    if len(sources_data['sources']) < MAX_SOURCES_PER_PAGE:
+                        break
+            finally:
+                loop.close()
+            return sources
+
+        # the sources are those detected in the date range, so new or
+        # modified photometry in the range (or saved sources) changes them;
+        # the fingerprints only look at the objects with photometry in the
+        # range, through the index on Photometry.mjd
+        objs_in_window = sa.select(Photometry.obj_id).where(
+            Photometry.mjd >= start_date_mjd,
+            Photometry.mjd <= end_date_mjd,
+        )
+        sources = cached_summary_section(
+            session,
+            'sources',
+            {
+                'user_id': user_id,
+                'group_ids': sorted(g.id for g in user.accessible_groups),
+                'dateobs': dateobs,
+                'start_date': start_date,
+                'end_date': end_date,
+                'localization_name': localization_name,
+                'localization_cumprob': localization_cumprob,
+                'number_of_detections': number_of_detections,
+            },
+            [
+                localizations_fingerprint(dateobs),
+                sa.select(
+                    sa.func.count(Photometry.id), sa.func.max(Photometry.modified)
+                ).where(
+                    Photometry.mjd >= start_date_mjd,
+                    Photometry.mjd <= end_date_mjd,
+                ),
+                sa.select(sa.func.count(Source.id), sa.func.max(Source.modified)).where(
+                    Source.obj_id.in_(objs_in_window)
+                ),
+                sa.select(sa.func.max(Obj.modified)).where(Obj.id.in_(objs_in_window)),
+            ],
+            query_sources,
+        )
+
+        sources_text = []
+        if len(sources) > 0:
+            sources_text.append(
+                f"\nFound {len(sources)} {'sources' if len(sources) > 1 else 'source'} in the event's localization, given the specified date range:\n"
+            ) if not no_text else None
+            ids, aliases, ras, decs, redshifts = (
+                [],
+                [],
+                [],
+                [],
+                [],
+            )
+            for source in sources:
+                ids.append(source['id'])
+                aliases.append(source['alias'])
+                ras.append(source['ra'])
+                decs.append(source['dec'])
+                redshift = source['redshift']
+                if redshift is not None and source['redshift_error'] is not None:
+                    redshift = f"{redshift}±{source['redshift_error']}"
+                redshifts.append(redshift)
+            df = pd.DataFrame(
+                {
+                    "id": ids,
+                    "alias": aliases,
+                    "ra": ras,
+                    "dec": decs,
+                    "redshift": redshifts,
+                }
+            )
+            sources_text.append(
+                tabulate(df, headers='keys', tablefmt='psql', showindex=False) + "\n"
+            )
+
+            # now, create a photometry table per source, from a single query
+            stmt = Photometry.select(user).where(Photometry.obj_id.in_(ids))
+            if photometry_in_window:
+                stmt = stmt.where(
+                    Photometry.mjd >= start_date_mjd,
+                    Photometry.mjd <= end_date_mjd,
+                )
+            photometry_by_source = {}
+            for phot in session.scalars(stmt).all():
+                photometry_by_source.setdefault(phot.obj_id, []).append(phot)
+
+            for source in sources:
+                photometry = photometry_by_source.get(source['id'], [])
+                if len(photometry) > 0:
+                    sources_text.append(
+                        f"""\nPhotometry for source {source['id']}:\n"""
+                    ) if not no_text else None
+                    mjds, mags, filters, origins, instruments = (
+                        [],
+                        [],
+                        [],
+                        [],
+                        [],
+                    )
+                    for phot in photometry:
+                        phot = serialize(phot, 'ab', 'mag')
+                        mjds.append(phot['mjd'] if 'mjd' in phot else None)
+                        if (
+                            'mag' in phot
+                            and 'magerr' in phot
+                            and phot['mag'] is not None
+                            and phot['magerr'] is not None
+                        ):
+                            mags.append(
+                                f"{np.round(phot['mag'],2)}±{np.round(phot['magerr'],2)}"
+                            )
+                        elif (
+                            'limiting_mag' in phot and phot['limiting_mag'] is not None
+                        ):
+                            mags.append(f"< {np.round(phot['limiting_mag'], 1)}")
+                        else:
+                            mags.append(None)
+                        filters.append(phot['filter'] if 'filter' in phot else None)
+                        origins.append(phot['origin'] if 'origin' in phot else None)
+                        instruments.append(
+                            phot['instrument_name']
+                            if 'instrument_name' in phot
+                            else None
+                        )
+                    df_phot = pd.DataFrame(
+                        {
+                            "mjd": mjds,
+                            "mag±err (ab)": mags,
+                            "filter": filters,
+                            "origin": origins,
+                            "instrument": instruments,
+                        }
+                    )
+                    if no_text:
+                        df_phot.insert(
+                            loc=0,
+                            column='obj_id',
+                            value=[p["obj_id"] for p in photometry],
+                        )
+                    sources_text.append(
+                        tabulate(
+                            df_phot,
+                            headers='keys',
+                            tablefmt='psql',
+                            showindex=False,
+                            floatfmt=".5f",
+                        )
+                        + "\n"
+                    )
+        return sources_text
+    finally:
+        session.close()
+        Session.remove()
+
+
+def gcn_summary_galaxies(
+    user_id, dateobs, localization_name, localization_cumprob, no_text
+):
+    """Galaxies section of a GCN summary: the galaxies in the localization."""
+
+    session = summary_section_session()
+    try:
+        user = session.query(User).get(user_id)
+        session.user_or_token = user
+
+        def galaxies_text():
+            galaxies_text = []
+            galaxies_page_number = 1
+            galaxies = []
+            # get the galaxies in the event
+            while True:
+                galaxies_data = get_galaxies(
+                    session,
+                    localization_dateobs=dateobs,
+                    localization_name=localization_name,
+                    localization_cumprob=localization_cumprob,
+                    page_number=galaxies_page_number,
+                    num_per_page=MAX_GALAXIES,
+                )
+                galaxies.extend(galaxies_data['galaxies'])
+                galaxies_page_number += 1
+                if len(galaxies_data['galaxies']) < MAX_GALAXIES:
+                    break
+            if len(galaxies) > 0:
+                galaxies_text.append(
+                    f"""\nFound {len(galaxies)} {'galaxies' if len(galaxies) > 1 else 'galaxy'} in the event's localization:\n"""
+                ) if not no_text else None
+                catalogs, names, ras, decs, distmpcs, redshifts = (
+                    [],
+                    [],
+                    [],
+                    [],
+                    [],
+                    [],
+                )
+                for galaxy in galaxies:
+                    galaxy = galaxy.to_dict()
+                    catalogs.append(
+                        galaxy['catalog_name'] if 'catalog_name' in galaxy else None
+                    )
+                    names.append(galaxy['name'] if 'name' in galaxy else None)
+                    ras.append(galaxy['ra'] if 'ra' in galaxy else None)
+                    decs.append(galaxy['dec'] if 'dec' in galaxy else None)
+                    distmpcs.append(galaxy['distmpc'] if 'distmpc' in galaxy else None)
+                    redshifts.append(
+                        galaxy['redshift'] if 'redshift' in galaxy else None
+                    )
+                df = pd.DataFrame(
+                    {
+                        "catalog": catalogs,
+                        "name": names,
+                        "ra": ras,
+                        "dec": decs,
+                        "distmpc": distmpcs,
+                        "redshift": redshifts,
+                    }
+                )
+                galaxies_text.append(
+                    tabulate(df, headers='keys', tablefmt='psql', showindex=False)
+                    + "\n"
+                )
+            return galaxies_text
+
+        return cached_summary_section(
+            session,
+            'galaxies',
+            {
+                'user_id': user_id,
+                'dateobs': dateobs,
+                'localization_name': localization_name,
+                'localization_cumprob': localization_cumprob,
+                'no_text': no_text,
+            },
+            [
+                localizations_fingerprint(dateobs),
+                # new galaxies get higher IDs (a lookup in the primary key
+                # index, rather than a scan of the catalogs); deleting a
+                # catalog invalidates the GALAXIES_SUMMARY_TAG entries
+                sa.select(sa.func.max(Galaxy.id)),
+            ],
+            galaxies_text,
+            tags=[GALAXIES_SUMMARY_TAG],
+        )
+    finally:
+        session.close()
+        Session.remove()
+
+
+def gcn_summary_observations(
+    user_id,
+    instrument_id,
+    dateobs,
+    start_date,
+    end_date,
+    localization_name,
+    localization_cumprob,
+    no_text,
+):
+    """Observations section of a GCN summary for one instrument: the
+    executed observations in the date range, and their coverage of the
+    localization."""
+
+    session = summary_section_session()
+    try:
+        user = session.query(User).get(user_id)
+        session.user_or_token = user
+
+        instrument = session.scalars(
+            Instrument.select(user)
+            .where(Instrument.id == instrument_id)
+            .options(joinedload(Instrument.telescope))
+        ).first()
+        event = session.query(GcnEvent).filter(GcnEvent.dateobs == dateobs).first()
+        start_date = arrow.get(start_date).datetime
+        end_date = arrow.get(end_date).datetime
+
+        def observations_text():
+            observations_text = []
+            data = get_observations(
+                session,
+                start_date,
+                end_date,
+                telescope_name=instrument.telescope.name,
+                instrument_name=instrument.name,
+                localization_dateobs=dateobs,
+                localization_name=localization_name,
+                localization_cumprob=localization_cumprob,
+                return_statistics=True,
+            )
+
+            observations = data["observations"]
+            num_observations = len(observations)
+            if num_observations > 0:
+                start_observation = astropy.time.Time(
+                    min(obs["obstime"] for obs in observations),
+                    format='datetime',
+                )
+                unique_filters = list({obs["filt"] for obs in observations})
+                total_time = sum(obs["exposure_time"] for obs in observations)
+                probability = data["probability"]
+                area = data["area"]
+
+                dt = start_observation.datetime - event.dateobs
+                before_after = "after" if dt.total_seconds() > 0 else "before"
+                observations_text.append(
+                    f"""\n\n{instrument.telescope.name} - {instrument.name}:\n\nWe observed the localization region of {event.gcn_notices[0].stream} trigger {astropy.time.Time(event.dateobs, format='datetime').isot} UTC.  We obtained a total of {num_observations} images covering {",".join(unique_filters)} bands for a total of {total_time} seconds. The observations covered {area:.1f} square degrees beginning at {start_observation.isot} ({humanize.naturaldelta(dt)} {before_after} the burst trigger time) corresponding to ~{int(100 * probability)}% of the probability enclosed in the localization region.\nThe table below shows the photometry for each observation.\n"""
+                ) if not no_text else None
+                t0s, mjds, ras, decs, filters, exposures, limmags = (
+                    [],
+                    [],
+                    [],
+                    [],
+                    [],
+                    [],
+                    [],
+                )
+                for obs in observations:
+                    t0s.append(
+                        (obs["obstime"] - event.dateobs) / datetime.timedelta(hours=1)
+                        if "obstime" in obs
+                        else None
+                    )
+                    mjds.append(
+                        astropy.time.Time(obs["obstime"], format='datetime').mjd
+                        if "obstime" in obs
+                        else None
+                    )
+                    ras.append(obs['field']["ra"] if "ra" in obs['field'] else None)
+                    decs.append(obs['field']["dec"] if "dec" in obs['field'] else None)
+                    filters.append(obs["filt"] if "filt" in obs else None)
+                    exposures.append(
+                        obs["exposure_time"] if "exposure_time" in obs else None
+                    )
+                    limmags.append(obs["limmag"] if "limmag" in obs else None)
+                df_obs = pd.DataFrame(
+                    {
+                        "T-T0 (hr)": t0s,
+                        "mjd": mjds,
+                        "ra": ras,
+                        "dec": decs,
+                        "filter": filters,
+                        "exposure": exposures,
+                        "limmag (ab)": limmags,
+                    }
+                )
+                if no_text:
+                    df_obs.insert(
+                        loc=0,
+                        column="tel/inst",
+                        value=[
+                            f"{instrument.telescope.name}/{instrument.name}"
+                            for obs in observations
+                        ],
+                    )
+                observations_text.append(
+                    tabulate(
+                        df_obs,
+                        headers='keys',
+                        tablefmt='psql',
+                        showindex=False,
+                        floatfmt=(
+                            ".2f",
+                            ".5f",
+                            ".5f",
+                            ".5f",
+                            "%s",
+                            "%d",
+                            ".2f",
+                        ),
+                    )
+                    + "\n"
+                )
+            return observations_text
+
+        return cached_summary_section(
+            session,
+            'observations',
+            {
+                'user_id': user_id,
+                'instrument_id': instrument_id,
+                'dateobs': dateobs,
+                'start_date': start_date,
+                'end_date': end_date,
+                'localization_name': localization_name,
+                'localization_cumprob': localization_cumprob,
+                'no_text': no_text,
+            },
+            [
+                localizations_fingerprint(dateobs),
+                sa.select(
+                    sa.func.count(ExecutedObservation.id),
+                    sa.func.max(ExecutedObservation.modified),
+                ).where(
+                    ExecutedObservation.instrument_id == instrument_id,
+                    ExecutedObservation.obstime >= start_date,
+                    ExecutedObservation.obstime <= end_date,
+                ),
+            ],
+            observations_text,
+        )
+    finally:
+        session.close()
+        Session.remove()
+
+
 def add_gcn_summary(
     summary_id,
     user_id,
@@ -1527,6 +2141,9 @@ def add_gcn_summary(
     no_text,
     photometry_in_window,
 ):
+    """Generate the text of a GCN summary. The sources, galaxies and
+    per-instrument observations sections are computed concurrently, and
+    the text of the summary is updated as each of them completes."""
 
     if Session.registry.has():
         session = Session()
@@ -1541,12 +2158,8 @@ def add_gcn_summary(
         group = session.query(Group).get(group_id)
         event = session.query(GcnEvent).filter(GcnEvent.dateobs == dateobs).first()
 
-        start_date_mjd = Time(arrow.get(start_date).datetime).mjd
-        end_date_mjd = Time(arrow.get(end_date).datetime).mjd
-
-        contents = []
+        header_text = []
         if not no_text:
-            header_text = []
             header_text.append(f"""TITLE: {title.upper()}\n""")
             if number is not None:
                 header_text.append(f"""NUMBER: {number}\n""")
@@ -1602,318 +2215,86 @@ def add_gcn_summary(
                 header_text.append(f"""\n{users_txt}\n""")
 
             header_text.append(f"""\non behalf of the {group.name}, report:\n""")
-            contents.extend(header_text)
-
-        if show_sources:
-            sources_text = []
-            source_page_number = 1
-            sources = []
-            while True:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                # get the sources in the event
-                coroutine = get_sources(
-                    user_id=user.id,
-                    session=session,
-                    first_detected_date=start_date,
-                    last_detected_date=end_date,
-                    localization_dateobs=dateobs,
-                    localization_name=localization_name,
-                    localization_cumprob=localization_cumprob,
-                    number_of_detections=number_of_detections,
-                    page_number=source_page_number,
-                    num_per_page=MAX_SOURCES_PER_PAGE,
-                )
-                sources_data = loop.run_until_complete(coroutine)
-                sources.extend(sources_data['sources'])
-                source_page_number += 1
 
-                if len(sources_data['sources']) < MAX_SOURCES_PER_PAGE:
-                    break
-            if len(sources) > 0:
-                sources_text.append(
-                    f"\nFound {len(sources)} {'sources' if len(sources) > 1 else 'source'} in the event's localization, given the specified date range:\n"
-                ) if not no_text else None
-                ids, aliases, ras, decs, redshifts = (
-                    [],
-                    [],
-                    [],
-                    [],
-                    [],
-                )
-                for source in sources:
-                    ids.append(source['id'] if 'id' in source else None)
-                    aliases.append(source['alias'] if 'alias' in source else None)
-                    ras.append(source['ra'] if 'ra' in source else None)
-                    decs.append(source['dec'] if 'dec' in source else None)
-                    redshift = source['redshift'] if 'redshift' in source else None
-                    if 'redshift_error' in source and redshift is not None:
-                        if source['redshift_error'] is not None:
-                            redshift = f"{redshift}±{source['redshift_error']}"
-                    redshifts.append(redshift)
-                df = pd.DataFrame(
-                    {
-                        "id": ids,
-                        "alias": aliases,
-                        "ra": ras,
-                        "dec": decs,
-                        "redshift": redshifts,
-                    }
-                )
-                sources_text.append(
-                    tabulate(df, headers='keys', tablefmt='psql', showindex=False)
-                    + "\n"
-                )
-                # now, create a photometry table per source
-                for source in sources:
-                    stmt = Photometry.select(user).where(
-                        Photometry.obj_id == source['id']
-                    )
-                    if photometry_in_window:
-                        stmt = stmt.where(
-                            Photometry.mjd >= start_date_mjd,
-                            Photometry.mjd <= end_date_mjd,
-                        )
-                    photometry = session.scalars(stmt).all()
-                    if len(photometry) > 0:
-                        sources_text.append(
-                            f"""\nPhotometry for source {source['id']}:\n"""
-                        ) if not no_text else None
-                        mjds, mags, filters, origins, instruments = (
-                            [],
-                            [],
-                            [],
-                            [],
-                            [],
-                        )
-                        for phot in photometry:
-                            phot = serialize(phot, 'ab', 'mag')
-                            mjds.append(phot['mjd'] if 'mjd' in phot else None)
-                            if (
-                                'mag' in phot
-                                and 'magerr' in phot
-                                and phot['mag'] is not None
-                                and phot['magerr'] is not None
-                            ):
-                                mags.append(
-                                    f"{np.round(phot['mag'],2)}±{np.round(phot['magerr'],2)}"
-                                )
-                            elif (
-                                'limiting_mag' in phot
-                                and phot['limiting_mag'] is not None
-                            ):
-                                mags.append(f"< {np.round(phot['limiting_mag'], 1)}")
-                            else:
-                                mags.append(None)
-                            filters.append(phot['filter'] if 'filter' in phot else None)
-                            origins.append(phot['origin'] if 'origin' in phot else None)
-                            instruments.append(
-                                phot['instrument_name']
-                                if 'instrument_name' in phot
-                                else None
-                            )
-                        df_phot = pd.DataFrame(
-                            {
-                                "mjd": mjds,
-                                "mag±err (ab)": mags,
-                                "filter": filters,
-                                "origin": origins,
-                                "instrument": instruments,
-                            }
-                        )
-                        if no_text:
-                            df_phot.insert(
-                                loc=0,
-                                column='obj_id',
-                                value=[p["obj_id"] for p in photometry],
-                            )
-                        sources_text.append(
-                            tabulate(
-                                df_phot,
-                                headers='keys',
-                                tablefmt='psql',
-                                showindex=False,
-                                floatfmt=".5f",
-                            )
-                            + "\n"
-                        )
-            contents.extend(sources_text)
+        instrument_ids = []
+        if show_observations:
+            stmt = Instrument.select(user, columns=[Instrument.id])
+            instrument_ids = session.scalars(stmt).all()
+
+        sections = {}
+
+        def summary_text():
+            contents = list(header_text)
+            contents.extend(sections.get('sources', []))
+            contents.extend(sections.get('galaxies', []))
+            observations_text = [
+                text
+                for instrument_id in instrument_ids
+                for text in sections.get(('observations', instrument_id), [])
+            ]
+            if len(observations_text) > 0 and not no_text:
+                observations_text = ["\nObservations:"] + observations_text
+                contents.extend(observations_text)
+            return "\n".join(contents)
 
-        if show_galaxies:
-            galaxies_text = []
-            galaxies_page_number = 1
-            galaxies = []
-            # get the galaxies in the event
-            while True:
-                galaxies_data = get_galaxies(
-                    session,
-                    localization_dateobs=event.dateobs,
-                    localization_name=localization_name,
-                    localization_cumprob=localization_cumprob,
-                    page_number=galaxies_page_number,
-                    num_per_page=MAX_GALAXIES,
+        flow = Flow()
+        with ThreadPoolExecutor(
+            max_workers=cfg['misc.max_gcn_summary_workers']
+        ) as executor:
+            futures = {}
+            if show_sources:
+                future = executor.submit(
+                    gcn_summary_sources,
+                    user_id,
+                    dateobs,
+                    start_date,
+                    end_date,
+                    localization_name,
+                    localization_cumprob,
+                    number_of_detections,
+                    no_text,
+                    photometry_in_window,
                 )
-                galaxies.extend(galaxies_data['galaxies'])
-                galaxies_page_number += 1
-                if len(galaxies_data['galaxies']) < MAX_GALAXIES:
-                    break
-            if len(galaxies) > 0:
-                galaxies_text.append(
-                    f"""\nFound {len(galaxies)} {'galaxies' if len(galaxies) > 1 else 'galaxy'} in the event's localization:\n"""
-                ) if not no_text else None
-                catalogs, names, ras, decs, distmpcs, redshifts = (
-                    [],
-                    [],
-                    [],
-                    [],
-                    [],
-                    [],
+                futures[future] = 'sources'
+            if show_galaxies:
+                future = executor.submit(
+                    gcn_summary_galaxies,
+                    user_id,
+                    dateobs,
+                    localization_name,
+                    localization_cumprob,
+                    no_text,
                 )
-                for galaxy in galaxies:
-                    galaxy = galaxy.to_dict()
-                    catalogs.append(
-                        galaxy['catalog_name'] if 'catalog_name' in galaxy else None
-                    )
-                    names.append(galaxy['name'] if 'name' in galaxy else None)
-                    ras.append(galaxy['ra'] if 'ra' in galaxy else None)
-                    decs.append(galaxy['dec'] if 'dec' in galaxy else None)
-                    distmpcs.append(galaxy['distmpc'] if 'distmpc' in galaxy else None)
-                    redshifts.append(
-                        galaxy['redshift'] if 'redshift' in galaxy else None
-                    )
-                df = pd.DataFrame(
-                    {
-                        "catalog": catalogs,
-                        "name": names,
-                        "ra": ras,
-                        "dec": decs,
-                        "distmpc": distmpcs,
-                        "redshift": redshifts,
-                    }
+                futures[future] = 'galaxies'
+            for instrument_id in instrument_ids:
+                future = executor.submit(
+                    gcn_summary_observations,
+                    user_id,
+                    instrument_id,
+                    dateobs,
+                    start_date,
+                    end_date,
+                    localization_name,
+                    localization_cumprob,
+                    no_text,
                 )
-                galaxies_text.append(
-                    tabulate(df, headers='keys', tablefmt='psql', showindex=False)
-                    + "\n"
-                )
-            contents.extend(galaxies_text)
-
-        if show_observations:
-            # get the executed obs, by instrument
-            observations_text = []
-            start_date = arrow.get(start_date).datetime
-            end_date = arrow.get(end_date).datetime
-
-            stmt = Instrument.select(user).options(joinedload(Instrument.telescope))
-            instruments = session.scalars(stmt).all()
-            if instruments is not None:
-                for instrument in instruments:
-                    data = get_observations(
-                        session,
-                        start_date,
-                        end_date,
-                        telescope_name=instrument.telescope.name,
-                        instrument_name=instrument.name,
-                        localization_dateobs=dateobs,
-                        localization_name=localization_name,
-                        localization_cumprob=localization_cumprob,
-                        return_statistics=True,
+                futures[future] = ('observations', instrument_id)
+
+            for ii, future in enumerate(as_completed(futures)):
+                sections[futures[future]] = future.result()
+                if ii < len(futures) - 1:
+                    # show the sections completed so far
+                    gcn_summary.text = summary_text()
+                    session.commit()
+                    flow.push(
+                        user_id=user.id,
+                        action_type="skyportal/REFRESH_GCN_EVENT",
+                        payload={"gcnEvent_dateobs": event.dateobs},
                     )
 
-                    observations = data["observations"]
-                    num_observations = len(observations)
-                    if num_observations > 0:
-                        start_observation = astropy.time.Time(
-                            min(obs["obstime"] for obs in observations),
-                            format='datetime',
-                        )
-                        unique_filters = list({obs["filt"] for obs in observations})
-                        total_time = sum(obs["exposure_time"] for obs in observations)
-                        probability = data["probability"]
-                        area = data["area"]
-
-                        dt = start_observation.datetime - event.dateobs
-                        before_after = "after" if dt.total_seconds() > 0 else "before"
-                        observations_text.append(
-                            f"""\n\n{instrument.telescope.name} - {instrument.name}:\n\nWe observed the localization region of {event.gcn_notices[0].stream} trigger {astropy.time.Time(event.dateobs, format='datetime').isot} UTC.  We obtained a total of {num_observations} images covering {",".join(unique_filters)} bands for a total of {total_time} seconds. The observations covered {area:.1f} square degrees beginning at {start_observation.isot} ({humanize.naturaldelta(dt)} {before_after} the burst trigger time) corresponding to ~{int(100 * probability)}% of the probability enclosed in the localization region.\nThe table below shows the photometry for each observation.\n"""
-                        ) if not no_text else None
-                        t0s, mjds, ras, decs, filters, exposures, limmags = (
-                            [],
-                            [],
-                            [],
-                            [],
-                            [],
-                            [],
-                            [],
-                        )
-                        for obs in observations:
-                            t0s.append(
-                                (obs["obstime"] - event.dateobs)
-                                / datetime.timedelta(hours=1)
-                                if "obstime" in obs
-                                else None
-                            )
-                            mjds.append(
-                                astropy.time.Time(obs["obstime"], format='datetime').mjd
-                                if "obstime" in obs
-                                else None
-                            )
-                            ras.append(
-                                obs['field']["ra"] if "ra" in obs['field'] else None
-                            )
-                            decs.append(
-                                obs['field']["dec"] if "dec" in obs['field'] else None
-                            )
-                            filters.append(obs["filt"] if "filt" in obs else None)
-                            exposures.append(
-                                obs["exposure_time"] if "exposure_time" in obs else None
-                            )
-                            limmags.append(obs["limmag"] if "limmag" in obs else None)
-                        df_obs = pd.DataFrame(
-                            {
-                                "T-T0 (hr)": t0s,
-                                "mjd": mjds,
-                                "ra": ras,
-                                "dec": decs,
-                                "filter": filters,
-                                "exposure": exposures,
-                                "limmag (ab)": limmags,
-                            }
-                        )
-                        if no_text:
-                            df_obs.insert(
-                                loc=0,
-                                column="tel/inst",
-                                value=[
-                                    f"{instrument.telescope.name}/{instrument.name}"
-                                    for obs in observations
-                                ],
-                            )
-                        observations_text.append(
-                            tabulate(
-                                df_obs,
-                                headers='keys',
-                                tablefmt='psql',
-                                showindex=False,
-                                floatfmt=(
-                                    ".2f",
-                                    ".5f",
-                                    ".5f",
-                                    ".5f",
-                                    "%s",
-                                    "%d",
-                                    ".2f",
-                                ),
-                            )
-                            + "\n"
-                        )
-                if len(observations_text) > 0 and not no_text:
-                    observations_text = ["\nObservations:"] + observations_text
-                    contents.extend(observations_text)
-
-        gcn_summary.text = "\n".join(contents)
+        gcn_summary.text = summary_text()
         session.commit()
 
-        flow = Flow()
         flow.push(
             user_id=user.id,
             action_type="skyportal/REFRESH_GCN_EVENT",
@@ -2385,7 +2766,6 @@ class LocalizationDownloadHandler(BaseHandler):
             return self.error(f'Failed to parse dateobs: str({e})')
 
         localization_name = localization_name.strip()
-        local_temp_files = []
 
         with self.Session() as session:
             try:
@@ -2399,29 +2779,13 @@ class LocalizationDownloadHandler(BaseHandler):
                     return self.error("Localization not found", status=404)
 
                 output_format = 'fits'
-                with tempfile.NamedTemporaryFile(suffix='.fits') as fitsfile:
-                    ligo.skymap.io.write_sky_map(
-                        fitsfile.name, localization.table, moc=True
-                    )
-
-                    with open(fitsfile.name, mode='rb') as g:
-                        content = g.read()
-                    local_temp_files.append(fitsfile.name)
-
-                data = io.BytesIO(content)
+                data = io.BytesIO(to_fits(localization.table))
                 filename = f"{localization.localization_name}.{output_format}"
 
                 await self.send_file(data, filename, output_type=output_format)
 
             except Exception as e:
                 return self.error(f'Failed to create skymap for download: str({e})')
-            finally:
-                # clean up local files
-                for f in local_temp_files:
-                    try:
-                        os.remove(f)
-                    except:  # noqa E722
-                        pass
 
 
 class LocalizationCrossmatchHandler(BaseHandler):
@@ -2462,7 +2826,6 @@ class LocalizationCrossmatchHandler(BaseHandler):
 
         id1 = id1.strip()
         id2 = id2.strip()
-        local_temp_files = []
 
         with self.Session() as session:
             try:
@@ -2482,23 +2845,14 @@ class LocalizationCrossmatchHandler(BaseHandler):
 
                 output_format = 'fits'
 
-                skymap1 = localization1.flat_2d
-                skymap2 = localization2.flat_2d
-                skymap = skymap1 * skymap2
-                skymap = skymap / np.sum(skymap)
-
-                skymap = hp.reorder(skymap, 'RING', 'NESTED')
-                skymap = ligo_bayestar.derasterize(Table([skymap], names=['PROB']))
-                with tempfile.NamedTemporaryFile(suffix='.fits') as fitsfile:
-                    ligo.skymap.io.write_sky_map(
-                        fitsfile.name, skymap, format='fits', moc=True
-                    )
-
-                    with open(fitsfile.name, mode='rb') as g:
-                        content = g.read()
-                    local_temp_files.append(fitsfile.name)
-
-                data = io.BytesIO(content)
+                uniq, probdensity = product(
+                    localization1.uniq,
+                    localization1.probdensity,
+                    localization2.uniq,
+                    localization2.probdensity,
+                )
+                skymap = Table([uniq, probdensity], names=['UNIQ', 'PROBDENSITY'])
+                data = io.BytesIO(to_fits(skymap))
                 filename = f"{localization1.localization_name}_{localization2.localization_name}.{output_format}"
 
                 await self.send_file(
@@ -2509,13 +2863,6 @@ class LocalizationCrossmatchHandler(BaseHandler):
 
             except Exception as e:
                 return self.error(f'Failed to create skymap for download: str({e})')
-            finally:
-                # clean up local files
-                for f in local_temp_files:
-                    try:
-                        os.remove(f)
-                    except:  # noqa E722
-                        pass
 
 
 class GcnEventInstrumentFieldHandler(BaseHandler):
@@ -1,5 +1,6 @@
 from marshmallow.exceptions import ValidationError
 from baselayer.app.access import permissions, auth_or_token
+from baselayer.app.env import load_env
 from baselayer.log import make_log
 from sqlalchemy.orm import joinedload, undefer
 from sqlalchemy.orm import sessionmaker, scoped_session
@@ -8,7 +9,6 @@ from tornado.ioloop import IOLoop
 
 import arrow
 import ast
-from healpix_alchemy import Tile
 from regions import Regions, CircleSkyRegion, RectangleSkyRegion, PolygonSkyRegion
 from astropy import coordinates
 from astropy.coordinates import SkyCoord
@@ -30,9 +30,13 @@ from ...models import (
     Telescope,
 )
 from ...enum_types import ALLOWED_BANDPASSES
+from ...utils.inserts import INSERT_CHUNK_SIZE, insert_values
+from ...utils.tiles import copy_tiles, fields_to_ranges
 
 log = make_log('api/instrument')
 
+_, cfg = load_env()
+
 Session = scoped_session(sessionmaker())
 
 
@@ -749,9 +753,96 @@ InstrumentHandler.post.__doc__ = f"""
         """
 
 
+def field_contours(instrument_name, field_id, ra, dec, coords, needs_summary):
+    """Full and summary (bounding-box) GeoJSON contours of a field."""
+
+    # compute full contour
+    geometry = []
+    for coord in coords:
+        tab = list(
+            zip(
+                (*coord.ra.deg, coord.ra.deg[0]),
+                (*coord.dec.deg, coord.dec.deg[0]),
+            )
+        )
+        geometry.append(tab)
+
+    contour = {
+        'properties': {
+            'instrument': instrument_name,
+            'field_id': int(field_id),
+            'ra': ra,
+            'dec': dec,
+        },
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'MultiLineString',
+                    'coordinates': geometry,
+                },
+            },
+        ],
+    }
+    if field_id == -1:
+        del contour['properties']['field_id']
+
+    if not needs_summary:
+        return contour, contour
+
+    # compute summary (bounding-box) contour
+    min_ra, max_ra = np.min(coords[0].ra.deg), np.max(coords[0].ra.deg)
+    min_dec, max_dec = np.min(coords[0].dec.deg), np.max(coords[0].dec.deg)
+    for coord in coords:
+        min_ra = min(min_ra, np.min(coord.ra.deg))
+        max_ra = max(max_ra, np.max(coord.ra.deg))
+        min_dec = min(min_dec, np.min(coord.dec.deg))
+        max_dec = max(max_dec, np.max(coord.dec.deg))
+    geometry_summary = [
+        (min_ra, min_dec),
+        (max_ra, min_dec),
+        (max_ra, max_dec),
+        (min_ra, max_dec),
+        (min_ra, min_dec),
+    ]
+
+    contour_summary = {
+        'properties': {
+            'instrument': instrument_name,
+            'field_id': int(field_id),
+            'ra': ra,
+            'dec': dec,
+        },
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'LineString',
+                    'coordinates': geometry_summary,
+                },
+            },
+        ],
+    }
+    if field_id == -1:
+        del contour_summary['properties']['field_id']
+
+    return contour, contour_summary
+
+
 def add_tiles(
     instrument_id, instrument_name, regions, field_data, modify=False, session=None
 ):
+    """Create the fields of an instrument (and their tiles) from a grid of
+    pointings. Fields without an ID (-1) reuse the existing field at the
+    same position, or are given the next free field IDs. With `modify`,
+    the tiles of existing fields with the same IDs are replaced.
+
+    The tiles of all the fields are computed first (in worker processes
+    for large grids), then the fields and tiles are inserted in a single
+    transaction. Returns the field IDs, in the order of `field_data`."""
+
     field_ids = []
     if session is None:
         if Session.registry.has():
@@ -811,167 +902,162 @@ def add_tiles(
         ).transform_to(coordinates.ICRS)
 
         if 'ID' in field_data:
-            ids = field_data['ID']
+            ids = [int(field_id) for field_id in field_data['ID']]
         else:
             ids = [-1] * len(field_data['RA'])
+        field_positions = list(zip(field_data['RA'], field_data['Dec']))
+
+        # existing fields, in two queries rather than one per field
+        existing_by_position = {}
+        if -1 in ids:
+            existing_by_position = {
+                (field_ra, field_dec): field_id
+                for field_ra, field_dec, field_id in session.execute(
+                    sa.select(
+                        InstrumentField.ra,
+                        InstrumentField.dec,
+                        InstrumentField.field_id,
+                    ).where(InstrumentField.instrument_id == instrument_id)
+                )
+            }
+        existing_by_id = {}
+        if modify:
+            existing_by_id = {
+                field_id: id
+                for id, field_id in session.execute(
+                    sa.select(InstrumentField.id, InstrumentField.field_id).where(
+                        InstrumentField.instrument_id == instrument_id,
+                        InstrumentField.field_id.in_(
+                            [field_id for field_id in ids if field_id != -1]
+                        ),
+                    )
+                )
+            }
 
-        for ii, (field_id, ra, dec, coords) in enumerate(
-            zip(ids, field_data['RA'], field_data['Dec'], coords_icrs)
-        ):
-
+        # fields to create or to re-tile, and the field (position in the
+        # grid of the new field, or ID of an existing one) of each pointing
+        new_fields, retiled_fields, field_refs = [], [], []
+        new_fields_by_position = {}
+        for ii, (field_id, (ra, dec)) in enumerate(zip(ids, field_positions)):
             if field_id == -1:
-                field = InstrumentField.query.filter(
-                    InstrumentField.instrument_id == instrument_id,
-                    InstrumentField.ra == ra,
-                    InstrumentField.dec == dec,
-                ).first()
-                if field is not None:
-                    field_ids.append(field.field_id)
+                position = (float(ra), float(dec))
+                if position in existing_by_position:
+                    field_refs.append(('existing', existing_by_position[position]))
                     continue
-
-            # compute full contour
-            geometry = []
-            for coord in coords:
-                tab = list(
-                    zip(
-                        (*coord.ra.deg, coord.ra.deg[0]),
-                        (*coord.dec.deg, coord.dec.deg[0]),
-                    )
+                if position not in new_fields_by_position:
+                    new_fields_by_position[position] = len(new_fields)
+                    new_fields.append(ii)
+                field_refs.append(('new', new_fields_by_position[position]))
+            elif field_id in existing_by_id:
+                retiled_fields.append(ii)
+                field_refs.append(('existing', field_id))
+            else:
+                field_refs.append(('new', len(new_fields)))
+                new_fields.append(ii)
+
+        # compute the tiles of all the fields, in worker processes
+        # for large grids
+        tiled_fields = new_fields + retiled_fields
+        field_ranges = []
+        for ii, ranges in enumerate(
+            fields_to_ranges(
+                [
+                    (coords_icrs[jj].ra.deg, coords_icrs[jj].dec.deg)
+                    for jj in tiled_fields
+                ],
+                max_processes=cfg['misc.max_field_tiling_processes'],
+            )
+        ):
+            field_ranges.append(ranges)
+            if (ii + 1) % max(1, len(tiled_fields) // 10) == 0:
+                log(
+                    f"Generated tiles for {ii + 1}/{len(tiled_fields)} fields "
+                    f"for instrument {instrument_id}"
                 )
-                geometry.append(tab)
-
-            contour = {
-                'properties': {
-                    'instrument': instrument_name,
-                    'field_id': int(field_id),
-                    'ra': ra,
-                    'dec': dec,
-                },
-                'type': 'FeatureCollection',
-                'features': [
+
+        # allocate the IDs of the new fields without ID, and insert
+        # the new fields in one statement per chunk
+        next_field_id = 1
+        if any(ids[ii] == -1 for ii in new_fields):
+            next_field_id += session.execute(
+                sa.select(
+                    sa.func.coalesce(sa.func.max(InstrumentField.field_id), 0)
+                ).where(InstrumentField.instrument_id == instrument_id)
+            ).scalar_one()
+        field_rows = []
+        for ii in new_fields:
+            ra, dec = field_positions[ii]
+            contour, contour_summary = field_contours(
+                instrument_name, ids[ii], ra, dec, coords_icrs[ii], needs_summary
+            )
+            if ids[ii] == -1:
+                field_id = next_field_id
+                next_field_id += 1
+            else:
+                field_id = ids[ii]
+            field_rows.append(
+                insert_values(
+                    InstrumentField.__table__,
                     {
-                        'type': 'Feature',
-                        'geometry': {
-                            'type': 'MultiLineString',
-                            'coordinates': geometry,
-                        },
-                    },
-                ],
-            }
-            if field_id == -1:
-                del contour['properties']['field_id']
-
-            if needs_summary:
-                # compute summary (bounding-box) contour
-                geometry = []
-                min_ra, max_ra = np.min(coords[0].ra.deg), np.max(coords[0].ra.deg)
-                min_dec, max_dec = np.min(coords[0].dec.deg), np.max(coords[0].dec.deg)
-                for coord in coords:
-                    min_ra = min(min_ra, np.min(coord.ra.deg))
-                    max_ra = max(max_ra, np.max(coord.ra.deg))
-                    min_dec = min(min_dec, np.min(coord.dec.deg))
-                    max_dec = max(max_dec, np.max(coord.dec.deg))
-                geometry_summary = [
-                    (min_ra, min_dec),
-                    (max_ra, min_dec),
-                    (max_ra, max_dec),
-                    (min_ra, max_dec),
-                    (min_ra, min_dec),
-                ]
-
-                contour_summary = {
-                    'properties': {
-                        'instrument': instrument_name,
-                        'field_id': int(field_id),
+                        'instrument_id': instrument_id,
+                        'field_id': field_id,
+                        'contour': contour,
+                        'contour_summary': contour_summary,
                         'ra': ra,
                         'dec': dec,
                     },
-                    'type': 'FeatureCollection',
-                    'features': [
-                        {
-                            'type': 'Feature',
-                            'geometry': {
-                                'type': 'LineString',
-                                'coordinates': geometry_summary,
-                            },
-                        },
-                    ],
+                )
+            )
+        new_field_ids = [row['field_id'] for row in field_rows]
+        for start in range(0, len(field_rows), INSERT_CHUNK_SIZE):
+            existing_by_id.update(
+                {
+                    field_id: id
+                    for id, field_id in session.execute(
+                        sa.insert(InstrumentField)
+                        .values(field_rows[start : start + INSERT_CHUNK_SIZE])
+                        .returning(InstrumentField.id, InstrumentField.field_id)
+                    )
                 }
-                if field_id == -1:
-                    del contour_summary['properties']['field_id']
-            else:
-                contour_summary = contour
+            )
 
-            if field_id == -1:
-                max_field_id = session.execute(
-                    sa.select(sa.func.max(InstrumentField.field_id)).where(
-                        InstrumentField.instrument_id == instrument_id,
-                    )
-                ).scalar_one()
-
-                field = InstrumentField(
-                    instrument_id=instrument_id,
-                    contour=contour,
-                    contour_summary=contour_summary,
-                    ra=ra,
-                    dec=dec,
-                    field_id=max_field_id + 1,
+        if len(retiled_fields) > 0:
+            session.execute(
+                sa.delete(InstrumentFieldTile).where(
+                    InstrumentFieldTile.instrument_id == instrument_id,
+                    InstrumentFieldTile.instrument_field_id.in_(
+                        [existing_by_id[ids[ii]] for ii in retiled_fields]
+                    ),
                 )
-                session.add(field)
-                session.commit()
-            else:
-                create_field = True
-                if modify:
-                    field = session.scalars(
-                        sa.select(InstrumentField).where(
-                            InstrumentField.instrument_id == instrument_id,
-                            InstrumentField.field_id == int(field_id),
-                        )
-                    ).first()
+            )
 
-                    if field is not None:
-                        session.execute(
-                            sa.delete(InstrumentFieldTile).where(
-                                InstrumentFieldTile.instrument_id == instrument_id,
-                                InstrumentFieldTile.instrument_field_id == field.id,
-                            )
-                        )
-                        session.commit()
-
-                        create_field = False
-
-                if create_field:
-                    field = InstrumentField(
-                        instrument_id=instrument_id,
-                        field_id=int(field_id),
-                        contour=contour,
-                        contour_summary=contour_summary,
-                        ra=ra,
-                        dec=dec,
-                    )
-                    session.add(field)
-                    session.commit()
-
-            field_ids.append(field.field_id)
-
-            tiles = []
-            for coord in coords:
-                for hpx in Tile.tiles_from_polygon_skycoord(coord):
-                    tiles.append(
-                        InstrumentFieldTile(
-                            instrument_id=instrument_id,
-                            instrument_field_id=field.id,
-                            healpix=hpx,
-                        )
-                    )
-            session.add_all(tiles)
-            session.commit()
+        if len(field_ranges) > 0:
+            tiled_field_ids = new_field_ids + [ids[ii] for ii in retiled_fields]
+            copy_tiles(
+                session,
+                InstrumentFieldTile,
+                np.concatenate([lower for lower, _ in field_ranges]),
+                np.concatenate([upper for _, upper in field_ranges]),
+                instrument_id=instrument_id,
+                instrument_field_id=np.repeat(
+                    [existing_by_id[field_id] for field_id in tiled_field_ids],
+                    [len(lower) for lower, _ in field_ranges],
+                ),
+            )
+        session.commit()
+
+        field_ids = [
+            new_field_ids[ref] if kind == 'new' else ref for kind, ref in field_refs
+        ]
         log(f"Successfully generated fields for instrument {instrument_id}")
     except Exception as e:
+        session.rollback()
         log(f"Unable to generate fields for instrument {instrument_id}: {e}")
+        raise
     finally:
         Session.remove()
-        return field_ids
+
+    return field_ids
 
 
 class InstrumentFieldHandler(BaseHandler):
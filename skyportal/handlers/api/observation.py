@@ -1,6 +1,7 @@
 from baselayer.app.access import permissions, auth_or_token
 from baselayer.log import make_log
 import arrow
+import datetime
 import time
 import functools
 import healpix_alchemy as ha
@@ -47,7 +48,7 @@ from ...utils.simsurvey import (
 )
 from .instrument import add_tiles
 from .observation_plan import observation_simsurvey, observation_simsurvey_plot
-from ...facility_apis.observation_plan import combine_healpix_tuples
+from ...utils.coverage import coverage, ranges_length
 
 
 env, cfg = load_env()
@@ -60,6 +61,132 @@ Session = scoped_session(sessionmaker())
 MAX_OBSERVATIONS = 1000
 
 
+def get_instrument_field_ids(session, instrument_id, field_ids):
+    """Database IDs of the fields of an instrument, resolved with a single
+    join against the requested field IDs.
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.Session
+        Database session.
+    instrument_id : int
+        ID of the instrument
+    field_ids : array-like of int
+        Field IDs, as supplied by the instrument
+
+    Returns
+    -------
+    pandas.Series
+        Database ID of each field (InstrumentField.id), NaN if the field
+        does not exist
+    """
+    field_ids = pd.Series(np.asarray(field_ids, dtype=np.int64))
+    if len(field_ids) == 0:
+        return field_ids.astype(float)
+    requested = sa.values(
+        sa.column('field_id', sa.Integer), name='requested_fields'
+    ).data([(int(field_id),) for field_id in field_ids.unique()])
+    stmt = (
+        sa.select(InstrumentField.field_id, InstrumentField.id)
+        .join(requested, InstrumentField.field_id == requested.c.field_id)
+        .where(InstrumentField.instrument_id == instrument_id)
+    )
+    return field_ids.map(dict(session.execute(stmt).all()))
+
+
+def parse_obstimes(obstimes):
+    """Parse a column of observation times, given either as JDs or in any
+    format recognized by astropy (e.g., iso, isot or datetime objects).
+
+    Parameters
+    ----------
+    obstimes : array-like
+        Observation times
+
+    Returns
+    -------
+    astropy.time.Time
+        Observation times
+    """
+    values = pd.Series(obstimes).reset_index(drop=True)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        if values.dt.tz is not None:
+            values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+        return Time(values.to_numpy().astype('datetime64[ns]'))
+    if pd.api.types.is_numeric_dtype(values):
+        return Time(values.to_numpy(dtype=float), format='jd')
+
+    values = values.to_numpy()
+    if pd.api.types.infer_dtype(values) not in ('datetime', 'datetime64', 'date'):
+        # JDs given as strings
+        jd = pd.to_numeric(pd.Series(values), errors='coerce')
+        if jd.notnull().all():
+            return Time(jd.to_numpy(dtype=float), format='jd')
+    try:
+        # can catch iso and isot this way, if all the times share a format
+        return Time(values)
+    except ValueError:
+        # otherwise parse each distinct value on its own
+        unique, inverse = np.unique(values.astype(str), return_inverse=True)
+        return Time([Time(value) for value in unique])[inverse]
+
+
+def copy_observations(session, model, df, on_conflict_do_nothing=False):
+    """Insert observations with COPY, through a temporary staging table.
+
+    The rows are written in the current transaction of the session,
+    which must be committed by the caller.
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.Session
+        Database session.
+    model : skyportal.models.Base
+        ExecutedObservation or QueuedObservation.
+    df : pandas.DataFrame
+        Observations, with one column per column of the table.
+    on_conflict_do_nothing : bool, optional
+        Skip the observations that conflict with a unique index of the
+        table (e.g., already ingested ones) rather than failing.
+
+    Returns
+    -------
+    int
+        Number of observations inserted.
+    """
+    if len(df) == 0:
+        return 0
+
+    df = df.copy()
+    utcnow = datetime.datetime.utcnow().isoformat()
+    df['created_at'] = utcnow
+    df['modified'] = utcnow
+    output = StringIO()
+    df.to_csv(output, index=False, header=False)
+    output.seek(0)
+
+    table = model.__table__.name
+    staging = f'{table}_staging'
+    columns = ', '.join(df.columns)
+    conflict = ' ON CONFLICT DO NOTHING' if on_conflict_do_nothing else ''
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(
+            f'CREATE TEMP TABLE {staging} '
+            f'(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            f'COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)', output
+        )
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) '
+            f'SELECT {columns} FROM {staging}{conflict}'
+        )
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
 def add_queued_observations(instrument_id, obstable):
     """Fetch queued observations from ZTF scheduler.
     instrument_id: int
@@ -74,42 +201,37 @@ def add_queued_observations(instrument_id, obstable):
         session = Session(bind=DBSession.session_factory.kw["bind"])
 
     try:
-        observations = []
-        for index, row in obstable.iterrows():
-            field_id = int(row["field_id"])
-            field = (
-                session.query(InstrumentField)
-                .filter(
-                    InstrumentField.instrument_id == instrument_id,
-                    InstrumentField.field_id == field_id,
-                )
-                .first()
+        field_ids = get_instrument_field_ids(
+            session, instrument_id, obstable['field_id']
+        )
+        missing = obstable['field_id'][field_ids.isnull().to_numpy()]
+        if len(missing) > 0:
+            return log(
+                f"Unable to add observations for instrument {instrument_id}: Missing field {int(missing.iloc[0])}"
             )
-            if field is None:
-                return log(
-                    f"Unable to add observations for instrument {instrument_id}: Missing field {field_id}"
-                )
 
-            observations.append(
-                QueuedObservation(
-                    queue_name=row['queue_name'],
-                    instrument_id=row['instrument_id'],
-                    instrument_field_id=field.id,
-                    obstime=row['obstime'],
-                    validity_window_start=row['validity_window_start'],
-                    validity_window_end=row['validity_window_end'],
-                    exposure_time=row["exposure_time"],
-                    filt=row['filter'],
-                )
-            )
-        session.add_all(observations)
+        observations = pd.DataFrame(
+            {
+                'queue_name': obstable['queue_name'].to_numpy(),
+                'instrument_id': obstable['instrument_id'].astype(np.int64).to_numpy(),
+                'instrument_field_id': field_ids.astype(np.int64).to_numpy(),
+                'obstime': parse_obstimes(obstable['obstime']).datetime,
+                'validity_window_start': obstable['validity_window_start'].to_numpy(),
+                'validity_window_end': obstable['validity_window_end'].to_numpy(),
+                'exposure_time': np.round(
+                    pd.to_numeric(obstable['exposure_time'])
+                ).astype(np.int64),
+                'filt': obstable['filter'].to_numpy(),
+            }
+        )
+        n_observations = copy_observations(session, QueuedObservation, observations)
         session.commit()
 
         flow = Flow()
         flow.push('*', "skyportal/REFRESH_QUEUED_OBSERVATIONS")
 
         return log(
-            f"Successfully added queued observations for instrument {instrument_id}"
+            f"Successfully added {n_observations} queued observations for instrument {instrument_id}"
         )
     except Exception as e:
         return log(
@@ -137,6 +259,9 @@ def add_observations(instrument_id, obstable):
 2   ztfr                 1.0    None
 3   ztfr                 1.0    None
 4   ztfr                 1.0    None
+
+    Observations already ingested for the instrument (with the same
+    observation_id) are skipped.
      """
 
     if Session.registry.has():
@@ -144,75 +269,58 @@ def add_observations(instrument_id, obstable):
     else:
         session = Session(bind=DBSession.session_factory.kw["bind"])
 
-    # if the fields do not yet exist, we need to add them
-    if ('RA' in obstable) and ('Dec' in obstable) and not ('field_id' in obstable):
-        instrument = session.query(Instrument).get(instrument_id)
-        regions = Regions.parse(instrument.region, format='ds9')
-        field_data = obstable[['RA', 'Dec']]
-        field_ids = add_tiles(
-            instrument.id, instrument.name, regions, field_data, session=session
-        )
-        obstable['field_id'] = field_ids
-
     try:
-        observations = []
-        for index, row in obstable.iterrows():
-            field_id = int(row["field_id"])
-            field = (
-                session.query(InstrumentField)
-                .filter(
-                    InstrumentField.instrument_id == instrument_id,
-                    InstrumentField.field_id == field_id,
-                )
-                .first()
+        # if the fields do not yet exist, we need to add them
+        if ('RA' in obstable) and ('Dec' in obstable) and not ('field_id' in obstable):
+            instrument = session.query(Instrument).get(instrument_id)
+            regions = Regions.parse(instrument.region, format='ds9')
+            field_data = obstable[['RA', 'Dec']]
+            obstable['field_id'] = add_tiles(
+                instrument.id, instrument.name, regions, field_data, session=session
             )
-            if field is None:
-                return log(
-                    f"Unable to add observations for instrument {instrument_id}: Missing field {field_id}"
-                )
 
-            observation = (
-                session.query(ExecutedObservation)
-                .filter_by(
-                    instrument_id=instrument_id, observation_id=row["observation_id"]
-                )
-                .first()
+        field_ids = get_instrument_field_ids(
+            session, instrument_id, obstable['field_id']
+        )
+        missing = obstable['field_id'][field_ids.isnull().to_numpy()]
+        if len(missing) > 0:
+            return log(
+                f"Unable to add observations for instrument {instrument_id}: Missing field {int(missing.iloc[0])}"
             )
-            if observation is not None:
-                log(
-                    f"Observation {row['observation_id']} for instrument {instrument_id} already exists... continuing."
-                )
-                continue
 
-            # enable multiple obstime formats
-            try:
-                # can catch iso and isot this way
-                obstime = Time(row["obstime"])
-            except ValueError:
-                # otherwise catch jd as the numerical example
-                obstime = Time(row["obstime"], format='jd')
-
-            observations.append(
-                ExecutedObservation(
-                    instrument_id=instrument_id,
-                    observation_id=row["observation_id"],
-                    instrument_field_id=field.id,
-                    obstime=obstime.datetime,
-                    seeing=row["seeing"],
-                    limmag=row["limmag"],
-                    exposure_time=row["exposure_time"],
-                    filt=row["filter"],
-                    processed_fraction=row["processed_fraction"],
-                    target_name=row["target_name"],
-                )
-            )
-        session.add_all(observations)
+        observations = pd.DataFrame(
+            {
+                'instrument_id': instrument_id,
+                'observation_id': obstable['observation_id']
+                .astype(np.int64)
+                .to_numpy(),
+                'instrument_field_id': field_ids.astype(np.int64).to_numpy(),
+                'obstime': parse_obstimes(obstable['obstime']).datetime,
+                'seeing': obstable['seeing'].to_numpy(),
+                'limmag': obstable['limmag'].to_numpy(),
+                'exposure_time': np.round(
+                    pd.to_numeric(obstable['exposure_time'])
+                ).astype(np.int64),
+                'filt': obstable['filter'].to_numpy(),
+                'processed_fraction': obstable['processed_fraction'].to_numpy(),
+                'target_name': obstable['target_name'].to_numpy(),
+            }
+        )
+        n_observations = copy_observations(
+            session, ExecutedObservation, observations, on_conflict_do_nothing=True
+        )
         session.commit()
+        if n_observations < len(observations):
+            log(
+                f"{len(observations) - n_observations} observations for instrument {instrument_id} already exist... skipped."
+            )
 
         flow = Flow()
         flow.push('*', "skyportal/REFRESH_OBSERVATIONS")
 
-        return log(f"Successfully added observations for instrument {instrument_id}")
+        return log(
+            f"Successfully added {n_observations} observations for instrument {instrument_id}"
+        )
     except Exception as e:
         return log(f"Unable to add observations for instrument {instrument_id}: {e}")
     finally:
@@ -430,13 +538,16 @@ def get_observations(
 
             if stats_method == 'python':
                 t0 = time.time()
-                localization_tiles = session.scalars(
-                    sa.select(LocalizationTile)
+                localization_tiles = session.execute(
+                    sa.select(
+                        LocalizationTile.healpix.lower,
+                        LocalizationTile.healpix.upper,
+                        LocalizationTile.probdensity,
+                    )
                     .where(
                         LocalizationTile.localization_id == localization.id,
                         LocalizationTile.probdensity >= min_probdensity,
                     )
-                    .order_by(LocalizationTile.probdensity.desc())
                     .distinct()
                 ).all()
                 if stats_logging:
@@ -457,12 +568,15 @@ def get_observations(
                         InstrumentFieldTile.instrument_field_id
                         == obs_subquery.c.instrument_field_id,
                     )
-                    .order_by(InstrumentFieldTile.healpix.lower)
                     .distinct()
                 ).all()
 
-                field_lower_bounds = np.array([f[0] for f in instrument_field_tuples])
-                field_upper_bounds = np.array([f[1] for f in instrument_field_tuples])
+                field_lower_bounds = np.array(
+                    [f[0] for f in instrument_field_tuples], dtype=np.int64
+                )
+                field_upper_bounds = np.array(
+                    [f[1] for f in instrument_field_tuples], dtype=np.int64
+                )
 
                 if stats_logging:
                     log(
@@ -472,55 +586,27 @@ def get_observations(
                     )
 
                 t0 = time.time()
-                merged_tuples = combine_healpix_tuples(instrument_field_tuples)
-                total_area = sum(t[1] - t[0] for t in merged_tuples)
-                total_area *= ha.constants.PIXEL_AREA
+                total_area = (
+                    ranges_length(field_lower_bounds, field_upper_bounds)
+                    * ha.constants.PIXEL_AREA
+                )
                 if stats_logging:
                     log(
                         "STATS: ",
-                        f'len(merged_tuples)= {len(merged_tuples)}, '
                         f'total_area= {total_area:.2f}. '
                         f'Runtime= {time.time() - t0:.2f}s. ',
                     )
 
                 t0 = time.time()
-                intarea = 0  # total area covered by instrument field tiles
-                intprob = 0  # total probability covered by instrument field tiles
-
-                for i, t in enumerate(localization_tiles):
-                    # has True values where tile t has any overlap with one of the fields
-                    overlap_array = np.logical_and(
-                        t.healpix.lower <= field_upper_bounds,
-                        t.healpix.upper >= field_lower_bounds,
-                    )
-                    overlap_indices = np.where(overlap_array)[0]
-
-                    # only add area/prob if there's any overlap
-                    overlap = 0
-                    if len(overlap_indices) > 0:
-                        # print(f'sum(overlap_array): {np.sum(overlap_array)}')
-                        lower_upper = zip(
-                            field_lower_bounds[overlap_indices],
-                            field_upper_bounds[overlap_indices],
-                        )
-                        # tuples of (lower, upper) for all fields that overlap with tile t
-                        new_fields = [(tup[0], tup[1]) for tup in lower_upper]
-
-                        # combine any overlapping fields
-                        output_fields = combine_healpix_tuples(new_fields)
-
-                        # get the area of the combined fields that overlaps with tile t
-                        for lower, upper in output_fields:
-                            mx = np.minimum(t.healpix.upper, upper)
-                            mn = np.maximum(t.healpix.lower, lower)
-                            overlap += mx - mn
-
-                    intarea += overlap
-                    intprob += t.probdensity * overlap
-
-                # sum_probability *= ha.constants.PIXEL_AREA
-                intarea *= ha.constants.PIXEL_AREA
-                intprob *= ha.constants.PIXEL_AREA
+                # area and probability of the localization
+                # covered by the union of the field tiles
+                intarea, intprob = coverage(
+                    field_lower_bounds,
+                    field_upper_bounds,
+                    np.array([t[0] for t in localization_tiles], dtype=np.int64),
+                    np.array([t[1] for t in localization_tiles], dtype=np.int64),
+                    np.array([t[2] for t in localization_tiles], dtype=float),
+                )
 
                 if stats_logging:
                     log(
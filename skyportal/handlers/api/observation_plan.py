@@ -84,6 +84,9 @@ from skyportal.facility_apis.observation_plan import (
 env, cfg = load_env()
 TREASUREMAP_URL = cfg['app.treasuremap_endpoint']
 
+# HEALPix order (nside=128) of the skymaps used for the observability plots
+OBSERVABILITY_MAP_ORDER = 7
+
 Session = scoped_session(sessionmaker())
 
 log = make_log('api/observation_plan')
@@ -1615,9 +1618,10 @@ class ObservationPlanWorldmapPlotHandler(BaseHandler):
                 Localization.id == localization_id
             )
             localization = session.scalars(stmt).first()
-            m = localization.flat_2d
-            nside = localization.nside
+            # a coarse map is enough for the observable probability
+            m = localization.get_flat_2d(order=OBSERVABILITY_MAP_ORDER)
             npix = len(m)
+            nside = hp.npix2nside(npix)
 
             trigger_time = Time(localization.dateobs, format='datetime')
 
@@ -1,4 +1,5 @@
 import arrow
+import pandas as pd
 import sqlalchemy as sa
 from sqlalchemy import func
 from sqlalchemy.orm import joinedload
@@ -18,6 +19,43 @@ DEFAULT_SOURCES_PER_PAGE = 100
 MAX_SOURCES_PER_PAGE = 500
 
 
+def get_phot_stat_columns(session, obj_ids):
+    """
+    Fetch the photometry columns needed to compute the PhotStats of
+    some objects, using a single column-only query.
+
+    Parameters
+    ----------
+    session : sqlalchemy.Session
+        Database session for this transaction.
+    obj_ids : list of str
+        IDs of the objects.
+
+    Returns
+    -------
+    dict
+        A pandas.DataFrame (to be passed to `PhotStat.full_update`)
+        for each of the obj_ids, with columns obj_id, mjd, filter, flux,
+        fluxerr and original_user_data.
+    """
+    columns = [
+        Photometry.obj_id,
+        Photometry.mjd,
+        Photometry.filter,
+        Photometry.flux,
+        Photometry.fluxerr,
+        Photometry.original_user_data,
+    ]
+    df = pd.DataFrame(
+        session.execute(
+            sa.select(*columns).where(Photometry.obj_id.in_(list(obj_ids)))
+        ).all(),
+        columns=[column.key for column in columns],
+    )
+    photometry = {obj_id: group for obj_id, group in df.groupby('obj_id')}
+    return {obj_id: photometry.get(obj_id, df.iloc[:0]) for obj_id in obj_ids}
+
+
 class PhotStatHandler(BaseHandler):
     @auth_or_token
     def get(self, obj_id=None):
@@ -116,8 +154,7 @@ class PhotStatHandler(BaseHandler):
                     f'PhotStat for object with id "{obj_id}" already exists. '
                 )
 
-            stmt = sa.select(Photometry).where(Photometry.obj_id == obj_id)
-            photometry = session.scalars(stmt).all()
+            photometry = get_phot_stat_columns(session, [obj_id])[obj_id]
 
             phot_stat = PhotStat(obj_id=obj_id)
             phot_stat.full_update(photometry)
@@ -165,8 +202,7 @@ class PhotStatHandler(BaseHandler):
             if phot_stat is None:
                 phot_stat = PhotStat(obj_id=obj_id)
 
-            stmt = sa.select(Photometry).where(Photometry.obj_id == obj_id)
-            photometry = session.scalars(stmt).all()
+            photometry = get_phot_stat_columns(session, [obj_id])[obj_id]
             phot_stat.full_update(photometry)
             session.add(phot_stat)
             session.commit()
@@ -502,11 +538,10 @@ class PhotStatUpdateHandler(BaseHandler):
             objects = session.execute(stmt).scalars().unique().all()
 
             try:
+                photometry = get_phot_stat_columns(session, [obj.id for obj in objects])
                 for i, obj in enumerate(objects):
-                    stmt = sa.select(Photometry).where(Photometry.obj_id == obj.id)
-                    photometry = session.scalars(stmt).all()
                     phot_stat = PhotStat(obj_id=obj.id)
-                    phot_stat.full_update(photometry)
+                    phot_stat.full_update(photometry[obj.id])
                     session.add(phot_stat)
             except Exception as e:
                 return self.error(
@@ -714,10 +749,9 @@ class PhotStatUpdateHandler(BaseHandler):
             objects = session.scalars(stmt).unique().all()
 
             try:
+                photometry = get_phot_stat_columns(session, [obj.id for obj in objects])
                 for i, obj in enumerate(objects):
-                    stmt = sa.select(Photometry).where(Photometry.obj_id == obj.id)
-                    photometry = session.scalars(stmt).all()
-                    obj.photstats[0].full_update(photometry)
+                    obj.photstats[0].full_update(photometry[obj.id])
                     # make sure only one photstats per object
                     for j in range(1, len(obj.photstats)):
                         session.delete(obj.photstats[j])
@@ -538,7 +538,7 @@ class PhotometricSeriesHandler(BaseHandler):
             full_name, path = ps.make_full_name()
 
             # make sure the file does not exist:
-            if os.path.isfile(full_name):
+            if os.path.exists(full_name):
                 return self.error(f'File already exists: {full_name}')
 
             # make sure this file is not already saved using the hash:
@@ -732,7 +732,7 @@ class PhotometricSeriesHandler(BaseHandler):
                 full_name, path = ps.make_full_name()
 
                 # make sure the file does not exist:
-                if prev_filename != full_name and os.path.isfile(full_name):
+                if prev_filename != full_name and os.path.exists(full_name):
                     return self.error(f'New filename already exists: {full_name}')
 
                 # make sure this file is not already saved using the hash:
@@ -767,8 +767,7 @@ class PhotometricSeriesHandler(BaseHandler):
 
             # get rid of the old data, regardless of new name
             try:
-                if os.path.isfile(prev_filename):
-                    os.remove(prev_filename)
+                PhotometricSeries.remove_data_path(prev_filename)
             except Exception:
                 log(
                     f'Could not remove old file {prev_filename}: {traceback.format_exc()}'
@@ -1179,6 +1178,16 @@ class PhotometricSeriesHandler(BaseHandler):
               schema:
                 type: integer
               description: Page number for paginated query results. Defaults to 1
+            - in: query
+              name: includeData
+              nullable: true
+              default: false
+              schema:
+                type: boolean
+              description: |
+                If true, include the photometric data of each series,
+                which is read from disk. Otherwise, only the metadata
+                and summary statistics are returned.
           responses:
             200:
               content:
@@ -1260,6 +1269,11 @@ class PhotometricSeriesHandler(BaseHandler):
         sort_by = self.get_query_argument('sortBy', 'obj_id')
         sort_order = self.get_query_argument('sortOrder', 'asc')
         page_number = self.get_query_argument('pageNumber', 1)
+        include_data = str(self.get_query_argument('includeData', False)).lower() in [
+            'true',
+            't',
+            '1',
+        ]
         num_per_page = min(
             int(self.get_query_argument("numPerPage", DEFAULT_SERIES_PER_PAGE)),
             MAX_SERIES_PER_PAGE,
@@ -1681,7 +1695,7 @@ class PhotometricSeriesHandler(BaseHandler):
             series = session.scalars(stmt).unique().all()
 
             results = {
-                'series': [s.to_dict() for s in series],
+                'series': [s.to_dict(include_data=include_data) for s in series],
                 'totalMatches': total_matches,
                 'numPerPage': num_per_page,
                 'pageNumber': page_number,
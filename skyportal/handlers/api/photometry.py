@@ -1,5 +1,7 @@
 import uuid
 import datetime
+from collections import defaultdict
+import functools
 import json
 from io import StringIO
 import traceback
@@ -15,11 +17,12 @@ import arrow
 
 import sqlalchemy as sa
 from sqlalchemy.sql import column, Values
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy import and_
 
 from baselayer.app.access import permissions, auth_or_token
 from baselayer.app.env import load_env
+from baselayer.app.json_util import to_json
 from baselayer.log import make_log
 from ..base import BaseHandler
 from ...models import (
@@ -44,6 +47,7 @@ from ...models.schema import (
     PhotometryRangeQuery,
 )
 from ...enum_types import ALLOWED_MAGSYSTEMS
+from .phot_stat import get_phot_stat_columns
 
 _, cfg = load_env()
 
@@ -97,111 +101,177 @@ def allscalar(d):
     return all(np.isscalar(v) or v is None for v in d.values())
 
 
-def serialize(phot, outsys, format, created_at=True, groups=True, annotations=True):
+@functools.lru_cache(maxsize=1024)
+def get_zp_correction(outsys, filter, insys='ab'):
+    """Return the offset (in mag) between two magnitude systems in a bandpass.
 
-    return_value = {
-        'obj_id': phot.obj_id,
-        'ra': phot.ra,
-        'dec': phot.dec,
-        'filter': phot.filter,
-        'mjd': phot.mjd,
-        'snr': phot.snr,
-        'instrument_id': phot.instrument_id,
-        'instrument_name': phot.instrument.name,
-        'ra_unc': phot.ra_unc,
-        'dec_unc': phot.dec_unc,
-        'origin': phot.origin,
-        'id': phot.id,
-        'altdata': phot.altdata,
-    }
-    if created_at:
-        return_value['created_at'] = phot.created_at
-    if groups:
-        return_value['groups'] = [group.to_dict() for group in phot.groups]
-    if annotations:
-        return_value['annotations'] = (
-            [annotation.to_dict() for annotation in phot.annotations]
-            if hasattr(phot, 'annotations')
-            else []
-        )
+    The zeropoint band fluxes require integrating the magnitude system
+    spectra over the bandpass, so the result is cached per process for
+    each (outsys, filter, insys) combination.
+
+    Parameters
+    ----------
+    outsys : str
+        Name of the magnitude system to convert to.
+    filter : str
+        Name of the sncosmo bandpass.
+    insys : str, optional
+        Name of the magnitude system to convert from. Defaults to 'ab',
+        the system in which fluxes are stored in the database.
 
-    if (
+    Returns
+    -------
+    float
+        The correction to add to a magnitude in `insys` to express it
+        in `outsys`.
+    """
+
+    # note: these are not the actual zeropoints for magnitudes in the db or
+    # packet, just ones that can be used to derive corrections when
+    # compared to relzp_out
+    relzp_out = 2.5 * np.log10(sncosmo.get_magsystem(outsys).zpbandflux(filter))
+    relzp_in = 2.5 * np.log10(sncosmo.get_magsystem(insys).zpbandflux(filter))
+    return relzp_out - relzp_in
+
+
+def _has_ref_flux(phot):
+    return (
         phot.ref_flux is not None
         and not np.isnan(phot.ref_flux)
         and phot.ref_fluxerr is not None
         and not np.isnan(phot.ref_fluxerr)
-    ):
-        return_value['ref_flux'] = phot.ref_flux
-        return_value['tot_flux'] = phot.tot_flux
-        return_value['ref_fluxerr'] = phot.ref_fluxerr
-        return_value['tot_fluxerr'] = phot.tot_fluxerr
-        return_value['magref'] = phot.magref
-        return_value['magtot'] = phot.magtot
-        return_value['e_magref'] = phot.e_magref
-        return_value['e_magtot'] = phot.e_magtot
+    )
 
-    filter = phot.filter
 
-    magsys_db = sncosmo.get_magsystem('ab')
-    outsys = sncosmo.get_magsystem(outsys)
+def serialize_photometry(
+    photometry, outsys, format, created_at=True, groups=True, annotations=True
+):
+    """Serialize a list of photometry points to a given magnitude system.
 
-    try:
-        relzp_out = 2.5 * np.log10(outsys.zpbandflux(filter))
+    Zeropoint corrections are computed once per filter (and per packet
+    magnitude system), and magnitudes, errors and limiting magnitudes are
+    computed over whole columns.
 
-        # note: these are not the actual zeropoints for magnitudes in the db or
-        # packet, just ones that can be used to derive corrections when
-        # compared to relzp_out
+    Parameters
+    ----------
+    photometry : list of skyportal.models.Photometry
+        Photometry points to serialize.
+    outsys : str
+        Name of the magnitude system of the output.
+    format : str
+        One of 'mag', 'flux' or 'both'.
+    created_at, groups, annotations : bool, optional
+        Whether to include these fields in the output.
 
-        relzp_db = 2.5 * np.log10(magsys_db.zpbandflux(filter))
-        db_correction = relzp_out - relzp_db
+    Returns
+    -------
+    list of dict
+        The serialized photometry points, in input order.
+    """
+
+    if format not in ['mag', 'flux', 'both']:
+        raise ValueError(
+            'Invalid output format specified. Must be one of '
+            f"['flux', 'mag', 'both'], got '{format}'."
+        )
 
-        # this is the zeropoint for fluxes in the database that is tied
-        # to the new magnitude system
-        corrected_db_zp = PHOT_ZP + db_correction
+    photometry = list(photometry)
+    outsys_name = sncosmo.get_magsystem(outsys).name
 
-        if format not in ['mag', 'flux', 'both']:
+    def zp_correction(phot, insys='ab'):
+        try:
+            return get_zp_correction(outsys, phot.filter, insys)
+        except ValueError as e:
             raise ValueError(
-                'Invalid output format specified. Must be one of '
-                f"['flux', 'mag', 'both'], got '{format}'."
+                f"Could not serialize phot_id: {phot.id} "
+                f"on obj {phot.obj_id} with filter: {phot.filter},  "
+                f"due to error: {e}"
             )
 
-        if format in ['mag', 'both']:
-            if (
-                phot.original_user_data is not None
-                and 'limiting_mag' in phot.original_user_data
-            ):
-                magsys_packet = sncosmo.get_magsystem(phot.original_user_data['magsys'])
-                relzp_packet = 2.5 * np.log10(magsys_packet.zpbandflux(filter))
-                packet_correction = relzp_out - relzp_packet
-                maglimit = float(phot.original_user_data['limiting_mag'])
-                maglimit_out = maglimit + packet_correction
-            else:
-                # calculate the limiting mag
-                fluxerr = phot.fluxerr
-                fivesigma = 5 * fluxerr
-                maglimit_out = -2.5 * np.log10(fivesigma) + corrected_db_zp
+    db_correction = np.array([zp_correction(phot) for phot in photometry], dtype=float)
+    # this is the zeropoint for fluxes in the database that is tied
+    # to the new magnitude system
+    corrected_db_zp = PHOT_ZP + db_correction
+
+    flux = np.array([phot.flux for phot in photometry], dtype=float)
+    fluxerr = np.array([phot.fluxerr for phot in photometry], dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        detected = flux > 0
+        mag = np.where(detected, -2.5 * np.log10(flux) + PHOT_ZP, np.nan)
+        mag = mag + db_correction
+        magerr = np.where(
+            detected & (fluxerr > 0), (2.5 / np.log(10)) * (fluxerr / flux), np.nan
+        )
+        limiting_mag = -2.5 * np.log10(5 * fluxerr) + corrected_db_zp
 
+    for i, phot in enumerate(photometry):
+        if (
+            phot.original_user_data is not None
+            and 'limiting_mag' in phot.original_user_data
+        ):
+            packet_correction = zp_correction(phot, phot.original_user_data['magsys'])
+            limiting_mag[i] = (
+                float(phot.original_user_data['limiting_mag']) + packet_correction
+            )
+
+    mag = mag.tolist()
+    magerr = magerr.tolist()
+    limiting_mag = limiting_mag.tolist()
+    corrected_db_zp = corrected_db_zp.tolist()
+
+    output = []
+    for i, phot in enumerate(photometry):
+        return_value = {
+            'obj_id': phot.obj_id,
+            'ra': phot.ra,
+            'dec': phot.dec,
+            'filter': phot.filter,
+            'mjd': phot.mjd,
+            'snr': phot.snr,
+            'instrument_id': phot.instrument_id,
+            'instrument_name': phot.instrument.name,
+            'ra_unc': phot.ra_unc,
+            'dec_unc': phot.dec_unc,
+            'origin': phot.origin,
+            'id': phot.id,
+            'altdata': phot.altdata,
+        }
+        if created_at:
+            return_value['created_at'] = phot.created_at
+        if groups:
+            return_value['groups'] = [group.to_dict() for group in phot.groups]
+        if annotations:
+            return_value['annotations'] = (
+                [annotation.to_dict() for annotation in phot.annotations]
+                if hasattr(phot, 'annotations')
+                else []
+            )
+
+        has_ref_flux = _has_ref_flux(phot)
+        if has_ref_flux:
+            return_value['ref_flux'] = phot.ref_flux
+            return_value['tot_flux'] = phot.tot_flux
+            return_value['ref_fluxerr'] = phot.ref_fluxerr
+            return_value['tot_fluxerr'] = phot.tot_fluxerr
+            return_value['magref'] = phot.magref
+            return_value['magtot'] = phot.magtot
+            return_value['e_magref'] = phot.e_magref
+            return_value['e_magtot'] = phot.e_magtot
+
+        if format in ['mag', 'both']:
             return_value.update(
                 {
-                    'mag': phot.mag + db_correction
-                    if nan_to_none(phot.mag) is not None
-                    else None,
-                    'magerr': phot.e_mag
-                    if nan_to_none(phot.e_mag) is not None
-                    else None,
-                    'magsys': outsys.name,
-                    'limiting_mag': maglimit_out,
+                    'mag': nan_to_none(mag[i]),
+                    'magerr': nan_to_none(magerr[i]),
+                    'magsys': outsys_name,
+                    'limiting_mag': limiting_mag[i],
                 }
             )
-            if (
-                phot.ref_flux is not None
-                and not np.isnan(phot.ref_flux)
-                and phot.ref_fluxerr is not None
-                and not np.isnan(phot.ref_fluxerr)
-            ):
+            if has_ref_flux:
                 return_value.update(
                     {
-                        'magref': phot.magref + db_correction
+                        'magref': phot.magref + db_correction[i]
                         if nan_to_none(phot.magref) is not None
                         else None,
                         'magtot': phot.magtot,
@@ -214,17 +284,12 @@ def serialize(phot, outsys, format, created_at=True, groups=True, annotations=Tr
             return_value.update(
                 {
                     'flux': nan_to_none(phot.flux),
-                    'magsys': outsys.name,
-                    'zp': corrected_db_zp,
+                    'magsys': outsys_name,
+                    'zp': corrected_db_zp[i],
                     'fluxerr': phot.fluxerr,
                 }
             )
-            if (
-                phot.ref_flux is not None
-                and not np.isnan(phot.ref_flux)
-                and phot.ref_fluxerr is not None
-                and not np.isnan(phot.ref_fluxerr)
-            ):
+            if has_ref_flux:
                 return_value.update(
                     {
                         'ref_flux': phot.ref_flux,
@@ -233,13 +298,128 @@ def serialize(phot, outsys, format, created_at=True, groups=True, annotations=Tr
                         'tot_fluxerr': phot.tot_fluxerr,
                     }
                 )
-    except ValueError as e:
+
+        output.append(return_value)
+
+    return output
+
+
+def serialize(phot, outsys, format, created_at=True, groups=True, annotations=True):
+    """Serialize a single photometry point, see `serialize_photometry`."""
+    return serialize_photometry(
+        [phot],
+        outsys,
+        format,
+        created_at=created_at,
+        groups=groups,
+        annotations=annotations,
+    )[0]
+
+
+PHOTOMETRY_STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+PHOTOMETRY_STREAM_BATCH_SIZE = 10000
+
+
+def _photometry_csv_columns(format):
+    """Flat (non-nested) columns of the serialized photometry, for CSV output."""
+    columns = [
+        'id',
+        'obj_id',
+        'instrument_id',
+        'instrument_name',
+        'mjd',
+        'filter',
+        'ra',
+        'dec',
+        'ra_unc',
+        'dec_unc',
+        'snr',
+        'origin',
+        'created_at',
+    ]
+    if format in ['mag', 'both']:
+        columns += ['mag', 'magerr', 'limiting_mag']
+    if format in ['flux', 'both']:
+        columns += ['flux', 'fluxerr', 'zp']
+    columns += ['magsys', 'ref_flux', 'ref_fluxerr', 'tot_flux', 'tot_fluxerr']
+    columns += ['magref', 'e_magref', 'magtot', 'e_magtot']
+    return columns
+
+
+def stream_photometry(
+    session,
+    stmt,
+    outsys,
+    format,
+    output_format='ndjson',
+    period=None,
+    batch_size=PHOTOMETRY_STREAM_BATCH_SIZE,
+):
+    """Serialize the photometry selected by a statement, batch by batch.
+
+    Rows are fetched through a server-side cursor, `batch_size` at a time,
+    and each batch is serialized with `serialize_photometry` before being
+    yielded, so that memory usage does not grow with the number of points.
+
+    Parameters
+    ----------
+    session : sqlalchemy.Session
+        Database session for this transaction.
+    stmt : sqlalchemy.sql.Select
+        Statement selecting the Photometry to serialize.
+    outsys : str
+        Name of the magnitude system of the output.
+    format : str
+        One of 'mag', 'flux' or 'both'.
+    output_format : str, optional
+        One of PHOTOMETRY_STREAM_FORMATS: 'ndjson' (one JSON document
+        per line) or 'csv'.
+    period : float, optional
+        If provided, a 'phase' column is added, folded at this period.
+    batch_size : int, optional
+        Number of photometry points fetched and serialized at once.
+
+    Yields
+    ------
+    str
+        The serialized photometry, one chunk per batch.
+    """
+
+    if output_format not in PHOTOMETRY_STREAM_FORMATS:
         raise ValueError(
-            f"Could not serialize phot_id: {phot.id} "
-            f"on obj {phot.obj_id} with filter: {filter},  "
-            f"due to error: {e}"
+            'Invalid streaming format specified. Must be one of '
+            f"{list(PHOTOMETRY_STREAM_FORMATS)}, got '{output_format}'."
+        )
+    nested = output_format == 'ndjson'
+    columns = _photometry_csv_columns(format) + (['phase'] if period else [])
+
+    options = [selectinload(Photometry.instrument)]
+    if nested:
+        options += [
+            selectinload(Photometry.groups),
+            selectinload(Photometry.annotations),
+        ]
+    result = session.execute(
+        stmt.options(*options).execution_options(yield_per=batch_size)
+    )
+    for i, photometry in enumerate(result.scalars().partitions()):
+        rows = serialize_photometry(
+            photometry, outsys, format, groups=nested, annotations=nested
         )
-    return return_value
+        if period:
+            phases = np.mod([row['mjd'] for row in rows], period) / period
+            for row, phase in zip(rows, phases.tolist()):
+                row['phase'] = phase
+
+        if output_format == 'ndjson':
+            yield ''.join(f'{to_json(row)}\n' for row in rows)
+        else:
+            yield pd.DataFrame(rows, columns=columns).to_csv(
+                index=False, header=(i == 0)
+            )
 
 
 def standardize_photometry_data(data):
@@ -534,6 +714,69 @@ def get_values_table_and_condition(df):
     return values_table, condition
 
 
+def update_phot_stats(params, session, max_incremental_points=50):
+    """Update the PhotStats of all objects that received new photometry.
+
+    New points are grouped by object. Objects without a PhotStat, or that
+    got more than `max_incremental_points` new points, are recalculated
+    from scratch, using a single column-only query for the photometry of
+    all these objects. The other objects are updated point by point.
+
+    Parameters
+    ----------
+    params : list of dict
+        The newly inserted photometry rows (need at least obj_id, mjd,
+        filter, flux, fluxerr and original_user_data).
+    session : sqlalchemy.Session
+        Database session for this transaction. The updated PhotStats are
+        added to it, but the session is not committed.
+    max_incremental_points : int, optional
+        Maximum number of new points for an object to be updated point
+        by point rather than fully recalculated.
+
+    Returns
+    -------
+    list of skyportal.models.PhotStat
+        The updated PhotStats.
+    """
+
+    new_points = defaultdict(list)
+    for phot in params:
+        new_points[phot['obj_id']].append(phot)
+    obj_ids = list(new_points)
+    if len(obj_ids) == 0:
+        return []
+
+    phot_stats = {
+        phot_stat.obj_id: phot_stat
+        for phot_stat in session.scalars(
+            sa.select(PhotStat).where(PhotStat.obj_id.in_(obj_ids))
+        ).all()
+    }
+
+    # if there are a lot of new points, should just
+    # pull up all the photometry and recalculate
+    # instead of adding them one-by-one
+    full_update_ids = [
+        obj_id
+        for obj_id in obj_ids
+        if obj_id not in phot_stats or len(new_points[obj_id]) > max_incremental_points
+    ]
+    all_phot = get_phot_stat_columns(session, full_update_ids)
+
+    for obj_id in obj_ids:
+        if obj_id in full_update_ids:
+            if obj_id not in phot_stats:
+                phot_stats[obj_id] = PhotStat(obj_id=obj_id)
+            phot_stats[obj_id].full_update(all_phot[obj_id])
+        else:
+            for phot in new_points[obj_id]:
+                phot_stats[obj_id].add_photometry_point(phot)
+
+    session.add_all(phot_stats.values())
+    return list(phot_stats.values())
+
+
 def insert_new_photometry_data(
     df, instrument_cache, group_ids, stream_ids, user, session, validate=True
 ):
@@ -694,29 +937,8 @@ def insert_new_photometry_data(
             ('photometr_id', 'stream_id', 'created_at', 'modified'),
         )
 
-    # add a phot stats for each photometry
-    obj_id = phot['obj_id']
-    phot_stat = session.scalars(
-        sa.select(PhotStat).where(PhotStat.obj_id == obj_id)
-    ).first()
-    # if there are a lot of new points, should just
-    # pull up all the photometry and recalculate
-    # instead of adding them one-by-one
-    if phot_stat is None or len(params) > 50:
-        all_phot = session.scalars(
-            sa.select(Photometry).where(Photometry.obj_id == obj_id)
-        ).all()
-
-        if phot_stat is None:
-            phot_stat = PhotStat(obj_id=obj_id)
-
-        phot_stat.full_update(all_phot)
-
-    else:
-        for phot in params:
-            phot_stat.add_photometry_point(phot)
-
-    session.add(phot_stat)
+    # update the phot stats of every object that got new photometry
+    update_phot_stats(params, session)
     session.commit()  # add the updated phot_stats
     return ids, upload_id
 
@@ -1256,12 +1478,8 @@ class PhotometryHandler(BaseHandler):
             if phot_stat is None:
                 phot_stat = PhotStat(obj_id=photometry.obj_id)
 
-            all_phot = session.scalars(
-                sa.select(Photometry).where(Photometry.obj_id == photometry.obj_id)
-            ).all()
-            phot_stat.full_update(all_phot)
-            for phot in all_phot:
-                session.expunge(phot)
+            all_phot = get_phot_stat_columns(session, [photometry.obj_id])
+            phot_stat.full_update(all_phot[photometry.obj_id])
 
             session.commit()
 
@@ -1313,10 +1531,8 @@ class PhotometryHandler(BaseHandler):
                 )
             ).first()
             if phot_stat is not None:
-                all_phot = session.scalars(
-                    sa.select(Photometry).where(Photometry.obj_id == photometry.obj_id)
-                ).all()
-                phot_stat.full_update(all_phot)
+                all_phot = get_phot_stat_columns(session, [obj_id])
+                phot_stat.full_update(all_phot[obj_id])
 
             session.commit()
 
@@ -1330,10 +1546,31 @@ class PhotometryHandler(BaseHandler):
 
 class ObjPhotometryHandler(BaseHandler):
     @auth_or_token
-    def get(self, obj_id):
+    async def get(self, obj_id):
         phase_fold_data = self.get_query_argument("phaseFoldData", False)
         format = self.get_query_argument('format', 'mag')
         outsys = self.get_query_argument('magsys', 'ab')
+        stream = self.get_query_argument('stream', False) in [
+            'True',
+            't',
+            'true',
+            '1',
+            True,
+        ]
+        stream_format = self.get_query_argument('streamFormat', 'ndjson')
+
+        if stream:
+            # errors cannot be reported once the response has started streaming
+            if format not in ['mag', 'flux', 'both']:
+                return self.error(
+                    f"Invalid output format {format}, must be one of "
+                    "['flux', 'mag', 'both']"
+                )
+            if stream_format not in PHOTOMETRY_STREAM_FORMATS:
+                return self.error(
+                    f'Invalid streamFormat {stream_format}, must be one of '
+                    f'{list(PHOTOMETRY_STREAM_FORMATS)}'
+                )
 
         with self.Session() as session:
 
@@ -1346,20 +1583,9 @@ class ObjPhotometryHandler(BaseHandler):
                     status=403,
                 )
 
-            photometry = (
-                session.scalars(
-                    Photometry.select(session.user_or_token)
-                    .where(Photometry.obj_id == obj_id)
-                    .distinct()
-                )
-                .unique()
-                .all()
-            )
-
-            data = [serialize(phot, outsys, format) for phot in photometry]
-
+            period = None
             if phase_fold_data:
-                period, modified = None, arrow.Arrow(1, 1, 1)
+                modified = arrow.Arrow(1, 1, 1)
 
                 annotations = session.scalars(
                     Annotation.select(session.user_or_token).where(
@@ -1375,7 +1601,34 @@ class ObjPhotometryHandler(BaseHandler):
                             period = an.data[period_str]
                             modified = arrow.get(an.modified)
                 if period is None:
-                    self.error(f'No period for object {obj_id}')
+                    return self.error(f'No period for object {obj_id}')
+
+            stmt = (
+                Photometry.select(session.user_or_token)
+                .where(Photometry.obj_id == obj_id)
+                .distinct()
+            )
+
+            if stream:
+                chunks = stream_photometry(
+                    session,
+                    stmt.order_by(Photometry.mjd),
+                    outsys,
+                    format,
+                    output_format=stream_format,
+                    period=period,
+                )
+                return await self.send_stream(
+                    chunks,
+                    PHOTOMETRY_STREAM_FORMATS[stream_format],
+                    filename=f'{obj_id}_photometry.{stream_format}',
+                )
+
+            photometry = session.scalars(stmt).unique().all()
+
+            data = serialize_photometry(photometry, outsys, format)
+
+            if period is not None:
                 for ii in range(len(data)):
                     data[ii]['phase'] = np.mod(data[ii]['mjd'], period) / period
 
@@ -1422,16 +1675,14 @@ class BulkDeletePhotometryHandler(BaseHandler):
                 session.delete(phot)
 
             obj_ids = {phot.obj_id for phot in photometry_to_delete}
+            all_phot = get_phot_stat_columns(session, obj_ids)
             for oid in obj_ids:
                 stat = session.scalars(
                     PhotStat.select(session.user_or_token, mode="update").where(
                         PhotStat.obj_id == oid
                     )
                 ).first()
-                all_phot = session.scalars(
-                    sa.select(Photometry).where(Photometry.obj_id == oid)
-                ).all()
-                stat.full_update(all_phot)
+                stat.full_update(all_phot[oid])
 
             session.commit()
             return self.success(f"Deleted {n} photometry points.")
@@ -1484,10 +1735,9 @@ class PhotometryRangeHandler(BaseHandler):
                 group_phot_subquery, Photometry.id == group_phot_subquery.c.photometr_id
             )
 
-            output = [
-                serialize(p, magsys, format)
-                for p in session.scalars(query.distinct()).unique().all()
-            ]
+            output = serialize_photometry(
+                session.scalars(query.distinct()).unique().all(), magsys, format
+            )
             return self.success(data=output)
 
 
@@ -1602,6 +1852,26 @@ ObjPhotometryHandler.get.__doc__ = f"""
               type: boolean
             description: |
               Boolean indicating whether to phase fold the light curve. Defaults to false.
+          - in: query
+            name: stream
+            nullable: true
+            schema:
+              type: boolean
+            description: |
+              Boolean indicating whether to stream the photometry in batches
+              (chunked transfer encoding) rather than returning a single JSON
+              document. Recommended for objects with very large light curves.
+              Defaults to false.
+          - in: query
+            name: streamFormat
+            nullable: true
+            schema:
+              type: string
+              enum: {list(PHOTOMETRY_STREAM_FORMATS)}
+            description: |
+              Format of the streamed photometry: newline-delimited JSON (one
+              photometry point per line) or CSV. Only used if stream is true.
+              Defaults to ndjson.
         responses:
           200:
             content:
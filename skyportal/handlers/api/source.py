@@ -8,6 +8,7 @@ from astroplan import (
     is_event_observable,
 )
 import datetime
+from collections import defaultdict
 from json.decoder import JSONDecodeError
 import astropy.units as u
 from geojson import Point, Feature
@@ -18,7 +19,7 @@ import io
 from dateutil.parser import isoparse
 import numpy as np
 import sqlalchemy as sa
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy import func, or_, distinct
 from sqlalchemy.dialects.postgresql import JSONB
@@ -91,7 +92,7 @@ from .candidate import (
     update_healpix_if_relevant,
     add_linked_thumbnails_and_push_ws_msg,
 )
-from .photometry import serialize
+from .photometry import serialize_photometry
 from .color_mag import get_color_mag
 
 DEFAULT_SOURCES_PER_PAGE = 100
@@ -318,9 +319,7 @@ async def get_source(
             .unique()
             .all()
         )
-        source_info["photometry"] = [
-            serialize(phot, 'ab', 'flux') for phot in photometry
-        ]
+        source_info["photometry"] = serialize_photometry(photometry, 'ab', 'flux')
     if include_photometry_exists:
         source_info["photometry_exists"] = (
             session.scalars(
@@ -390,6 +389,240 @@ def create_annotations_query(
     return annotations_query
 
 
+def _group_by_obj_id(rows):
+    """Bucket the results of a batched query by obj_id, preserving order."""
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.obj_id].append(row)
+    return grouped
+
+
+def hydrate_sources(
+    session,
+    objs,
+    include_thumbnails=False,
+    include_comments=False,
+    include_photometry_exists=False,
+    include_spectrum_exists=False,
+    include_period_exists=False,
+    include_labellers=False,
+    include_requested=False,
+    requested_only=False,
+    include_color_mag=False,
+    remove_nested=False,
+):
+    """Serialize a page of Objs along with their related data.
+
+    Each relation is fetched for all objs of the page at once (one query
+    per relation, still subject to the access rules of
+    session.user_or_token) and stitched back onto the individual objs,
+    so that the number of queries does not grow with the page size.
+
+    Parameters
+    ----------
+    session: sqlalchemy.Session
+        Database session for this transaction
+    objs : list of skyportal.models.Obj
+        Objs to serialize, in the order they should be returned
+    See get_sources for the optional arguments
+
+    Returns
+    -------
+    list of dict
+        One serialized Obj per entry of objs
+    """
+
+    obj_ids = [obj.id for obj in objs]
+    if len(obj_ids) == 0:
+        return []
+
+    if include_comments:
+        comments = _group_by_obj_id(
+            session.scalars(
+                Comment.select(session.user_or_token).where(Comment.obj_id.in_(obj_ids))
+            ).all()
+        )
+
+    if include_thumbnails and not remove_nested:
+        thumbnails = _group_by_obj_id(
+            session.scalars(
+                Thumbnail.select(session.user_or_token).where(
+                    Thumbnail.obj_id.in_(obj_ids)
+                )
+            ).all()
+        )
+
+    if not remove_nested:
+        classifications = _group_by_obj_id(
+            session.scalars(
+                Classification.select(
+                    session.user_or_token,
+                    options=[
+                        selectinload(Classification.groups),
+                        selectinload(Classification.votes),
+                    ],
+                ).where(Classification.obj_id.in_(obj_ids))
+            )
+            .unique()
+            .all()
+        )
+
+    if not remove_nested or include_period_exists:
+        annotations = _group_by_obj_id(
+            session.scalars(
+                Annotation.select(session.user_or_token).where(
+                    Annotation.obj_id.in_(obj_ids)
+                )
+            )
+            .unique()
+            .all()
+        )
+
+    if include_labellers:
+        labels = session.execute(
+            SourceLabel.select(
+                session.user_or_token,
+                columns=[SourceLabel.obj_id, SourceLabel.labeller_id],
+            ).where(SourceLabel.obj_id.in_(obj_ids))
+        ).all()
+        labellers = {
+            user.id: user
+            for user in session.scalars(
+                User.select(session.user_or_token).where(
+                    User.id.in_(list({label.labeller_id for label in labels}))
+                )
+            )
+            .unique()
+            .all()
+        }
+        obj_labellers = defaultdict(dict)
+        for label in labels:
+            if label.labeller_id in labellers:
+                obj_labellers[label.obj_id][label.labeller_id] = labellers[
+                    label.labeller_id
+                ]
+
+    if include_photometry_exists:
+        obj_ids_with_photometry = set(
+            session.scalars(
+                Photometry.select(session.user_or_token, columns=[Photometry.obj_id])
+                .where(Photometry.obj_id.in_(obj_ids))
+                .distinct()
+            ).all()
+        )
+
+    if include_spectrum_exists:
+        obj_ids_with_spectra = set(
+            session.scalars(
+                Spectrum.select(session.user_or_token, columns=[Spectrum.obj_id])
+                .where(Spectrum.obj_id.in_(obj_ids))
+                .distinct()
+            ).all()
+        )
+
+    if not remove_nested:
+        source_query = Source.select(
+            session.user_or_token, options=[joinedload(Source.saved_by)]
+        ).where(Source.obj_id.in_(obj_ids))
+        source_query = apply_active_or_requested_filtering(
+            source_query, include_requested, requested_only
+        )
+        sources = _group_by_obj_id(session.scalars(source_query).unique().all())
+        groups = {
+            group.id: group
+            for group in session.scalars(
+                Group.select(session.user_or_token).where(
+                    Group.id.in_(
+                        list(
+                            {
+                                source.group_id
+                                for obj_sources in sources.values()
+                                for source in obj_sources
+                            }
+                        )
+                    )
+                )
+            )
+            .unique()
+            .all()
+        }
+
+    derived_columns = Obj.derived_columns(objs)
+
+    obj_list = []
+    for obj, obj_derived_columns in zip(objs, derived_columns):
+        obj_dict = obj.to_dict()
+
+        if include_comments:
+            obj_dict["comments"] = sorted(
+                (
+                    {k: v for k, v in c.to_dict().items() if k != "attachment_bytes"}
+                    for c in comments[obj.id]
+                ),
+                key=lambda x: x["created_at"],
+                reverse=True,
+            )
+
+        if include_thumbnails and not remove_nested:
+            obj_dict["thumbnails"] = thumbnails[obj.id]
+
+        if not remove_nested:
+            readable_classifications_json = []
+            for classification in classifications[obj.id]:
+                classification_dict = classification.to_dict()
+                classification_dict['groups'] = [
+                    g.to_dict() for g in classification.groups
+                ]
+                classification_dict['votes'] = [
+                    g.to_dict() for g in classification.votes
+                ]
+                readable_classifications_json.append(classification_dict)
+
+            obj_dict["classifications"] = readable_classifications_json
+
+            obj_dict["annotations"] = sorted(
+                annotations[obj.id], key=lambda x: x.origin
+            )
+
+        obj_dict.update(obj_derived_columns)
+
+        if include_labellers:
+            obj_dict["labellers"] = [
+                user.to_dict() for user in obj_labellers[obj.id].values()
+            ]
+
+        if include_photometry_exists:
+            obj_dict["photometry_exists"] = obj.id in obj_ids_with_photometry
+        if include_spectrum_exists:
+            obj_dict["spectrum_exists"] = obj.id in obj_ids_with_spectra
+        if include_period_exists:
+            obj_dict["period_exists"] = any(
+                isinstance(an.data, dict) and 'period' in an.data
+                for an in annotations[obj.id]
+            )
+
+        if not remove_nested:
+            obj_dict["groups"] = []
+            for source in sources[obj.id]:
+                if source.group_id not in groups:
+                    continue
+                group = groups[source.group_id].to_dict()
+                group["active"] = source.active
+                group["requested"] = source.requested
+                group["saved_at"] = source.saved_at
+                group["saved_by"] = (
+                    source.saved_by.to_dict() if source.saved_by is not None else None
+                )
+                obj_dict["groups"].append(group)
+
+        if include_color_mag:
+            obj_dict["color_magnitude"] = get_color_mag(obj_dict["annotations"])
+
+        obj_list.append(obj_dict)
+
+    return obj_list
+
+
 async def get_sources(
     user_id,
     session,
@@ -1254,6 +1487,9 @@ async def get_sources(
                 include_detection_stats=include_detection_stats,
                 use_cache=True,
                 current_user=user,
+                cache_group_ids=(
+                    group_ids if group_ids is not None else user_accessible_group_ids
+                ),
             )
         except ValueError as e:
             if "Page number out of range" in str(e):
@@ -1261,170 +1497,20 @@ async def get_sources(
             raise
 
         # Records are Objs, not Sources
-        obj_list = []
-
-        for result in query_results["sources"]:
-            (obj,) = result
-            obj_list.append(obj.to_dict())
-
-            if include_comments:
-                obj_list[-1]["comments"] = sorted(
-                    (
-                        {
-                            k: v
-                            for k, v in c.to_dict().items()
-                            if k != "attachment_bytes"
-                        }
-                        for c in session.scalars(
-                            Comment.select(session.user_or_token).where(
-                                Comment.obj_id == obj.id
-                            )
-                        ).all()
-                    ),
-                    key=lambda x: x["created_at"],
-                    reverse=True,
-                )
-
-            if include_thumbnails and not remove_nested:
-                obj_list[-1]["thumbnails"] = session.scalars(
-                    Thumbnail.select(session.user_or_token).where(
-                        Thumbnail.obj_id == obj.id
-                    )
-                ).all()
-
-            if not remove_nested:
-                readable_classifications = (
-                    session.scalars(
-                        Classification.select(session.user_or_token).where(
-                            Classification.obj_id == obj.id
-                        )
-                    )
-                    .unique()
-                    .all()
-                )
-
-                readable_classifications_json = []
-                for classification in readable_classifications:
-                    classification_dict = classification.to_dict()
-                    classification_dict['groups'] = [
-                        g.to_dict() for g in classification.groups
-                    ]
-                    classification_dict['votes'] = [
-                        g.to_dict() for g in classification.votes
-                    ]
-                    readable_classifications_json.append(classification_dict)
-
-                obj_list[-1]["classifications"] = readable_classifications_json
-
-                obj_list[-1]["annotations"] = sorted(
-                    session.scalars(
-                        Annotation.select(session.user_or_token).where(
-                            Annotation.obj_id == obj.id
-                        )
-                    )
-                    .unique()
-                    .all(),
-                    key=lambda x: x.origin,
-                )
-
-            obj_list[-1]["gal_lon"] = obj.gal_lon_deg
-            obj_list[-1]["gal_lat"] = obj.gal_lat_deg
-            obj_list[-1]["luminosity_distance"] = obj.luminosity_distance
-            obj_list[-1]["dm"] = obj.dm
-            obj_list[-1]["angular_diameter_distance"] = obj.angular_diameter_distance
-            if include_labellers:
-                labels_subquery = (
-                    SourceLabel.select(session.user_or_token)
-                    .where(SourceLabel.obj_id == obj.id)
-                    .subquery()
-                )
-
-                users = (
-                    session.scalars(
-                        User.select(session.user_or_token).join(
-                            labels_subquery,
-                            User.id == labels_subquery.c.labeller_id,
-                        )
-                    )
-                    .unique()
-                    .all()
-                )
-
-                obj_list[-1]["labellers"] = [user.to_dict() for user in users]
-
-            if include_photometry_exists:
-                stmt = Photometry.select(session.user_or_token).where(
-                    Photometry.obj_id == obj.id
-                )
-                count_stmt = sa.select(func.count()).select_from(stmt.distinct())
-                total_phot = session.execute(count_stmt).scalar()
-                obj_list[-1]["photometry_exists"] = total_phot > 0
-            if include_spectrum_exists:
-                stmt = Spectrum.select(session.user_or_token).where(
-                    Spectrum.obj_id == obj.id
-                )
-                count_stmt = sa.select(func.count()).select_from(stmt.distinct())
-                total_spectrum = session.execute(count_stmt).scalar()
-                obj_list[-1]["spectrum_exists"] = total_spectrum > 0
-            if include_period_exists:
-                annotations = (
-                    session.scalars(
-                        Annotation.select(session.user_or_token).where(
-                            Annotation.obj_id == obj.id
-                        )
-                    )
-                    .unique()
-                    .all()
-                )
-                period_str_options = ['period', 'Period', 'PERIOD']
-                obj_list[-1]["period_exists"] = any(
-                    [
-                        isinstance(an.data, dict) and 'period' in an.data
-                        for an in annotations
-                        for period_str in period_str_options
-                    ]
-                )
-            if not remove_nested:
-                source_query = Source.select(session.user_or_token).where(
-                    Source.obj_id == obj_list[-1]["id"]
-                )
-                source_query = apply_active_or_requested_filtering(
-                    source_query, include_requested, requested_only
-                )
-                source_subquery = source_query.subquery()
-                groups = (
-                    session.scalars(
-                        Group.select(session.user_or_token).join(
-                            source_subquery, Group.id == source_subquery.c.group_id
-                        )
-                    )
-                    .unique()
-                    .all()
-                )
-                obj_list[-1]["groups"] = [g.to_dict() for g in groups]
-
-                for group in obj_list[-1]["groups"]:
-                    source_table_row = session.scalars(
-                        Source.select(session.user_or_token).where(
-                            Source.obj_id == obj_list[-1]["id"],
-                            Source.group_id == group["id"],
-                        )
-                    ).first()
-                    if source_table_row is not None:
-                        group["active"] = source_table_row.active
-                        group["requested"] = source_table_row.requested
-                        group["saved_at"] = source_table_row.saved_at
-                        group["saved_by"] = (
-                            source_table_row.saved_by.to_dict()
-                            if source_table_row.saved_by is not None
-                            else None
-                        )
-
-            if include_color_mag:
-                obj_list[-1]["color_magnitude"] = get_color_mag(
-                    obj_list[-1]["annotations"]
-                )
-        query_results["sources"] = obj_list
+        query_results["sources"] = hydrate_sources(
+            session,
+            [obj for (obj,) in query_results["sources"]],
+            include_thumbnails=include_thumbnails,
+            include_comments=include_comments,
+            include_photometry_exists=include_photometry_exists,
+            include_spectrum_exists=include_spectrum_exists,
+            include_period_exists=include_period_exists,
+            include_labellers=include_labellers,
+            include_requested=include_requested,
+            requested_only=requested_only,
+            include_color_mag=include_color_mag,
+            remove_nested=remove_nested,
+        )
 
     query_results = recursive_to_dict(query_results)
     if includeGeoJSON:
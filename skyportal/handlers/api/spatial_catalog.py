@@ -2,11 +2,15 @@ from tornado.ioloop import IOLoop
 import sqlalchemy as sa
 from sqlalchemy import func
 from sqlalchemy.orm import sessionmaker, scoped_session
+import datetime
 from io import StringIO
+import json
+import numpy as np
 import pandas as pd
 import time
 
 from baselayer.app.access import permissions, auth_or_token
+from baselayer.app.env import load_env
 from baselayer.app.flow import Flow
 from baselayer.log import make_log
 
@@ -17,10 +21,15 @@ from ...models import (
     SpatialCatalogEntry,
     SpatialCatalogEntryTile,
 )
-from ...utils.gcn import (
-    from_cone,
-    from_ellipse,
+from ...utils.spatial_catalog import (
+    ENTRIES_CHUNK_SIZE,
+    REGION_COLUMNS,
+    catalog_shape,
+    catalog_skymaps,
 )
+from ...utils.tiles import copy_tiles, uniq_to_ranges
+
+_, cfg = load_env()
 
 log = make_log('api/spatial_catalog')
 
@@ -29,6 +38,72 @@ Session = scoped_session(sessionmaker())
 MAX_SPATIAL_CATALOG_ENTRIES = 1000
 
 
+def copy_catalog_entries(session, catalog_id, entries, skymaps):
+    """
+    Insert catalog entries and their tiles with COPY.
+
+    The rows are written in the current transaction of the session,
+    which must be committed by the caller.
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.Session
+        Database session.
+    catalog_id : int
+        ID of the SpatialCatalog.
+    entries : pandas.DataFrame
+        Entries, with a name column and the columns
+        saved as the data of each entry.
+    skymaps : list of tuple
+        The uniq and probdensity arrays of each entry.
+    """
+    utcnow = datetime.datetime.utcnow().isoformat()
+    df = pd.DataFrame(
+        {
+            'created_at': utcnow,
+            'modified': utcnow,
+            'catalog_id': catalog_id,
+            'entry_name': entries['name'].to_numpy(),
+            'data': [
+                json.dumps(data)
+                for data in entries.drop(columns=['name']).to_dict(orient='records')
+            ],
+            'uniq': [
+                '{' + ','.join(map(str, uniq.tolist())) + '}' for uniq, _ in skymaps
+            ],
+            'probdensity': [
+                '{' + ','.join(map(repr, probdensity.tolist())) + '}'
+                for _, probdensity in skymaps
+            ],
+        }
+    )
+
+    output = StringIO()
+    df.to_csv(output, index=False, header=False)
+    output.seek(0)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f'COPY {SpatialCatalogEntry.__table__.name} ({", ".join(df.columns)}) '
+            'FROM STDIN WITH (FORMAT csv)',
+            output,
+        )
+    finally:
+        cursor.close()
+
+    lower, upper = uniq_to_ranges(np.concatenate([uniq for uniq, _ in skymaps]))
+    copy_tiles(
+        session,
+        SpatialCatalogEntryTile,
+        lower,
+        upper,
+        entry_name=np.repeat(
+            df['entry_name'].to_numpy(), [len(uniq) for uniq, _ in skymaps]
+        ),
+        probdensity=np.concatenate([probdensity for _, probdensity in skymaps]),
+    )
+
+
 def add_catalog(catalog_id, catalog_data):
 
     log(f"Generating catalog with ID {catalog_id}")
@@ -40,70 +115,55 @@ def add_catalog(catalog_id, catalog_data):
         session = Session(bind=DBSession.session_factory.kw["bind"])
 
     try:
-        entries = []
-        # check for cone key
-        if {'radius'}.issubset(set(catalog_data.keys())):
-            for ra, dec, name, radius in zip(
-                catalog_data['ra'],
-                catalog_data['dec'],
-                catalog_data['name'],
-                catalog_data['radius'],
-            ):
-                name = name.strip().replace(" ", "-")
-                skymap = from_cone(ra, dec, radius, n_sigma=2)
-                del skymap['localization_name']
-                skymap['entry_name'] = name
-
-                data = {'ra': ra, 'dec': dec, 'radius': radius}
-
-                entry = SpatialCatalogEntry(
-                    **{**skymap, 'catalog_id': catalog_id, 'data': data}
-                )
-                entries.append(entry)
-        elif {'amaj', 'amin', 'phi'}.issubset(set(catalog_data.keys())):
-            for ra, dec, name, amaj, amin, phi in zip(
-                catalog_data['ra'],
-                catalog_data['dec'],
-                catalog_data['name'],
-                catalog_data['amaj'],
-                catalog_data['amin'],
-                catalog_data['phi'],
-            ):
-
-                name = name.strip().replace(" ", "-")
-                skymap = from_ellipse(name, ra, dec, amaj, amin, phi)
-                skymap['entry_name'] = skymap['localization_name']
-                del skymap['localization_name']
-
-                data = {'ra': ra, 'dec': dec, 'amaj': amaj, 'amin': amin, 'phi': phi}
-
-                entry = SpatialCatalogEntry(
-                    **{**skymap, 'catalog_id': catalog_id, 'data': data}
-                )
-                entries.append(entry)
-
-        else:
-            return ValueError('Could not disambiguate keys')
-
-        session.add_all(entries)
-        session.commit()
-
-        for entry in entries:
-            tiles = [
-                SpatialCatalogEntryTile(
-                    entry_name=entry.entry_name, healpix=uniq, probdensity=probdensity
+        shape = catalog_shape(catalog_data)
+        if shape is None:
+            raise ValueError('Could not disambiguate keys')
+
+        entries = pd.DataFrame(
+            {
+                key: catalog_data[key]
+                for key in ['name', 'ra', 'dec'] + REGION_COLUMNS[shape]
+            }
+        )
+        entries['name'] = entries['name'].str.strip().str.replace(" ", "-")
+
+        # entries already in the catalog (e.g., from an interrupted
+        # ingestion of the same data) are skipped
+        existing = set(
+            session.scalars(
+                sa.select(SpatialCatalogEntry.entry_name).where(
+                    SpatialCatalogEntry.catalog_id == catalog_id
                 )
-                for uniq, probdensity in zip(entry.uniq, entry.probdensity)
-            ]
-
-            session.add_all(tiles)
-        session.commit()
-
-        flow = Flow()
-        flow.push(
-            '*',
-            "skyportal/REFRESH_SPATIAL_CATALOGS",
+            ).all()
         )
+        n_entries = len(entries)
+        entries = entries[~entries['name'].isin(existing)]
+        n_done = n_entries - len(entries)
+        if n_done > 0:
+            log(f"Catalog with ID {catalog_id}: {n_done} entries already ingested")
+
+        chunks = [
+            entries.iloc[i : i + ENTRIES_CHUNK_SIZE]
+            for i in range(0, len(entries), ENTRIES_CHUNK_SIZE)
+        ]
+        flow = Flow()
+        for chunk, skymaps in zip(
+            chunks,
+            catalog_skymaps(
+                shape,
+                chunks,
+                max_processes=cfg.get('misc.max_spatial_catalog_processes', 4),
+            ),
+        ):
+            copy_catalog_entries(session, catalog_id, chunk, skymaps)
+            session.commit()
+
+            n_done += len(chunk)
+            log(f"Catalog with ID {catalog_id}: {n_done}/{n_entries} entries ingested")
+            flow.push(
+                '*',
+                "skyportal/REFRESH_SPATIAL_CATALOGS",
+            )
 
         end = time.time()
         duration = end - start
@@ -208,9 +268,7 @@ class SpatialCatalogHandler(BaseHandler):
             return self.error("declination should span -90<dec<90.")
 
         # check for cone or ellipse keys
-        if (not {'radius'}.issubset(set(catalog_data.keys()))) and (
-            not {'amaj', 'amin', 'phi'}.issubset(set(catalog_data.keys()))
-        ):
+        if catalog_shape(catalog_data) is None:
             return self.error("error or amaj, amin, and phi required in field_data.")
 
         with self.Session() as session:
@@ -386,9 +444,7 @@ class SpatialCatalogASCIIFileHandler(BaseHandler):
             return self.error("declination should span -90<dec<90.")
 
         # check for cone or ellipse keys
-        if (not {'radius'}.issubset(set(catalog_data.keys()))) and (
-            not {'amaj', 'amin', 'phi'}.issubset(set(catalog_data.keys()))
-        ):
+        if catalog_shape(catalog_data) is None:
             return self.error("error or amaj, amin, and phi required in field_data.")
 
         with self.Session() as session:
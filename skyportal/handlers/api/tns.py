@@ -9,7 +9,7 @@ from baselayer.app.access import permissions, auth_or_token
 from baselayer.app.model_util import recursive_to_dict
 from baselayer.app.env import load_env
 
-from .photometry import serialize
+from .photometry import serialize_photometry
 from ..base import BaseHandler
 from ...models import (
     Group,
@@ -215,7 +215,7 @@ class ObjTNSHandler(BaseHandler):
                     Photometry.obj_id == obj_id
                 )
             ).all()
-            photometry = [serialize(phot, 'ab', 'mag') for phot in photometry]
+            photometry = serialize_photometry(photometry, 'ab', 'mag')
 
             data = self.get_json()
             tnsrobotID = data.get('tnsrobotID')
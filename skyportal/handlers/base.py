@@ -78,3 +78,36 @@ class BaseHandler(BaselayerHandler):
 
                 # pause the coroutine so other handlers can run
                 await sleep(1e-9)  # 1 ns
+
+    async def send_stream(self, chunks, content_type, filename=None):
+        """
+        chunks : iterable of str or bytes
+            Response body, sent to the client chunk by chunk as the
+            iterable is consumed (chunked transfer encoding).
+        content_type : str
+            Content-Type header of the response.
+        filename : str, optional
+            If provided, the response is sent as an attachment with
+            this filename.
+        """
+        # do not send result via `.success`, since that uses content-type JSON
+        self.set_status(200)
+        self.set_header("Content-Type", content_type)
+        if filename is not None:
+            self.set_header("Content-Disposition", f"attachment; filename={filename}")
+        self.set_header(
+            'Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0'
+        )
+
+        for chunk in chunks:
+            try:
+                self.write(chunk)
+                await self.flush()
+            except StreamClosedError:
+                # the client has closed the connection
+                break
+            finally:
+                del chunk
+
+                # pause the coroutine so other handlers can run
+                await sleep(1e-9)  # 1 ns
@@ -11,8 +11,6 @@ from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from astropy.table import Table
-import dustmaps.sfd
-from dustmaps.config import config
 import numpy as np
 import ligo.skymap.postprocess
 import ligo.skymap.bayestar as ligo_bayestar
@@ -22,9 +20,23 @@ import healpix_alchemy
 from baselayer.app.models import Base, AccessibleIfUserMatches
 from baselayer.app.env import load_env
 
+from ..utils.cache import ArrayCache, Cache
+from ..utils.extinction import ebv_for
+
 
 _, cfg = load_env()
-config['data_dir'] = cfg['misc.dustmap_folder']
+
+# rasterized skymaps, shared by all the localizations of the process
+# (and, if max_localization_rasters_on_disk is not zero, between processes)
+max_rasters_on_disk = cfg.get('misc.max_localization_rasters_on_disk', 0)
+raster_cache = ArrayCache(
+    max_bytes=cfg.get('misc.localization_raster_cache_megabytes', 512) * 1024**2,
+    disk_cache=Cache(
+        cache_dir='cache/localization_rasters', max_items=max_rasters_on_disk
+    )
+    if max_rasters_on_disk
+    else None,
+)
 
 
 class Localization(Base):
@@ -173,24 +185,63 @@ class Localization(Base):
         else:
             return self.table_2d
 
+    def _raster_cache_key(self, name, order):
+        # skymaps are immutable, but IDs may be reused by a new database
+        if self.id is None or self.created_at is None:
+            return None
+        return f'{self.id}_{self.created_at.isoformat()}_{name}_{order}'
+
+    def get_flat_2d(self, order=None):
+        """Get flat resolution HEALPix dataset, probability density only.
+
+        The rasterized map is cached (read-only) for the process, see
+        `raster_cache`. Use a lower HEALPix order than that of
+        `Localization.nside` for a coarser (and faster) map."""
+        if order is None:
+            order = healpy.nside2order(Localization.nside)
+        key = self._raster_cache_key('2d', order)
+        if key is not None:
+            result = raster_cache.get(key)
+            if result is not None:
+                return result
+
+        result = ligo_bayestar.rasterize(self.table_2d, order)['PROB']
+        result = healpy.reorder(result, 'NESTED', 'RING')
+        if key is not None:
+            result = raster_cache.set(key, result)
+        return result
+
+    def get_flat(self, order=None):
+        """Get flat resolution HEALPix dataset, probability density and
+        distance, cached as for `get_flat_2d`."""
+        if not self.is_3d:
+            return (self.get_flat_2d(order=order),)
+
+        if order is None:
+            order = healpy.nside2order(Localization.nside)
+        key = self._raster_cache_key('3d', order)
+        if key is not None:
+            result = raster_cache.get(key)
+            if result is not None:
+                return tuple(result)
+
+        t = ligo_bayestar.rasterize(self.table, order)
+        result = t['PROB'], t['DISTMU'], t['DISTSIGMA'], t['DISTNORM']
+        result = np.asarray(healpy.reorder(result, 'NESTED', 'RING'))
+        if key is not None:
+            result = raster_cache.set(key, result)
+        return tuple(result)
+
     @property
     def flat_2d(self):
         """Get flat resolution HEALPix dataset, probability density only."""
-        order = healpy.nside2order(Localization.nside)
-        result = ligo_bayestar.rasterize(self.table_2d, order)['PROB']
-        return healpy.reorder(result, 'NESTED', 'RING')
+        return self.get_flat_2d()
 
     @property
     def flat(self):
         """Get flat resolution HEALPix dataset, probability density and
         distance."""
-        if self.is_3d:
-            order = healpy.nside2order(Localization.nside)
-            t = ligo_bayestar.rasterize(self.table, order)
-            result = t['PROB'], t['DISTMU'], t['DISTSIGMA'], t['DISTNORM']
-            return healpy.reorder(result, 'NESTED', 'RING')
-        else:
-            return (self.flat_2d,)
+        return self.get_flat()
 
     @property
     def center(self):
@@ -205,11 +256,8 @@ class Localization(Base):
         center_info["gal_lat"] = coord.galactic.b.deg
         center_info["gal_lon"] = coord.galactic.l.deg
 
-        try:
-            ebv = float(dustmaps.sfd.SFDQuery()(coord))
-        except Exception:
-            ebv = None
-        center_info["ebv"] = ebv
+        ebv = ebv_for(coord.ra.deg, coord.dec.deg)
+        center_info["ebv"] = None if ebv is None else float(ebv[0])
 
         return center_info
 
@@ -1,5 +1,6 @@
 __all__ = ['Obj']
 
+import functools
 import uuid
 import requests
 import re
@@ -35,6 +36,7 @@ from .spectrum import Spectrum
 from .candidate import Candidate
 from .thumbnail import Thumbnail
 from .cosmo import cosmo
+from ..utils.extinction import ebv_for
 
 _, cfg = load_env()
 log = make_log('models.obj')
@@ -59,6 +61,64 @@ if any(
         pass
 
 
+# redshift grid of the luminosity distance interpolation table
+LUMINOSITY_DISTANCE_TABLE_REDSHIFTS = np.geomspace(1e-4, 10, 10000)
+
+
+@functools.lru_cache(maxsize=1)
+def _luminosity_distance_table():
+    """Luminosity distances (in Mpc) on the redshift grid, for the configured
+    cosmology, in log space for interpolation."""
+    z = LUMINOSITY_DISTANCE_TABLE_REDSHIFTS
+    return np.log(z), np.log(cosmo.luminosity_distance(z).to(u.Mpc).value)
+
+
+def redshift_to_luminosity_distance(redshifts):
+    """Luminosity distances (in Mpc) for an array of redshifts, interpolated
+    from a precomputed table. Redshifts outside of the table are computed
+    directly from the cosmology."""
+    redshifts = np.asarray(redshifts, dtype=float)
+    log_z, log_dl = _luminosity_distance_table()
+
+    distances = np.exp(np.interp(np.log(redshifts), log_z, log_dl))
+    outside = (redshifts < LUMINOSITY_DISTANCE_TABLE_REDSHIFTS[0]) | (
+        redshifts > LUMINOSITY_DISTANCE_TABLE_REDSHIFTS[-1]
+    )
+    if np.any(outside):
+        distances[outside] = (
+            cosmo.luminosity_distance(redshifts[outside]).to(u.Mpc).value
+        )
+    return distances
+
+
+def altdata_luminosity_distance(altdata):
+    """
+    The luminosity distance in Mpc from the `dm` (mag), `parallax` (arcsec),
+    `dist_kpc`, `dist_Mpc`, `dist_pc` or `dist_cm` fields (in that order)
+    of an Obj's altdata, or None if none of them are available.
+    """
+    if not isinstance(altdata, dict):
+        return None
+
+    if altdata.get("dm") is not None:
+        # see eq (24) of https://ned.ipac.caltech.edu/level5/Hogg/Hogg7.html
+        return ((10 ** (float(altdata.get("dm")) / 5.0)) * 1e-5 * u.Mpc).value
+    if altdata.get("parallax") is not None:
+        if float(altdata.get("parallax")) > 0:
+            # assume parallax in arcsec
+            return (1e-6 * u.Mpc / float(altdata.get("parallax"))).value
+
+    if altdata.get("dist_kpc") is not None:
+        return (float(altdata.get("dist_kpc")) * 1e-3 * u.Mpc).value
+    if altdata.get("dist_Mpc") is not None:
+        return (float(altdata.get("dist_Mpc")) * u.Mpc).value
+    if altdata.get("dist_pc") is not None:
+        return (float(altdata.get("dist_pc")) * 1e-6 * u.Mpc).value
+    if altdata.get("dist_cm") is not None:
+        return (float(altdata.get("dist_cm")) * u.Mpc / 3.085e18).value
+    return None
+
+
 def delete_obj_if_all_data_owned(cls, user_or_token):
     from .source import Source
 
@@ -532,25 +592,9 @@ class Obj(Base, conesearch_alchemy.Point):
 
         # there may be a non-redshift based measurement of distance
         # for nearby sources
-        if isinstance(self.altdata, dict):
-            if self.altdata.get("dm") is not None:
-                # see eq (24) of https://ned.ipac.caltech.edu/level5/Hogg/Hogg7.html
-                return (
-                    (10 ** (float(self.altdata.get("dm")) / 5.0)) * 1e-5 * u.Mpc
-                ).value
-            if self.altdata.get("parallax") is not None:
-                if float(self.altdata.get("parallax")) > 0:
-                    # assume parallax in arcsec
-                    return (1e-6 * u.Mpc / float(self.altdata.get("parallax"))).value
-
-            if self.altdata.get("dist_kpc") is not None:
-                return (float(self.altdata.get("dist_kpc")) * 1e-3 * u.Mpc).value
-            if self.altdata.get("dist_Mpc") is not None:
-                return (float(self.altdata.get("dist_Mpc")) * u.Mpc).value
-            if self.altdata.get("dist_pc") is not None:
-                return (float(self.altdata.get("dist_pc")) * 1e-6 * u.Mpc).value
-            if self.altdata.get("dist_cm") is not None:
-                return (float(self.altdata.get("dist_cm")) * u.Mpc / 3.085e18).value
+        distance = altdata_luminosity_distance(self.altdata)
+        if distance is not None:
+            return distance
 
         if self.redshift:
             if self.redshift * 2.99e5 * u.km / u.s < 350 * u.km / u.s:
@@ -581,6 +625,78 @@ class Obj(Base, conesearch_alchemy.Point):
             return dl
         return None
 
+    @staticmethod
+    def derived_columns(objs):
+        """
+        Galactic coordinates and distances of a list of objects, computed
+        with a single coordinate transform and an interpolated
+        redshift-distance relation rather than object by object.
+
+        Parameters
+        ----------
+        objs : list of `skyportal.models.Obj`
+            The objects (or any objects with `ra`, `dec`, `redshift`
+            and `altdata` attributes).
+
+        Returns
+        -------
+        list of dict
+            For each object, its `gal_lon`, `gal_lat`, `luminosity_distance`,
+            `dm` and `angular_diameter_distance`, with the same values
+            (and None where undefined) as the corresponding Obj properties.
+        """
+        objs = list(objs)
+        if len(objs) == 0:
+            return []
+
+        coords = ap_coord.SkyCoord(
+            np.array([obj.ra for obj in objs], dtype=float),
+            np.array([obj.dec for obj in objs], dtype=float),
+            unit="deg",
+        ).galactic
+        gal_lon = coords.l.deg
+        gal_lat = coords.b.deg
+
+        redshifts = np.array(
+            [obj.redshift if obj.redshift else np.nan for obj in objs], dtype=float
+        )
+        # only sources within the Hubble flow get a redshift based distance
+        # (see Obj.luminosity_distance)
+        in_hubble_flow = redshifts * 2.99e5 >= 350
+        redshift_distances = np.full(len(objs), np.nan)
+        if np.any(in_hubble_flow):
+            redshift_distances[in_hubble_flow] = redshift_to_luminosity_distance(
+                redshifts[in_hubble_flow]
+            )
+
+        columns = []
+        for i, obj in enumerate(objs):
+            luminosity_distance = altdata_luminosity_distance(obj.altdata)
+            if luminosity_distance is None and in_hubble_flow[i]:
+                luminosity_distance = float(redshift_distances[i])
+
+            dm = None
+            angular_diameter_distance = None
+            if luminosity_distance:
+                dm = float(5.0 * np.log10(luminosity_distance * 1e5))
+                angular_diameter_distance = luminosity_distance
+                if redshifts[i] * 2.99e5 > 350:
+                    # see eq (20) of https://ned.ipac.caltech.edu/level5/Hogg/Hogg7.html
+                    angular_diameter_distance = float(
+                        luminosity_distance / (1 + redshifts[i]) ** 2
+                    )
+
+            columns.append(
+                {
+                    "gal_lon": float(gal_lon[i]),
+                    "gal_lat": float(gal_lat[i]),
+                    "luminosity_distance": luminosity_distance,
+                    "dm": dm,
+                    "angular_diameter_distance": angular_diameter_distance,
+                }
+            )
+        return columns
+
     def airmass(self, telescope, time, below_horizon=np.inf):
         """Return the airmass of the object at a given time. Uses the Pickering
         (2002) interpolation of the Rayleigh (molecular atmosphere) airmass.
@@ -647,11 +763,10 @@ class Obj(Base, conesearch_alchemy.Point):
     def ebv(self):
         """E(B-V) extinction for the object"""
 
-        coord = ap_coord.SkyCoord(self.ra, self.dec, unit='deg')
-        try:
-            return float(dustmaps.sfd.SFDQuery()(coord))
-        except Exception:
+        ebv = ebv_for(self.ra, self.dec)
+        if ebv is None:
             return None
+        return float(ebv[0])
 
 
 Obj.candidates = relationship(
@@ -101,3 +101,18 @@ class QueuedObservation(Base):
     exposure_time = sa.Column(
         sa.Integer, nullable=False, doc='Exposure time in seconds'
     )
+
+
+# Deduplication index. An observation is identified by the ID supplied by
+# its instrument, so that repeated ingestions of the same exposures (e.g.,
+# nightly imports overlapping the previous night) can skip existing rows
+# with ON CONFLICT DO NOTHING.
+
+ExecutedObservation.__table_args__ = (
+    sa.Index(
+        'executedobservations_deduplication_index',
+        ExecutedObservation.instrument_id,
+        ExecutedObservation.observation_id,
+        unique=True,
+    ),
+)
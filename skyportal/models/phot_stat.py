@@ -4,6 +4,7 @@ import json
 import bisect
 import copy
 import numpy as np
+import pandas as pd
 import sqlalchemy as sa
 from sqlalchemy import event
 
@@ -564,6 +565,90 @@ class PhotStat(Base):
 
         self.last_update = datetime.utcnow()
 
+    @staticmethod
+    def get_photometry_columns(phot_list):
+        """
+        Convert photometry points into the arrays used by `full_update`.
+
+        Parameters
+        ----------
+        phot_list: 1D array-like of skyportal.models.Photometry or dicts,
+            or a dict of 1D arrays or a pandas.DataFrame.
+            The photometry points. Columnar inputs need the keys
+            'filter', 'mjd', 'flux' and 'fluxerr', and optionally
+            'mag' and either 'limiting_mag' or 'original_user_data'.
+
+        Returns
+        -------
+        filters, mjds, mags, dets, lims: 1D numpy arrays
+            Filter names, MJDs, magnitudes (nan for non-positive flux),
+            detection flags and limiting magnitudes (nan for detections,
+            or for non-detections without a valid limit).
+        """
+        if isinstance(phot_list, (dict, pd.DataFrame)):
+            columns = phot_list
+        else:
+            rows = []
+            for phot in phot_list:
+                if isinstance(phot, Photometry):
+                    phot = phot.__dict__
+                elif not isinstance(phot, dict):
+                    raise TypeError('phot must be a dict or Photometry object')
+                rows.append(phot)
+            columns = {
+                key: [phot.get(key) for phot in rows]
+                for key in ['filter', 'mjd', 'flux', 'fluxerr', 'original_user_data']
+            }
+            if any('mag' in phot for phot in rows):
+                columns['mag'] = [phot.get('mag', np.nan) for phot in rows]
+
+        filters = np.asarray(columns['filter'])
+        mjds = np.asarray(columns['mjd'], dtype=float)
+        flux = np.asarray(columns['flux'], dtype=float)
+        fluxerr = np.asarray(columns['fluxerr'], dtype=float)
+
+        if 'limiting_mag' in columns:
+            user_lims = np.asarray(columns['limiting_mag'], dtype=float)
+            has_user_lim = ~np.isnan(user_lims)
+        elif 'original_user_data' in columns:
+            has_user_lim = np.array(
+                [
+                    data is not None and 'limiting_mag' in data
+                    for data in columns['original_user_data']
+                ],
+                dtype=bool,
+            )
+            user_lims = np.array(
+                [
+                    data['limiting_mag'] if has_lim else np.nan
+                    for data, has_lim in zip(
+                        columns['original_user_data'], has_user_lim
+                    )
+                ],
+                dtype=float,
+            )
+        else:
+            user_lims = np.full(len(mjds), np.nan)
+            has_user_lim = np.zeros(len(mjds), dtype=bool)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mags = np.where(flux > 0, -2.5 * np.log10(flux) + PHOT_ZP, np.nan)
+            if 'mag' in columns:
+                given_mags = np.asarray(columns['mag'], dtype=float)
+                mags = np.where(np.isnan(given_mags), mags, given_mags)
+
+            dets = (fluxerr > 0) & (flux / fluxerr > PHOT_DETECTION_THRESHOLD)
+
+            fivesigma = 5 * fluxerr
+            lims = np.where(
+                has_user_lim,
+                user_lims,
+                np.where(fivesigma > 0, -2.5 * np.log10(fivesigma) + PHOT_ZP, np.nan),
+            )
+            lims[dets] = np.nan
+
+        return filters, mjds, mags, dets, lims
+
     def full_update(self, phot_list):
         """
         Update this object's photometric stats
@@ -574,11 +659,17 @@ class PhotStat(Base):
 
         Parameters
         ----------
-        phot_list: 1D array-like of skyportal.models.Photometry or dicts
-            List of photometry points associated with this object.
+        phot_list: 1D array-like of skyportal.models.Photometry or dicts,
+            or a dict of 1D arrays or a pandas.DataFrame.
+            List of photometry points associated with this object,
+            or columns of photometry points (see `get_photometry_columns`).
+            Columnar input avoids building Python lists point by point,
+            e.g., for objects with very many photometry points.
 
         """
-        if len(phot_list) == 0:
+        filters, mjds, mags, dets, lims = self.get_photometry_columns(phot_list)
+
+        if len(mjds) == 0:
             # use initialization to set None/{} to all values
             self.__init__(self.obj_id)
 
@@ -587,57 +678,6 @@ class PhotStat(Base):
             self.last_full_update = datetime.utcnow()
             return
 
-        filters = []
-        mjds = []
-        mags = []
-        dets = []
-        lims = []
-        for phot in phot_list:
-            if isinstance(phot, Photometry):
-                phot = phot.__dict__
-            elif not isinstance(phot, dict):
-                raise TypeError('phot must be a dict or Photometry object')
-
-            filters.append(phot['filter'])
-            mjds.append(phot['mjd'])
-
-            if 'mag' in phot:
-                mags.append(phot['mag'])
-            elif phot['flux'] is not None and phot['flux'] > 0:
-                mags.append(-2.5 * np.log10(phot['flux']) + PHOT_ZP)
-            else:
-                mags.append(np.nan)
-
-            is_detected = (
-                phot['flux'] is not None
-                and phot['fluxerr'] is not None
-                and phot['fluxerr'] > 0
-                and phot['flux'] / phot['fluxerr'] > PHOT_DETECTION_THRESHOLD
-            )
-            dets.append(is_detected)
-
-            if not is_detected:
-                if (
-                    'original_user_data' in phot
-                    and phot['original_user_data'] is not None
-                    and 'limiting_mag' in phot['original_user_data']
-                ):
-                    lims.append(phot['original_user_data']['limiting_mag'])
-                else:
-                    fivesigma = 5 * phot['fluxerr']
-                    if fivesigma > 0:
-                        lims.append(-2.5 * np.log10(fivesigma) + PHOT_ZP)
-                    else:
-                        lims.append(None)
-            else:
-                lims.append(np.nan)
-
-        filters = np.array(filters)
-        mjds = np.array(mjds)
-        mags = np.array(mags)
-        dets = np.array(dets)
-        lims = np.array(lims)
-
         # make sure all non-detections have limiting magnitudes
         bad_idx = ~dets & np.isnan(lims)
         filters = filters[~bad_idx]
@@ -651,12 +691,12 @@ class PhotStat(Base):
         self.num_obs_global = len(mjds)
 
         # total number of points in each filter
-        for filt in filters:
-            self.num_obs_per_filter[filt] = len(filters[filters == filt])
+        for filt, count in zip(*np.unique(filters, return_counts=True)):
+            self.num_obs_per_filter[filt] = int(count)
 
         # if the list includes any photometry points at all!
         if self.num_obs_global:
-            self.recent_obs_mjd = max(mjds)
+            self.recent_obs_mjd = np.max(mjds)
 
         # if any of the points are detections
         if np.any(dets):
@@ -683,9 +723,9 @@ class PhotStat(Base):
             # other statistics
             self.mean_mag_global = np.nanmean(good_mags)
             self.mag_rms_global = np.nanstd(good_mags)
-            self.peak_mag_global = min(good_mags)
+            self.peak_mag_global = np.min(good_mags)
             self.peak_mjd_global = good_mjds[np.argmin(good_mags)]
-            self.faintest_mag_global = max(good_mags)
+            self.faintest_mag_global = np.max(good_mags)
 
             # stats for detections for each filter
             for filt in set(good_filters):
@@ -696,9 +736,9 @@ class PhotStat(Base):
                     self.num_det_per_filter[filt] = len(filt_mjds)
                     self.mean_mag_per_filter[filt] = np.nanmean(filt_mags)
                     self.mag_rms_per_filter[filt] = np.nanstd(filt_mags)
-                    self.peak_mag_per_filter[filt] = min(filt_mags)
+                    self.peak_mag_per_filter[filt] = np.min(filt_mags)
                     self.peak_mjd_per_filter[filt] = filt_mjds[np.argmin(filt_mags)]
-                    self.faintest_mag_per_filter[filt] = max(filt_mags)
+                    self.faintest_mag_per_filter[filt] = np.max(filt_mags)
 
             # find all the color terms
             mean_mags = self.mean_mag_per_filter
@@ -740,15 +780,12 @@ class PhotStat(Base):
             lim_mjds = mjds[dets == 0]
             lim_filters = filters[dets == 0]
             # find the deepest limit
-            self.deepest_limit_global = max(lim_mags)
+            self.deepest_limit_global = np.max(lim_mags)
             if self.first_detected_mjd:
-                self.predetection_mjds = list(
-                    lim_mjds[lim_mjds < self.first_detected_mjd]
-                )
+                lim_mjds_before = lim_mjds[lim_mjds < self.first_detected_mjd]
             else:
-                self.predetection_mjds = list(lim_mjds)
-
-            self.predetection_mjds.sort()
+                lim_mjds_before = lim_mjds
+            self.predetection_mjds = np.sort(lim_mjds_before).tolist()
             if self.predetection_mjds:
                 self.last_non_detection_mjd = self.predetection_mjds[-1]
                 if self.first_detected_mjd:
@@ -760,7 +797,7 @@ class PhotStat(Base):
             for filt in set(lim_filters):
                 filt_mags = lim_mags[lim_filters == filt]
                 if len(filt_mags):
-                    self.deepest_limit_per_filter[filt] = max(filt_mags)
+                    self.deepest_limit_per_filter[filt] = np.max(filt_mags)
 
         self.last_update = datetime.utcnow()
         self.last_full_update = datetime.utcnow()
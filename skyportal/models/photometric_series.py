@@ -10,6 +10,7 @@ __all__ = [
 ]
 import os
 import re
+import shutil
 import hashlib
 import arrow
 
@@ -32,15 +33,38 @@ from ..enum_types import allowed_bandpasses, time_stamp_alignment_types
 from .group import accessible_by_groups_members, accessible_by_streams_members
 
 from .photometry import PHOT_ZP
+from ..utils.cache import ArrayCache
+from ..utils.hdf5_files import load_dataframe_columns
+from ..utils.npy_files import (
+    dump_dataframe_to_directory,
+    load_dataframe_from_directory,
+    load_directory_arrays,
+    time_range_slice,
+)
 
 _, cfg = load_env()
 
+# decoded columns of the series data, shared by all the series of the process
+data_cache = ArrayCache(
+    max_bytes=cfg.get('misc.photometric_series_cache_megabytes', 0) * 1024**2
+)
+
 PHOT_DETECTION_THRESHOLD = cfg["misc.photometry_detection_threshold_nsigma"]
 
 RE_SLASHES = re.compile(r'^[\w_\-\+\/\\]*$')
 RE_NO_SLASHES = re.compile(r'^[\w_\-\+]*$')
 MAX_FILEPATH_LENGTH = 255
 
+# extension of the data file (or directory) of each of the on-disk formats:
+# hdf5 is a single HDF5 file, npy is a directory with one (memory-mappable)
+# .npy file per column, see utils/npy_files.py
+DATA_FORMAT_EXTENSIONS = {'hdf5': '.h5', 'npy': '.cols'}
+
+# names of the columns of the data that each of the lazy loaded arrays needs
+MJD_COLUMNS = ['mjd', 'mjds']
+FLUX_MAG_COLUMNS = ['flux', 'fluxes', 'mag', 'mags', 'magnitudes']
+ERROR_COLUMNS = ['fluxerr', 'magerr']
+
 # these must be given explicitly to the initialization function
 REQUIRED_ATTRIBUTES = [
     'series_name',
@@ -343,23 +367,28 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
         self._magerr = None
         self._data_bytes = None
 
+        # the data is only read from disk when it is first accessed
+        # (the summary statistics were saved as columns on insert)
+        self._data = None
+
         # these should be filled out by sqlalchemy when loading relationships
         self.group_ids = None
         self.stream_ids = None
 
-        try:
-            self.load_data()
-            self.calc_flux_mag()
-            self.calc_stats()
-        except Exception:
-            pass  # silently fail to load
-
-    def to_dict(self):
+    def to_dict(self, include_data=True):
         """
         Convert the object into a dictionary.
+
+        Parameters
+        ----------
+        include_data: bool
+            Whether to include the photometric data,
+            which needs to be read from disk.
+            Default is True.
         """
         d = super().to_dict()
-        d['data'] = self.data.to_dict(orient='list')
+        if include_data:
+            d['data'] = self.data.to_dict(orient='list')
         return d
 
     @staticmethod
@@ -457,39 +486,59 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
         Also, fills-in the mjds field, and the errors if
         they are included in the dataset.
         """
+        self.set_fluxes_mags(self._data)
+        self.set_errors(self._data)
+        self.set_mjds(self._data)
 
-        if 'flux' in self._data:
-            self._fluxes = self._data['flux']
+    def set_fluxes_mags(self, data):
+        """
+        Fill in the fluxes and magnitudes from the
+        flux or magnitude column of the given data
+        (the full data or only some of its columns).
+        """
+        if 'flux' in data:
+            self._fluxes = data['flux']
             self._mags = self.flux2mag(self._fluxes)
-        elif 'fluxes' in self._data:
-            self._fluxes = self._data['fluxes']
+        elif 'fluxes' in data:
+            self._fluxes = data['fluxes']
             self._mags = self.flux2mag(self._fluxes)
-        elif 'mag' in self._data:
-            self._mags = self._data['mag']
+        elif 'mag' in data:
+            self._mags = data['mag']
             self._fluxes = self.mag2flux(self._mags)
-        elif 'mags' in self._data:
-            self._mags = self._data['mags']
+        elif 'mags' in data:
+            self._mags = data['mags']
             self._fluxes = self.mag2flux(self._mags)
-        elif 'magnitudes' in self._data:
-            self._mags = self._data['magnitudes']
+        elif 'magnitudes' in data:
+            self._mags = data['magnitudes']
             self._fluxes = self.mag2flux(self._mags)
         else:
             raise KeyError('Cannot find "fluxes" or "mags" in photometric data')
 
-        if 'fluxerr' in self._data:
-            self._fluxerr = self._data['fluxerr']
-            self._magerr = self.fluxerr2magerr(self.fluxes, self._fluxerr)
-        elif 'magerr' in self._data:
-            self._magerr = self._data['magerr']
+    def set_errors(self, data):
+        """
+        Fill in the flux and magnitude errors from the
+        error columns of the given data, if there are any
+        (the fluxes and magnitudes are also needed).
+        """
+        if self._fluxes is None or self._mags is None:
+            self.set_fluxes_mags(data)
+
+        if 'fluxerr' in data:
+            self._fluxerr = data['fluxerr']
+            self._magerr = self.fluxerr2magerr(np.array(self._fluxes), self._fluxerr)
+        elif 'magerr' in data:
+            self._magerr = data['magerr']
             self._fluxerr = self.magerr2fluxerr(self._mags, self._magerr)
         else:
             self._magerr = np.array([])
             self._fluxerr = np.array([])
 
-        if 'mjd' in self._data:
-            self._mjds = self._data['mjd']
-        elif 'mjds' in self._data:
-            self._mjds = self._data['mjds']
+    def set_mjds(self, data):
+        """Fill in the mjds from the mjd column of the given data."""
+        if 'mjd' in data:
+            self._mjds = data['mjd']
+        elif 'mjds' in data:
+            self._mjds = data['mjds']
         else:
             raise KeyError('Cannot find "mjd" or "mjds" in photometric data')
 
@@ -627,16 +676,113 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
         """
         Load the underlying photometric data from disk.
         """
-        with pd.HDFStore(self.filename, mode='r') as store:
-            keys = list(store.keys())
-            if len(keys) != 1:
-                raise ValueError('HDF5 file must contain exactly one data table')
-            self._data = store[keys[0]]
+        self._data = self.read_data()
+
+    def read_data(self, columns=None):
+        """
+        Read the photometric data from disk,
+        or only some of its columns, without
+        keeping it in this object.
+
+        Decoded columns of HDF5 files are kept
+        in a cache shared by all the series of
+        the process, keyed by the hash of the data
+        (see misc.photometric_series_cache_megabytes).
+        Data saved as .npy columns is read directly,
+        as it is already cached by the OS.
+
+        Parameters
+        ----------
+        columns: list of str, optional
+            Names of the columns to read.
+            Columns that are not in the data are skipped.
+            If not given, all the columns are read.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The data, or the requested columns of it.
+        """
+        if os.path.isdir(self.filename):
+            data, _ = load_dataframe_from_directory(self.filename, columns)
+            return data
+
+        arrays = {}
+        missing = None
+        names = data_cache.get(f'{self.hash}/columns')
+        if names is not None:
+            names = [n for n in names if columns is None or n in columns]
+            arrays = {n: data_cache.get(f'{self.hash}/{n}') for n in names}
+            missing = [n for n in names if arrays[n] is None]
+
+        if names is None or len(missing) > 0:
+            data, all_names = load_dataframe_columns(
+                self.filename, columns if names is None else missing
+            )
+            data_cache.set(f'{self.hash}/columns', np.array(all_names))
+            names = [n for n in all_names if columns is None or n in columns]
+            for n in data.columns:
+                arrays[n] = data_cache.set(f'{self.hash}/{n}', data[n].to_numpy())
+
+        return pd.DataFrame({n: arrays[n] for n in names})
+
+    def read_arrays(self, columns=None, mjd_range=None):
+        """
+        Read the photometric data from disk as
+        a dictionary of arrays, optionally only
+        some of the columns and/or the exposures
+        in a range of MJDs.
+
+        For data saved as .npy columns,
+        the arrays are read-only memory-mapped
+        views of the files, so only the parts
+        that are accessed are read from disk.
+        For HDF5 files, the requested columns
+        are read and the range is sliced in memory.
+
+        Parameters
+        ----------
+        columns: list of str, optional
+            Names of the columns to read.
+            Columns that are not in the data are skipped.
+            If not given, all the columns are read.
+        mjd_range: 2-tuple of floats, optional
+            The first and last MJD of the exposures
+            to read (either can be None for no bound).
+            Assumes the data is sorted by mjd.
+
+        Returns
+        -------
+        dict of numpy.ndarray
+            The requested columns of the data.
+        """
+        read_columns = columns
+        if columns is not None and mjd_range is not None:
+            read_columns = list(columns) + MJD_COLUMNS
+
+        if os.path.isdir(self.filename):
+            arrays, _ = load_directory_arrays(self.filename, read_columns)
+        else:
+            data = self.read_data(read_columns)
+            arrays = {k: data[k].to_numpy() for k in data.columns}
+
+        if mjd_range is not None:
+            mjd_column = next(c for c in MJD_COLUMNS if c in arrays)
+            index = time_range_slice(arrays[mjd_column], *mjd_range)
+            arrays = {k: v[index] for k, v in arrays.items()}
+
+        if columns is not None:
+            arrays = {k: v for k, v in arrays.items() if k in columns}
+
+        return arrays
 
     def get_data_bytes(self):
         """
         Return a bytes array representation of the
         data that is going to be saved to disk.
+        The data is always encoded as an HDF5 file
+        (also used for calculating the hash),
+        regardless of the format used on disk.
         This is lazy loaded if it is saved in self._data_bytes,
         which is calculated from self.data along with
         some metadata from this object.
@@ -664,7 +810,7 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
                 # ref: https://github.com/pandas-dev/pandas/blob/b1b70c7390e589bbfa0d8896aa76e64bec0cf51e/pandas/tests/io/pytables/test_store.py#L324
                 store.put(
                     'phot_series',
-                    self._data,
+                    self.data,
                     format='table',
                     index=None,
                     track_times=False,
@@ -689,9 +835,9 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
         self.group_ids = sorted(self.group_ids)
         self.stream_ids = sorted(self.stream_ids)
 
-        self.hash = hashlib.md5()
-        self.hash.update(self.get_data_bytes())
-        self.hash = self.hash.hexdigest()
+        m = hashlib.md5()
+        m.update(self.get_data_bytes())
+        self.hash = m.hexdigest()
 
     def make_full_name(self):
         """
@@ -723,9 +869,15 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
         origin = '_' + self.origin.replace(" ", "_") if self.origin else ''
         channel = '_' + self.channel.replace(" ", "_") if self.channel else ''
 
-        filename = (
-            f'series_{self.series_obj_id}_inst_{self.instrument_id}{channel}{origin}.h5'
-        )
+        data_format = cfg.get('photometric_series_format', 'hdf5')
+        if data_format not in DATA_FORMAT_EXTENSIONS:
+            raise ValueError(
+                f'Unknown photometric series format "{data_format}". '
+                f'Use one of {list(DATA_FORMAT_EXTENSIONS)}.'
+            )
+        extension = DATA_FORMAT_EXTENSIONS[data_format]
+
+        filename = f'series_{self.series_obj_id}_inst_{self.instrument_id}{channel}{origin}{extension}'
 
         path = os.path.join(root_folder, subfolder)
 
@@ -760,6 +912,11 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
 
         Use temp=True to save a temporary file
         (same file, appended with .tmp).
+
+        The format on disk is set by the
+        photometric_series_format config option:
+        a single HDF5 file (hdf5) or a directory
+        with one .npy file per column (npy).
         """
 
         # make sure no changes were made since object was initialized
@@ -774,16 +931,23 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
         if temp:
             file_to_write += '.tmp'
 
-        with open(file_to_write, 'wb') as f:
-            f.write(self.get_data_bytes())
+        if full_name.endswith(DATA_FORMAT_EXTENSIONS['npy']):
+            dump_dataframe_to_directory(
+                self.data, file_to_write, metadata=self.get_metadata()
+            )
+        else:
+            with open(file_to_write, 'wb') as f:
+                f.write(self.get_data_bytes())
 
         self.filename = full_name
 
     def move_temp_data(self):
         """Rename a temp data file to not have the .tmp extension."""
         full_name, _ = self.make_full_name()
-        if os.path.isfile(full_name + '.tmp'):
-            os.rename(full_name + '.tmp', full_name)
+        if os.path.exists(full_name + '.tmp'):
+            if os.path.isdir(full_name):
+                shutil.rmtree(full_name)
+            os.replace(full_name + '.tmp', full_name)
 
     def delete_data(self, temp=False):
         """
@@ -794,7 +958,18 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
             file_to_delete = self.filename
             if temp:
                 file_to_delete += '.tmp'
-            os.remove(file_to_delete)
+            self.remove_data_path(file_to_delete)
+
+    @staticmethod
+    def remove_data_path(path):
+        """
+        Delete a data file, or a directory
+        of .npy columns, if it exists.
+        """
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.isfile(path):
+            os.remove(path)
 
     read = (
         accessible_by_groups_members
@@ -860,7 +1035,8 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
         nullable=False,
         index=True,
         unique=True,
-        doc="Full path and filename, or URI to the HDF5 file storing photometric data.",
+        doc="Full path and filename, or URI to the HDF5 file "
+        "(or directory of .npy columns) storing photometric data.",
     )
 
     mjd_first = sa.Column(
@@ -1114,15 +1290,22 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
         self.calc_flux_mag()
         self.calc_stats()
 
+    def get_columns(self, columns):
+        """
+        The data if it is loaded, otherwise
+        only the given columns, read from disk.
+        """
+        if self._data is not None:
+            return self._data
+        return self.read_data(columns)
+
     @property
     def mjds(self):
         """
         Modified Julian dates for each exposure.
         """
         if self._mjds is None:  # lazy load
-            if self._data is None:  # lazy load from file
-                self.load_data()
-            self.calc_flux_mag()  # do this once, cache all the hidden variables
+            self.set_mjds(self.get_columns(MJD_COLUMNS))
         return np.array(self._mjds)
 
     @property
@@ -1131,10 +1314,8 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
         Fluxes of each observation in µJy.
         Corresponds to an AB Zeropoint of 23.9 in all filters.
         """
-        if self._fluxes is None:
-            if self._data is None:  # lazy load from file
-                self.load_data()
-            self.calc_flux_mag()  # do this once, cache all the hidden variables
+        if self._fluxes is None:  # lazy load
+            self.set_fluxes_mags(self.get_columns(FLUX_MAG_COLUMNS))
         return np.array(self._fluxes)
 
     @property
@@ -1143,27 +1324,21 @@ class PhotometricSeries(conesearch_alchemy.Point, Base):
         Gaussian error on the flux in µJy.
         """
         if self._fluxerr is None:  # lazy load
-            if self._data is None:  # lazy load from file
-                self.load_data()
-            self.calc_flux_mag()  # do this once, cache all the hidden variables
+            self.set_errors(self.get_columns(FLUX_MAG_COLUMNS + ERROR_COLUMNS))
         return np.array(self._fluxerr)
 
     @property
     def mags(self):
         """The magnitude of each point in the AB system."""
         if self._mags is None:  # lazy load
-            if self._data is None:  # lazy load from file
-                self.load_data()
-            self.calc_flux_mag()  # do this once, cache all the hidden variables
+            self.set_fluxes_mags(self.get_columns(FLUX_MAG_COLUMNS))
         return np.array(self._mags)
 
     @property
     def magerr(self):
         """The error on the magnitude of each photometry point."""
         if self._magerr is None:  # lazy load
-            if self._data is None:  # lazy load from file
-                self.load_data()
-            self.calc_flux_mag()  # do this once, cache all the hidden variables
+            self.set_errors(self.get_columns(FLUX_MAG_COLUMNS + ERROR_COLUMNS))
         return np.array(self._magerr)
 
     @property
@@ -1275,9 +1450,5 @@ def delete_dataset(mapper, connection, target):
     with a file, and it has autodelete=True, then
     the file will be automatically deleted.
     """
-    if (
-        target.autodelete
-        and target.filename is not None
-        and os.path.isfile(target.filename)
-    ):
-        os.remove(target.filename)
+    if target.autodelete and target.filename is not None:
+        target.remove_data_path(target.filename)
@@ -1,4 +1,4 @@
-__all__ = ['UserNotification']
+__all__ = ['UserNotification', 'NotificationDelivery']
 
 import json
 
@@ -12,7 +12,12 @@ import datetime
 import operator  # noqa: F401
 import requests
 
-from baselayer.app.models import Base, User, AccessibleIfUserMatches
+from baselayer.app.models import (
+    Base,
+    User,
+    AccessibleIfUserMatches,
+    AccessibleIfRelatedRowsAreAccessible,
+)
 from baselayer.app.env import load_env
 from baselayer.app.flow import Flow
 from baselayer.log import make_log
@@ -112,6 +117,77 @@ class UserNotification(Base):
     )
 
 
+class NotificationDelivery(Base):
+    """Delivery of a UserNotification through an external channel (Slack,
+    email, SMS, phone call or WhatsApp). Deliveries are recorded with the
+    notification (as an outbox), and sent by the notification_queue
+    service rather than in the transaction that created the notification."""
+
+    __tablename__ = 'notification_deliveries'
+
+    read = update = delete = AccessibleIfRelatedRowsAreAccessible(notification='read')
+
+    notification_id = sa.Column(
+        sa.ForeignKey("usernotifications.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+        doc="ID of the associated UserNotification",
+    )
+    notification = relationship(
+        "UserNotification",
+        doc="The associated UserNotification",
+    )
+
+    channel = sa.Column(
+        sa.String(),
+        nullable=False,
+        doc="Delivery channel: slack, email, sms, phone or whatsapp",
+    )
+
+    status = sa.Column(
+        sa.String(),
+        nullable=False,
+        default="pending",
+        doc="Delivery status: pending, sent, skipped or failed",
+    )
+
+    attempts = sa.Column(
+        sa.Integer,
+        nullable=False,
+        default=0,
+        doc="Number of delivery attempts",
+    )
+
+    next_attempt_at = sa.Column(
+        sa.DateTime,
+        nullable=False,
+        default=datetime.datetime.utcnow,
+        doc="UTC time after which the delivery is (re)tried",
+    )
+
+    sent_at = sa.Column(
+        sa.DateTime,
+        nullable=True,
+        doc="UTC time at which the notification was delivered",
+    )
+
+    last_error = sa.Column(
+        sa.String(),
+        nullable=True,
+        doc="Error of the last failed delivery attempt",
+    )
+
+
+NotificationDelivery.__table_args__ = (
+    sa.Index(
+        'notification_deliveries_pending_index',
+        NotificationDelivery.channel,
+        NotificationDelivery.next_attempt_at,
+        postgresql_where=NotificationDelivery.status == 'pending',
+    ),
+)
+
+
 def notification_resource_type(target):
     if not target.notification_type:
         return None
@@ -184,257 +260,248 @@ def user_preferences(target, notification_setting, resource_type):
         return prefs
 
 
-@event.listens_for(UserNotification, 'after_insert')
-def send_slack_notification(mapper, connection, target):
+def on_shift_or_in_time_slot(session, user, channel_prefs):
+    """Whether a user wants SMS/phone/WhatsApp notifications now,
+    according to their shifts and time slot preferences."""
+
+    sending = False
+    if channel_prefs.get("on_shift", False):
+        current_shift = (
+            session.query(Shift)
+            .join(ShiftUser)
+            .filter(ShiftUser.user_id == user.id)
+            .filter(Shift.start_date <= arrow.utcnow().datetime)
+            .filter(Shift.end_date >= arrow.utcnow().datetime)
+            .first()
+        )
+        if current_shift is not None:
+            sending = True
+
+    timeslot = channel_prefs.get("time_slot", [])
+    if len(timeslot) > 0:
+        current_time = arrow.utcnow().datetime
+        if timeslot[0] < timeslot[1]:
+            if current_time.hour >= timeslot[0] and current_time.hour <= timeslot[1]:
+                sending = True
+        else:
+            if current_time.hour <= timeslot[1] or current_time.hour >= timeslot[0]:
+                sending = True
+
+    return sending
+
+
+def deliver_slack_notification(session, target):
+    """Send a notification to the Slack microservice. Returns whether it was
+    sent, and raises if the delivery failed (to be retried)."""
     resource_type = notification_resource_type(target)
     notifications_prefs = user_preferences(target, "slack", resource_type)
     if not notifications_prefs:
-        return
+        return False
     integration_url = target.user.preferences['slack_integration'].get('url')
 
     slack_microservice_url = f'http://127.0.0.1:{cfg["slack.microservice_port"]}'
 
     app_url = get_app_base_url()
 
-    try:
-        if resource_type == 'gcn_events':
-            data = json.dumps(
-                {
-                    "url": integration_url,
-                    "blocks": gcn_slack_notification(
-                        session=inspect(target).session, target=target, app_url=app_url
-                    ),
-                }
-            )
-        elif resource_type == 'sources':
-            data = json.dumps(
-                {
-                    "url": integration_url,
-                    "blocks": source_slack_notification(
-                        session=inspect(target).session, target=target, app_url=app_url
-                    ),
-                }
-            )
-        else:
-            data = json.dumps(
-                {
-                    "url": integration_url,
-                    "text": f'{target.text} ({app_url}{target.url})',
-                }
-            )
-
-        requests.post(
-            slack_microservice_url,
-            data=data,
-            headers={'Content-Type': 'application/json'},
+    if resource_type == 'gcn_events':
+        data = json.dumps(
+            {
+                "url": integration_url,
+                "blocks": gcn_slack_notification(
+                    session=session, target=target, app_url=app_url
+                ),
+            }
         )
-        log(
-            f"Sent slack notification to user {target.user.id} at slack_url: {integration_url}, body: {target.text}, resource_type: {resource_type}"
+    elif resource_type == 'sources':
+        data = json.dumps(
+            {
+                "url": integration_url,
+                "blocks": source_slack_notification(
+                    session=session, target=target, app_url=app_url
+                ),
+            }
+        )
+    else:
+        data = json.dumps(
+            {
+                "url": integration_url,
+                "text": f'{target.text} ({app_url}{target.url})',
+            }
         )
-    except Exception as e:
-        log(f"Error sending slack notification: {e}")
 
+    response = requests.post(
+        slack_microservice_url,
+        data=data,
+        headers={'Content-Type': 'application/json'},
+        timeout=cfg["notifications.request_timeout_seconds"],
+    )
+    response.raise_for_status()
+    log(
+        f"Sent slack notification to user {target.user.id} at slack_url: {integration_url}, body: {target.text}, resource_type: {resource_type}"
+    )
+    return True
 
-@event.listens_for(UserNotification, 'after_insert')
-def send_email_notification(mapper, connection, target):
+
+def deliver_email_notification(session, target):
+    """Send a notification by email, see `deliver_slack_notification`."""
     resource_type = notification_resource_type(target)
     prefs = user_preferences(target, "email", resource_type)
 
     if not prefs:
-        return
+        return False
 
     subject = None
     body = None
 
     app_url = get_app_base_url()
 
-    try:
+    if resource_type == "sources":
+        subject, body = source_email_notification(
+            session=session, target=target, app_url=app_url
+        )
 
-        if resource_type == "sources":
-            subject, body = source_email_notification(
-                session=inspect(target).session, target=target, app_url=app_url
-            )
+    elif resource_type == "gcn_events":
+        subject, body = gcn_email_notification(
+            session=session, target=target, app_url=app_url
+        )
 
-        elif resource_type == "gcn_events":
-            subject, body = gcn_email_notification(
-                session=inspect(target).session, target=target, app_url=app_url
-            )
+    elif resource_type == "facility_transactions":
+        subject = f"{cfg['app.title']} - New facility transaction"
 
-        elif resource_type == "facility_transactions":
-            subject = f"{cfg['app.title']} - New facility transaction"
+    elif resource_type == "observation_plans":
+        subject = f"{cfg['app.title']} - New observation plans"
 
-        elif resource_type == "observation_plans":
-            subject = f"{cfg['app.title']} - New observation plans"
+    elif resource_type == "analysis_services":
+        subject = f"{cfg['app.title']} - New completed analysis service"
 
-        elif resource_type == "analysis_services":
-            subject = f"{cfg['app.title']} - New completed analysis service"
+    elif resource_type == "favorite_sources":
+        if target.notification_type == "favorite_sources_new_classification":
+            subject = f"{cfg['app.title']} - New classification on a favorite source"
 
-        elif resource_type == "favorite_sources":
-            if target.notification_type == "favorite_sources_new_classification":
-                subject = (
-                    f"{cfg['app.title']} - New classification on a favorite source"
-                )
+        elif target.notification_type == "favorite_sources_new_spectrum":
+            subject = f"{cfg['app.title']} - New spectrum on a favorite source"
 
-            elif target.notification_type == "favorite_sources_new_spectrum":
-                subject = f"{cfg['app.title']} - New spectrum on a favorite source"
+        elif target.notification_type == "favorite_sources_new_comment":
+            subject = f"{cfg['app.title']} - New comment on a favorite source"
 
-            elif target.notification_type == "favorite_sources_new_comment":
-                subject = f"{cfg['app.title']} - New comment on a favorite source"
+    elif resource_type == "mention":
+        subject = f"{cfg['app.title']} - User mentioned you in a comment"
 
-        elif resource_type == "mention":
-            subject = f"{cfg['app.title']} - User mentioned you in a comment"
+    elif resource_type == "group_admission_request":
+        subject = f"{cfg['app.title']} - New group admission request"
 
-        elif resource_type == "group_admission_request":
-            subject = f"{cfg['app.title']} - New group admission request"
+    if not subject or not target.user.contact_email:
+        return False
 
-        if subject and target.user.contact_email:
-            try:
-                if body is None:
-                    body = f'{target.text} ({app_url}{target.url})'
-                send_email(
-                    recipients=[target.user.contact_email],
-                    subject=subject,
-                    body=body,
-                )
-                log(
-                    f"Sent email notification to user {target.user.id} at email: {target.user.contact_email}, subject: {subject}, body: {body}, resource_type: {resource_type}"
-                )
-            except Exception as e:
-                log(f"Error sending email notification: {e}")
-
-    except Exception as e:
-        log(f"Error sending email notification: {e}")
+    if body is None:
+        body = f'{target.text} ({app_url}{target.url})'
+    send_email(
+        recipients=[target.user.contact_email],
+        subject=subject,
+        body=body,
+    )
+    log(
+        f"Sent email notification to user {target.user.id} at email: {target.user.contact_email}, subject: {subject}, body: {body}, resource_type: {resource_type}"
+    )
+    return True
 
 
-@event.listens_for(UserNotification, 'after_insert')
-def send_sms_notification(mapper, connection, target):
+def deliver_sms_notification(session, target):
+    """Send a notification by SMS, see `deliver_slack_notification`."""
     resource_type = notification_resource_type(target)
     prefs = user_preferences(target, "sms", resource_type)
     if not prefs:
-        return
+        return False
 
-    sending = False
-    if prefs[resource_type]['sms'].get("on_shift", False):
-        current_shift = (
-            Shift.query.join(ShiftUser)
-            .filter(ShiftUser.user_id == target.user.id)
-            .filter(Shift.start_date <= arrow.utcnow().datetime)
-            .filter(Shift.end_date >= arrow.utcnow().datetime)
-            .first()
-        )
-        if current_shift is not None:
-            sending = True
+    if not on_shift_or_in_time_slot(session, target.user, prefs[resource_type]['sms']):
+        return False
 
-    timeslot = prefs[resource_type]['sms'].get("time_slot", [])
-    if len(timeslot) > 0:
-        current_time = arrow.utcnow().datetime
-        if timeslot[0] < timeslot[1]:
-            if current_time.hour >= timeslot[0] and current_time.hour <= timeslot[1]:
-                sending = True
-        else:
-            if current_time.hour <= timeslot[1] or current_time.hour >= timeslot[0]:
-                sending = True
-
-    if sending:
-        try:
-            client.messages.create(
-                body=f"{cfg['app.title']} - {target.text}",
-                from_=from_number,
-                to=target.user.contact_phone.e164,
-            )
-            log(
-                f"Sent SMS notification to user {target.user.id} at phone number: {target.user.contact_phone.e164}, body: {target.text}, resource_type: {resource_type}"
-            )
-        except Exception as e:
-            log(f"Error sending sms notification: {e}")
+    client.messages.create(
+        body=f"{cfg['app.title']} - {target.text}",
+        from_=from_number,
+        to=target.user.contact_phone.e164,
+    )
+    log(
+        f"Sent SMS notification to user {target.user.id} at phone number: {target.user.contact_phone.e164}, body: {target.text}, resource_type: {resource_type}"
+    )
+    return True
 
 
-@event.listens_for(UserNotification, 'after_insert')
-def send_phone_notification(mapper, connection, target):
+def deliver_phone_notification(session, target):
+    """Send a notification by phone call, see `deliver_slack_notification`."""
     resource_type = notification_resource_type(target)
     prefs = user_preferences(target, "phone", resource_type)
 
     if not prefs:
-        return
+        return False
+
+    if not on_shift_or_in_time_slot(
+        session, target.user, prefs[resource_type]['phone']
+    ):
+        return False
+
+    message = f"Greetings. This is the SkyPortal robot. {target.text}"
+    client.calls.create(
+        twiml=VoiceResponse().append(Say(message=message)),
+        from_=from_number,
+        to=target.user.contact_phone.e164,
+    )
+    log(
+        f"Sent Phone Call notification to user {target.user.id} at phone number: {target.user.contact_phone.e164}, message: {message}, resource_type: {resource_type}"
+    )
+    return True
 
-    sending = False
-    if prefs[resource_type]['phone'].get("on_shift", False):
-        current_shift = (
-            Shift.query.join(ShiftUser)
-            .filter(ShiftUser.user_id == target.user.id)
-            .filter(Shift.start_date <= arrow.utcnow().datetime)
-            .filter(Shift.end_date >= arrow.utcnow().datetime)
-            .first()
-        )
-        if current_shift is not None:
-            sending = True
 
-    timeslot = prefs[resource_type]['phone'].get("time_slot", [])
-    if len(timeslot) > 0:
-        current_time = arrow.utcnow().datetime
-        if timeslot[0] < timeslot[1]:
-            if current_time.hour >= timeslot[0] and current_time.hour <= timeslot[1]:
-                sending = True
-        else:
-            if current_time.hour <= timeslot[1] or current_time.hour >= timeslot[0]:
-                sending = True
+def deliver_whatsapp_notification(session, target):
+    """Send a notification by WhatsApp, see `deliver_slack_notification`."""
+    resource_type = notification_resource_type(target)
+    prefs = user_preferences(target, "whatsapp", resource_type)
+    if not prefs:
+        return False
 
-    if sending:
-        try:
-            message = f"Greetings. This is the SkyPortal robot. {target.text}"
-            client.calls.create(
-                twiml=VoiceResponse().append(Say(message=message)),
-                from_=from_number,
-                to=target.user.contact_phone.e164,
-            )
-            log(
-                f"Sent Phone Call notification to user {target.user.id} at phone number: {target.user.contact_phone.e164}, message: {message}, resource_type: {resource_type}"
-            )
-        except Exception as e:
-            log(f"Error sending phone call notification: {e}")
+    if not on_shift_or_in_time_slot(
+        session, target.user, prefs[resource_type]['whatsapp']
+    ):
+        return False
+
+    client.messages.create(
+        body=f"{cfg['app.title']} - {target.text}",
+        from_="whatsapp:" + str(from_number),
+        to="whatsapp" + str(target.user.contact_phone.e164),
+    )
+    log(
+        f"Sent WhatsApp notification to user {target.user.id} at phone number: {target.user.contact_phone.e164}, body: {target.text}, resource_type: {resource_type}"
+    )
+    return True
+
+
+# external channels, delivered by the notification_queue service
+DELIVERY_CHANNELS = {
+    "slack": deliver_slack_notification,
+    "email": deliver_email_notification,
+    "sms": deliver_sms_notification,
+    "phone": deliver_phone_notification,
+    "whatsapp": deliver_whatsapp_notification,
+}
 
 
 @event.listens_for(UserNotification, 'after_insert')
-def send_whatsapp_notification(mapper, connection, target):
+def enqueue_notification_deliveries(mapper, connection, target):
+    # Only record the deliveries (in the same transaction as the
+    # notification): sending them could block the flush for a long time
     resource_type = notification_resource_type(target)
-    prefs = user_preferences(target, "whatsapp", resource_type)
-    if not prefs:
+    channels = [
+        channel
+        for channel in DELIVERY_CHANNELS
+        if user_preferences(target, channel, resource_type)
+    ]
+    if len(channels) == 0:
         return
 
-    sending = False
-    if prefs[resource_type]['whatsapp'].get("on_shift", False):
-        current_shift = (
-            Shift.query.join(ShiftUser)
-            .filter(ShiftUser.user_id == target.user.id)
-            .filter(Shift.start_date <= arrow.utcnow().datetime)
-            .filter(Shift.end_date >= arrow.utcnow().datetime)
-            .first()
-        )
-        if current_shift is not None:
-            sending = True
-
-    timeslot = prefs[resource_type]['whatsapp'].get("time_slot", [])
-    if len(timeslot) > 0:
-        current_time = arrow.utcnow().datetime
-        if timeslot[0] < timeslot[1]:
-            if current_time.hour >= timeslot[0] and current_time.hour <= timeslot[1]:
-                sending = True
-        else:
-            if current_time.hour <= timeslot[1] or current_time.hour >= timeslot[0]:
-                sending = True
-
-    if sending:
-        try:
-            client.messages.create(
-                body=f"{cfg['app.title']} - {target.text}",
-                from_="whatsapp:" + str(from_number),
-                to="whatsapp" + str(target.user.contact_phone.e164),
-            )
-            log(
-                f"Sent WhatsApp notification to user {target.user.id} at phone number: {target.user.contact_phone.e164}, body: {target.text}, resource_type: {resource_type}"
-            )
-        except Exception as e:
-            log(f"Error sending WhatsApp notification: {e}")
+    connection.execute(
+        sa.insert(NotificationDelivery.__table__),
+        [{"notification_id": target.id, "channel": channel} for channel in channels],
+    )
 
 
 @event.listens_for(UserNotification, 'after_insert')
@@ -60,7 +60,7 @@ from .enum_types import ALLOWED_SPECTRUM_TYPES
 # use the full registry from the enum_types import of sykportal
 # which may have custom bandpasses
 from .enum_types import sncosmo as snc
-from skyportal.handlers.api.photometry import serialize
+from skyportal.handlers.api.photometry import serialize_photometry
 
 _, cfg = load_env()
 # The minimum signal-to-noise ratio to consider a photometry point as detected
@@ -1896,14 +1896,12 @@ async def photometry_plot(obj_id, user_id, session, width=600, device="browser")
         .where(Photometry.obj_id == obj_id)
     ).all()
 
-    query_result = []
-    for p in data:
-        telescope = p.instrument.telescope.nickname
-        instrument = p.instrument.name
-        result = serialize(p, 'ab', 'both', groups=False, annotations=False)
-        result['telescope'] = telescope
-        result['instrument'] = instrument
-        query_result.append(result)
+    query_result = serialize_photometry(
+        data, 'ab', 'both', groups=False, annotations=False
+    )
+    for p, result in zip(data, query_result):
+        result['telescope'] = p.instrument.telescope.nickname
+        result['instrument'] = p.instrument.name
 
     data = pd.DataFrame.from_dict(query_result)
     if data.empty:
@@ -1613,3 +1613,69 @@ def test_candidates_annotation_filtering(
     )
     assert status == 200
     assert len(data["data"]["candidates"]) == 0
+
+
+def test_token_user_post_bulk_candidates(
+    upload_data_token, view_only_token, public_filter, public_candidate
+):
+    obj_id = str(uuid.uuid4())
+    passed_at = str(datetime.datetime.utcnow())
+    candidate = {
+        "id": obj_id,
+        "ra": 234.22,
+        "dec": -22.33,
+        "redshift": 3,
+        "transient": False,
+        "ra_dis": 2.3,
+        "filter_ids": [public_filter.id],
+        "passed_at": passed_at,
+    }
+    status, data = api(
+        "POST",
+        "candidates/bulk",
+        data={
+            "candidates": [
+                candidate,
+                # a second pass of a new Obj in the same batch
+                {**candidate, "passed_at": str(datetime.datetime.utcnow())},
+                # a new pass of an existing Obj
+                {
+                    "id": public_candidate.id,
+                    "filter_ids": [public_filter.id],
+                    "passed_at": str(datetime.datetime.utcnow()),
+                },
+                # invalid candidates
+                {**candidate, "id": str(uuid.uuid4()), "ra": None},
+                {key: value for key, value in candidate.items() if key != "passed_at"},
+            ]
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    results = data["data"]["candidates"]
+    assert [result["status"] for result in results] == [
+        "success",
+        "success",
+        "success",
+        "error",
+        "error",
+    ]
+    assert all(len(result["ids"]) == 1 for result in results[:3])
+    assert "RA must not be null" in results[3]["message"]
+    assert "passed_at" in results[4]["message"]
+
+    status, data = api("GET", f"candidates/{obj_id}", token=view_only_token)
+    assert status == 200
+    assert data["data"]["id"] == obj_id
+    npt.assert_almost_equal(data["data"]["ra"], 234.22)
+
+    # the same pass cannot be posted twice
+    status, data = api(
+        "POST",
+        "candidates/bulk",
+        data={"candidates": [candidate]},
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data["data"]["candidates"][0]["status"] == "error"
+    assert "already exists" in data["data"]["candidates"][0]["message"]
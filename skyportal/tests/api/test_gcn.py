@@ -11,6 +11,22 @@ from regions import Regions
 from astropy.table import Table
 
 import pytest
+import requests
+
+
+def test_from_url_local_file(monkeypatch):
+    def unreachable(*args, **kwargs):
+        raise requests.exceptions.ConnectionError()
+
+    # local skymap files are read directly, not downloaded
+    monkeypatch.setattr(requests, 'get', unreachable)
+    path = f'{os.path.dirname(__file__)}/../data/GRB220617A_IPN_map_hpx.fits.gz'
+    skymap = from_url(path)
+    assert skymap['localization_name'] == 'GRB220617A_IPN_map_hpx.fits.gz'
+    assert len(skymap['uniq']) == len(skymap['probdensity']) > 0
+
+    # and decoded once
+    assert from_url(path)['uniq'] is skymap['uniq']
 
 
 def test_gcn_GW(super_admin_token, view_only_token):
@@ -29,6 +45,11 @@ def test_gcn_GW(super_admin_token, view_only_token):
         assert status == 200
         assert data['status'] == 'success'
 
+    # the same notice (ivorn) cannot be posted twice
+    status, data = api('POST', 'gcn_event', data=event_data, token=super_admin_token)
+    assert status == 400
+    assert 'already exists' in data['message']
+
     dateobs = "2019-04-25 08:18:05"
     status, data = api('GET', f'gcn_event/{dateobs}', token=super_admin_token)
     assert status == 200
@@ -0,0 +1,44 @@
+import sqlalchemy as sa
+
+from skyportal.models import DBSession, NotificationDelivery, UserNotification
+
+
+def test_notification_deliveries_are_enqueued(user, view_only_user):
+    session = DBSession()
+    user.preferences = {
+        'slack_integration': {
+            'active': True,
+            'url': 'https://hooks.slack.com/services/test',
+        },
+        'notifications': {'mention': {'active': True, 'slack': {'active': True}}},
+    }
+    session.add(user)
+    session.commit()
+
+    notification = UserNotification(
+        user=user, text='You were mentioned', notification_type='mention', url='/'
+    )
+    other_notification = UserNotification(
+        user=view_only_user, text='You were mentioned', notification_type='mention'
+    )
+    session.add_all([notification, other_notification])
+    session.commit()
+
+    # only recorded, to be sent by the notification_queue service
+    deliveries = session.scalars(
+        sa.select(NotificationDelivery).where(
+            NotificationDelivery.notification_id.in_(
+                [notification.id, other_notification.id]
+            )
+        )
+    ).all()
+    assert len(deliveries) == 1
+    assert deliveries[0].notification_id == notification.id
+    assert deliveries[0].channel == 'slack'
+    assert deliveries[0].status == 'pending'
+    assert deliveries[0].attempts == 0
+    assert deliveries[0].sent_at is None
+
+    session.delete(notification)
+    session.delete(other_notification)
+    session.commit()
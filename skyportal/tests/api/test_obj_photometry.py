@@ -1,5 +1,9 @@
+import io
+import json
 import uuid
 
+import pandas as pd
+
 from skyportal.tests import api
 
 
@@ -24,3 +28,54 @@ def test_obj_photometry(upload_data_token, public_source):
         data['message']
         == f'Insufficient permissions for User {upload_data_token} to read Obj {obj_id}'
     )
+
+
+def test_obj_photometry_stream(upload_data_token, public_source):
+    status, data = api(
+        "GET",
+        f"sources/{public_source.id}/photometry",
+        params={"format": "flux"},
+        token=upload_data_token,
+    )
+    assert status == 200
+    expected = {phot['id']: phot for phot in data['data']}
+
+    response = api(
+        "GET",
+        f"sources/{public_source.id}/photometry",
+        params={"format": "flux", "stream": True},
+        token=upload_data_token,
+        raw_response=True,
+    )
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/x-ndjson'
+    streamed = [json.loads(line) for line in response.text.splitlines()]
+    assert len(streamed) == len(expected)
+    mjds = [phot['mjd'] for phot in streamed]
+    assert mjds == sorted(mjds)
+    for phot in streamed:
+        assert phot['flux'] == expected[phot['id']]['flux']
+        assert phot['zp'] == expected[phot['id']]['zp']
+
+    response = api(
+        "GET",
+        f"sources/{public_source.id}/photometry",
+        params={"format": "mag", "stream": True, "streamFormat": "csv"},
+        token=upload_data_token,
+        raw_response=True,
+    )
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'text/csv'
+    df = pd.read_csv(io.StringIO(response.text))
+    assert len(df) == len(expected)
+    assert set(df['id']) == set(expected)
+    assert 'limiting_mag' in df.columns
+
+    status, data = api(
+        "GET",
+        f"sources/{public_source.id}/photometry",
+        params={"stream": True, "streamFormat": "parquet"},
+        token=upload_data_token,
+    )
+    assert status == 400
+    assert 'Invalid streamFormat' in data['message']
@@ -1,3 +1,4 @@
+import datetime
 import os
 import numpy as np
 import pandas as pd
@@ -6,9 +7,40 @@ from regions import Regions
 import pytest
 
 import uuid
+from skyportal.handlers.api.observation import parse_obstimes
 from skyportal.tests import api
 
 
+def test_parse_obstimes():
+    expected = ['2019-04-25T08:18:05.000', '2019-04-25T09:18:05.000']
+    times = [
+        datetime.datetime(2019, 4, 25, 8, 18, 5),
+        datetime.datetime(2019, 4, 25, 9, 18, 5),
+    ]
+
+    # datetime objects, e.g., from the ZTF and Swift APIs
+    assert (
+        parse_obstimes(pd.DataFrame({'obstime': times})['obstime']).isot.tolist()
+        == expected
+    )
+    assert parse_obstimes(pd.Series(times, dtype=object)).isot.tolist() == expected
+    assert (
+        parse_obstimes(
+            pd.Series(pd.to_datetime(times)).dt.tz_localize('UTC')
+        ).isot.tolist()
+        == expected
+    )
+
+    # JDs, as numbers or strings
+    jds = [2458598.846, 2458598.887]
+    assert np.allclose(parse_obstimes(pd.Series(jds)).jd, jds)
+    assert np.allclose(parse_obstimes(pd.Series([str(jd) for jd in jds])).jd, jds)
+
+    # iso and isot strings, possibly mixed
+    mixed = pd.Series(['2019-04-25 08:18:05', '2019-04-25T09:18:05'])
+    assert parse_obstimes(mixed).isot.tolist() == expected
+
+
 @pytest.mark.flaky(reruns=2)
 def test_observation(super_admin_token, view_only_token):
 
@@ -118,6 +150,29 @@ def test_observation(super_admin_token, view_only_token):
             observation_id = d['id']
             break
 
+    # posting the same observations again does not duplicate them
+    data = {
+        'telescopeName': telescope_name,
+        'instrumentName': instrument_name,
+        'observationData': pd.read_csv(datafile).to_dict(orient='list'),
+    }
+    status, data = api('POST', 'observation', data=data, token=super_admin_token)
+    assert status == 200
+    assert data['status'] == 'success'
+
+    time.sleep(15)
+
+    data = {
+        'telescopeName': telescope_name,
+        'instrumentName': instrument_name,
+        'startDate': "2019-04-25 08:18:05",
+        'endDate': "2019-04-28 08:18:05",
+        'numPerPage': 1000,
+    }
+    status, data = api('GET', 'observation', params=data, token=super_admin_token)
+    assert status == 200
+    assert len(data['data']['observations']) == 10
+
     data = {
         'startDate': "2019-04-25 08:18:05",
         'endDate': "2019-04-28 08:18:05",
@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 import traceback
 from skyportal.tests import api
 from baselayer.app.env import load_env
@@ -960,3 +961,117 @@ def check_dict_has_no_nans(some_dict):
                 assert not np.isnan(v)
             if isinstance(v, dict):
                 check_dict_has_no_nans(v)
+
+
+def test_phot_stats_multi_object_upload(upload_data_token, public_group, ztf_camera):
+    source_ids = [str(uuid.uuid4()) for _ in range(3)]
+    for source_id in source_ids:
+        status, data = api(
+            "POST",
+            "sources",
+            data={
+                "id": source_id,
+                "ra": np.random.uniform(0, 360),
+                "dec": np.random.uniform(-90, 90),
+                "group_ids": [public_group.id],
+            },
+            token=upload_data_token,
+        )
+        assert status == 200
+
+    # the first object gets more points than are added one by one,
+    # the others only a handful
+    num_points = [60, 3, 1]
+    obj_ids = np.repeat(source_ids, num_points).tolist()
+    n = len(obj_ids)
+    status, data = api(
+        'POST',
+        'photometry',
+        data={
+            'obj_id': obj_ids,
+            'mjd': (59000 + np.arange(n)).tolist(),
+            'instrument_id': ztf_camera.id,
+            'flux': np.random.uniform(100, 200, n).tolist(),
+            'fluxerr': [10.0] * n,
+            'zp': 25.0,
+            'magsys': 'ab',
+            'filter': 'ztfr',
+            'group_ids': [public_group.id],
+        },
+        token=upload_data_token,
+    )
+    assert status == 200
+    assert data['status'] == 'success'
+
+    for source_id, num in zip(source_ids, num_points):
+        status, data = api(
+            'GET', f'sources/{source_id}/phot_stat', token=upload_data_token
+        )
+        assert status == 200
+        assert data['data']['num_obs_global'] == num
+        assert data['data']['num_det_global'] == num
+
+
+def test_phot_stats_columnar_input():
+    num_points = 50
+    flux = np.random.normal(100, 50, num_points)
+    fluxerr = np.random.uniform(5, 20, num_points)
+    filters = np.random.choice(['ztfg', 'ztfr', 'ztfi'], num_points)
+    mjd = np.random.uniform(55000, 56000, num_points)
+    original_user_data = [
+        {'limiting_mag': 21.0} if i % 5 == 0 else None for i in range(num_points)
+    ]
+    rows = [
+        {
+            'flux': flux[i],
+            'fluxerr': fluxerr[i],
+            'filter': filters[i],
+            'mjd': mjd[i],
+            'original_user_data': original_user_data[i],
+        }
+        for i in range(num_points)
+    ]
+    columns = {
+        'flux': flux,
+        'fluxerr': fluxerr,
+        'filter': filters,
+        'mjd': mjd,
+        'original_user_data': original_user_data,
+    }
+
+    ps_rows = PhotStat('some_obj')
+    ps_rows.full_update(rows)
+    for phot_list in [columns, pd.DataFrame(columns)]:
+        ps = PhotStat('some_obj')
+        ps.full_update(phot_list)
+        for key in ['num_obs_global', 'num_det_global', 'predetection_mjds']:
+            assert getattr(ps, key) == getattr(ps_rows, key)
+        for key in [
+            'num_obs_per_filter',
+            'num_det_per_filter',
+            'deepest_limit_per_filter',
+        ]:
+            assert getattr(ps, key) == getattr(ps_rows, key)
+        for key in ['mean_mag_global', 'peak_mag_global', 'deepest_limit_global']:
+            assert np.isclose(getattr(ps, key), getattr(ps_rows, key))
+
+    # limiting magnitudes can also be given as a column
+    columns = {
+        'flux': flux,
+        'fluxerr': fluxerr,
+        'filter': filters,
+        'mjd': mjd,
+        'limiting_mag': [
+            np.nan if data is None else data['limiting_mag']
+            for data in original_user_data
+        ],
+    }
+    ps = PhotStat('some_obj')
+    ps.full_update(columns)
+    assert ps.deepest_limit_global == ps_rows.deepest_limit_global
+
+    # no photometry at all
+    ps = PhotStat('some_obj')
+    ps.full_update({'flux': [], 'fluxerr': [], 'filter': [], 'mjd': []})
+    assert ps.num_obs_global == 0
+    assert ps.last_full_update is not None
@@ -1176,6 +1176,21 @@ def test_get_individual_series_by_id(
     assert data['data']['totalMatches'] >= 3
     assert len(data['data']['series']) >= 3
     assert set(ps_ids).issubset({ps['id'] for ps in data['data']['series']})
+    # the data is not read from disk unless requested
+    assert all('data' not in ps for ps in data['data']['series'])
+    # the summary statistics are saved in the DB
+    assert all(ps['num_exp'] is not None for ps in data['data']['series'])
+
+    status, data = api(
+        'GET',
+        'photometric_series',
+        params={'includeData': True},
+        token=upload_data_token,
+    )
+    assert_api(status, data)
+    for ps in data['data']['series']:
+        if ps['id'] in ps_ids:
+            assert len(ps['data']['mjd']) == ps['num_exp']
 
 
 def test_get_series_cone_search(
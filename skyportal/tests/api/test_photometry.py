@@ -10,6 +10,11 @@ from baselayer.app.env import load_env
 from skyportal.models import DBSession, Token
 from skyportal.tests import api, assert_api
 from skyportal.models.photometry import Photometry
+from skyportal.handlers.api.photometry import (
+    get_zp_correction,
+    serialize,
+    serialize_photometry,
+)
 
 _, cfg = load_env()
 PHOT_DETECTION_THRESHOLD = cfg["misc.photometry_detection_threshold_nsigma"]
@@ -2992,3 +2997,37 @@ def test_photometry_stream_patch_access(
     )
     assert status == 200
     assert data['status'] == 'success'
+
+
+def test_zp_correction_is_cached():
+    get_zp_correction.cache_clear()
+    ab = sncosmo.get_magsystem('ab')
+    vega = sncosmo.get_magsystem('vega')
+    correction = 2.5 * np.log10(vega.zpbandflux('ztfg') / ab.zpbandflux('ztfg'))
+
+    np.testing.assert_allclose(get_zp_correction('vega', 'ztfg'), correction)
+    np.testing.assert_allclose(get_zp_correction('ab', 'ztfg', 'vega'), -correction)
+    assert get_zp_correction('ab', 'ztfg') == 0
+
+    get_zp_correction('vega', 'ztfg')
+    assert get_zp_correction.cache_info().hits == 1
+
+
+def test_serialize_photometry_columns_match_single_points(public_source):
+    photometry = (
+        DBSession()
+        .scalars(sa.select(Photometry).where(Photometry.obj_id == public_source.id))
+        .all()
+    )
+    assert len(photometry) > 0
+
+    serialized = serialize_photometry(photometry, 'vega', 'both')
+    assert len(serialized) == len(photometry)
+    for phot, row in zip(photometry, serialized):
+        assert row == serialize(phot, 'vega', 'both')
+        if phot.flux > 0:
+            np.testing.assert_allclose(
+                row['mag'], phot.mag + get_zp_correction('vega', phot.filter)
+            )
+        else:
+            assert row['mag'] is None
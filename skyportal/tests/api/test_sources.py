@@ -7,8 +7,12 @@ from tdtax import taxonomy, __version__
 import astropy.units as u
 from astropy.time import Time
 
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
 from skyportal.tests import api
-from skyportal.models import cosmo
+from skyportal.models import cosmo, DBSession, Obj
+from skyportal.handlers.api.source import hydrate_sources
 
 from datetime import datetime, timezone, timedelta
 from dateutil import parser
@@ -2326,3 +2330,77 @@ def test_add_and_delete_source_label(upload_data_token, view_only_token, public_
     assert data["data"]["id"] == obj_id
 
     assert len(data["data"]["labellers"]) == 0
+
+
+def test_hydrate_sources_query_count_independent_of_page_size(
+    super_admin_user, public_source, public_source_two_groups, public_source_group2
+):
+    session = Session(bind=DBSession.session_factory.kw["bind"])
+    session.user_or_token = session.merge(super_admin_user)
+    objs = [
+        session.scalars(sa.select(Obj).where(Obj.id == obj.id)).first()
+        for obj in [public_source, public_source_two_groups, public_source_group2]
+    ]
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    hydrate_kwargs = {
+        "include_thumbnails": True,
+        "include_comments": True,
+        "include_photometry_exists": True,
+        "include_spectrum_exists": True,
+        "include_period_exists": True,
+        "include_labellers": True,
+    }
+
+    engine = session.get_bind()
+    sa.event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        hydrate_sources(session, objs[:1], **hydrate_kwargs)
+        num_queries_single = len(statements)
+
+        statements.clear()
+        sources = hydrate_sources(session, objs, **hydrate_kwargs)
+        num_queries_page = len(statements)
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", count_statement)
+        session.close()
+
+    assert [s["id"] for s in sources] == [obj.id for obj in objs]
+    assert len(sources[1]["groups"]) == 2
+    assert all(s["photometry_exists"] for s in sources)
+    # one query per relation, no matter how many objs are on the page
+    assert num_queries_page <= num_queries_single
+
+
+def test_obj_derived_columns_match_properties():
+    objs = [
+        Obj(id=str(uuid.uuid4()), ra=10.0, dec=-20.0, redshift=0.05),
+        Obj(id=str(uuid.uuid4()), ra=150.0, dec=2.5, redshift=2.5),
+        Obj(id=str(uuid.uuid4()), ra=280.0, dec=-30.0, redshift=0.0005),
+        Obj(id=str(uuid.uuid4()), ra=300.5, dec=45.0),
+        Obj(
+            id=str(uuid.uuid4()),
+            ra=0.5,
+            dec=89.0,
+            redshift=0.01,
+            altdata={"dist_Mpc": 12.0},
+        ),
+        Obj(id=str(uuid.uuid4()), ra=359.0, dec=-89.0, redshift=15.0),
+    ]
+
+    derived_columns = Obj.derived_columns(objs)
+    assert len(derived_columns) == len(objs)
+    for obj, columns in zip(objs, derived_columns):
+        npt.assert_allclose(columns["gal_lon"], obj.gal_lon_deg)
+        npt.assert_allclose(columns["gal_lat"], obj.gal_lat_deg)
+        for key in ["luminosity_distance", "dm", "angular_diameter_distance"]:
+            if getattr(obj, key) is None:
+                assert columns[key] is None
+            else:
+                npt.assert_allclose(columns[key], getattr(obj, key), rtol=1e-6)
+
+    assert Obj.derived_columns([]) == []
@@ -1,10 +1,21 @@
 import shutil
 import os
+import threading
 import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from os.path import join as pjoin
 
+import numpy as np
 import pytest
+import requests
 
+from skyportal.utils.cache import (
+    ArrayCache,
+    DownloadCache,
+    SQLiteCache,
+    file_checksum,
+)
 from skyportal.utils.offset import Cache
 
 
@@ -93,3 +104,174 @@ def test_cache_no_max_limit(cache_parent_dir):
         cache[str(i)] = b'x'
 
     assert len(cache) == 100
+
+
+@pytest.fixture()
+def sqlite_cache(cache_parent_dir):
+    cache_file = pjoin(cache_parent_dir, 'sqlite_cache', 'cache.sqlite')
+    yield SQLiteCache(cache_file, max_items=3, max_age=3)
+    shutil.rmtree(os.path.dirname(cache_file))
+
+
+def test_sqlite_cache_hit(sqlite_cache):
+    sqlite_cache['some_key'] = b'abc'
+    assert sqlite_cache['some_key'] == b'abc'
+    assert sqlite_cache['missing_key'] is None
+
+
+def test_sqlite_cache_max_items(sqlite_cache):
+    for i, key in enumerate(['a', 'b', 'c', 'd']):
+        sqlite_cache[key] = b'x'
+        assert len(sqlite_cache) == min(i + 1, 3)
+
+
+def test_sqlite_cache_reference_refresh(sqlite_cache):
+    """Last referred item should be last to be removed from cache."""
+    for i in range(3):
+        sqlite_cache[str(i)] = b'x'
+
+    time.sleep(0.1)  # ensure that timestamp is different
+    sqlite_cache['0']
+
+    sqlite_cache['3'] = b'x'
+    sqlite_cache['4'] = b'x'
+
+    assert sqlite_cache['0'] is not None
+    assert sqlite_cache['1'] is None
+
+
+def test_sqlite_cache_cleanup_by_age(sqlite_cache):
+    sqlite_cache['first'] = b'one'
+    assert sqlite_cache['first'] is not None
+
+    # Let object time out of cache
+    time.sleep(3.5)
+
+    assert sqlite_cache['first'] is None
+
+
+def test_sqlite_cache_invalidate(sqlite_cache):
+    sqlite_cache.set('query_1', b'x', tags=['group:1', 'group:2'])
+    sqlite_cache.set('query_2', b'y', tags=['group:2'])
+    sqlite_cache.set('query_3', b'z', tags=['group:3'])
+
+    sqlite_cache.invalidate(['group:1'])
+    assert sqlite_cache['query_1'] is None
+    assert sqlite_cache['query_2'] == b'y'
+
+    sqlite_cache.invalidate(['group:2', 'group:3'])
+    assert len(sqlite_cache) == 0
+
+
+def test_sqlite_cache_shared(sqlite_cache, cache_parent_dir):
+    other_cache = SQLiteCache(
+        pjoin(cache_parent_dir, 'sqlite_cache', 'cache.sqlite'), max_items=3
+    )
+    sqlite_cache.set('query', b'x', tags=['group:1'])
+    assert other_cache['query'] == b'x'
+
+    other_cache.invalidate(['group:1'])
+    assert sqlite_cache['query'] is None
+
+
+def test_array_cache_max_bytes():
+    cache = ArrayCache(max_bytes=3 * 8 * 100)
+    for name in 'abc':
+        cache.set(name, np.zeros(100))
+    assert len(cache) == 3
+
+    # least recently used array is evicted
+    assert cache.get('a') is not None
+    cache.set('d', np.zeros(100))
+    assert len(cache) == 3
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+
+    # arrays larger than the cache are not held in memory
+    cache.set('e', np.zeros(1000))
+    assert cache.get('e') is None
+
+    array = cache.get('a')
+    with pytest.raises(ValueError):
+        array[0] = 1
+
+
+def test_array_cache_on_disk(cache_parent_dir):
+    disk_cache = Cache(pjoin(cache_parent_dir, 'array_cache'), max_items=2)
+    cache = ArrayCache(max_bytes=0, disk_cache=disk_cache)
+    array = np.random.random((4, 100))
+    cache.set('a', array)
+    assert len(cache) == 0
+
+    # read back from disk, memory-mapped
+    other_cache = ArrayCache(max_bytes=10**6, disk_cache=disk_cache)
+    cached = other_cache.get('a')
+    assert isinstance(cached, np.memmap)
+    assert np.array_equal(cached, array)
+    assert len(other_cache) == 1
+    assert other_cache.get('b') is None
+
+
+@pytest.fixture()
+def file_server(tmp_path):
+    handler = partial(SimpleHTTPRequestHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield tmp_path, f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_cache(cache_parent_dir, file_server, monkeypatch):
+    served_dir, base_url = file_server
+    (served_dir / 'a.fits.gz').write_bytes(b'a' * 100)
+    (served_dir / 'b.fits.gz').write_bytes(b'a' * 100)
+    cache = DownloadCache(pjoin(cache_parent_dir, 'download_cache'), max_bytes=250)
+
+    path, checksum = cache.fetch(f'{base_url}/a.fits.gz')
+    assert path.read_bytes() == b'a' * 100
+    assert path.name == f'{checksum}.fits.gz'
+
+    # the same content from another URL is stored once
+    assert cache.fetch(f'{base_url}/b.fits.gz') == (path, checksum)
+    assert len(cache) == 1
+
+    # unchanged files are revalidated, not downloaded again
+    with monkeypatch.context() as m:
+        m.setattr(cache, '_store', None)
+        assert cache.fetch(f'{base_url}/a.fits.gz') == (path, checksum)
+
+    # changed files are downloaded again
+    time.sleep(1.1)  # Last-Modified has a resolution of one second
+    (served_dir / 'a.fits.gz').write_bytes(b'c' * 100)
+    new_path, new_checksum = cache.fetch(f'{base_url}/a.fits.gz')
+    assert new_checksum != checksum
+    assert new_path.read_bytes() == b'c' * 100
+    assert len(cache) == 2
+
+    # the least recently used files are removed
+    (served_dir / 'd.fits.gz').write_bytes(b'd' * 100)
+    cache.fetch(f'{base_url}/d.fits.gz')
+    assert len(cache) == 2
+    assert not path.exists()
+
+    # the cached file is used when the server cannot be reached
+    def unreachable(*args, **kwargs):
+        raise requests.exceptions.ConnectionError()
+
+    with monkeypatch.context() as m:
+        m.setattr(requests, 'get', unreachable)
+        assert cache.fetch(f'{base_url}/a.fits.gz') == (new_path, new_checksum)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            cache.fetch(f'{base_url}/b.fits.gz')
+
+
+def test_file_checksum(cache_parent_dir, file_server):
+    served_dir, base_url = file_server
+    (served_dir / 'a.fits.gz').write_bytes(b'a' * 100)
+    cache = DownloadCache(pjoin(cache_parent_dir, 'download_cache'), max_bytes=250)
+
+    # local files get the checksum of the same content downloaded
+    _, checksum = cache.fetch(f'{base_url}/a.fits.gz')
+    assert file_checksum(served_dir / 'a.fits.gz') == checksum
+    assert file_checksum(str(served_dir / 'a.fits.gz'), chunk_size=7) == checksum
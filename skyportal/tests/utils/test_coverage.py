@@ -0,0 +1,80 @@
+import healpix_alchemy as ha
+import numpy as np
+import pytest
+
+from skyportal.facility_apis.observation_plan import combine_healpix_tuples
+from skyportal.utils.coverage import (
+    coverage,
+    ranges_length,
+    ranges_overlap,
+    union_ranges,
+)
+
+
+def brute_force_overlap(lower, upper, query_lower, query_upper):
+    overlaps = []
+    covered = set()
+    for lo, hi in zip(lower, upper):
+        covered.update(range(lo, hi))
+    for lo, hi in zip(query_lower, query_upper):
+        overlaps.append(len(covered.intersection(range(lo, hi))))
+    return np.array(overlaps)
+
+
+def test_union_ranges():
+    lower, upper = union_ranges([10, 0, 5, 20, 30], [15, 6, 8, 25, 30])
+    assert lower.tolist() == [0, 10, 20]
+    assert upper.tolist() == [8, 15, 25]
+
+    lower, upper = union_ranges([], [])
+    assert len(lower) == len(upper) == 0
+
+    with pytest.raises(ValueError):
+        union_ranges([0, 1], [2])
+
+
+def test_ranges_length():
+    assert ranges_length([0, 5, 3], [4, 10, 7]) == 10
+    assert ranges_length([0, 10], [5, 15]) == 10
+    assert ranges_length([], []) == 0
+
+
+def test_ranges_overlap_matches_brute_force():
+    rng = np.random.default_rng(42)
+    for _ in range(50):
+        n, m = rng.integers(0, 30, size=2)
+        lower = rng.integers(0, 500, size=n)
+        upper = lower + rng.integers(0, 50, size=n)
+
+        # localization tiles do not overlap each other
+        edges = np.sort(rng.choice(600, size=2 * m, replace=False))
+        query_lower, query_upper = edges[::2], edges[1::2]
+
+        overlap = ranges_overlap(lower, upper, query_lower, query_upper)
+        expected = brute_force_overlap(lower, upper, query_lower, query_upper)
+        assert overlap.tolist() == expected.tolist()
+
+
+def test_coverage():
+    area, prob = coverage(
+        [0, 50], [100, 150], [0, 120, 200], [60, 160, 300], [1.0, 2.0, 3.0]
+    )
+    assert np.isclose(area, (60 + 30) * ha.constants.PIXEL_AREA)
+    assert np.isclose(prob, (60 * 1.0 + 30 * 2.0) * ha.constants.PIXEL_AREA)
+
+    area, prob = coverage([], [], [0], [10], [1.0])
+    assert area == 0
+    assert prob == 0
+
+
+def test_combine_healpix_tuples():
+    tiles = [(10, 15), (0, 6), (5, 8), (20, 25), (12, 14), (8, 9)]
+    assert combine_healpix_tuples(tiles) == [(0, 9), (10, 15), (20, 25)]
+    assert combine_healpix_tuples([]) == []
+
+    rng = np.random.default_rng(0)
+    lower = rng.integers(0, 10000, size=1000)
+    upper = lower + rng.integers(1, 100, size=1000)
+    merged = combine_healpix_tuples(list(zip(lower, upper)))
+    assert all(hi < lo for (_, hi), (lo, _) in zip(merged[:-1], merged[1:]))
+    assert sum(hi - lo for lo, hi in merged) == ranges_length(lower, upper)
@@ -0,0 +1,19 @@
+import numpy as np
+
+from skyportal.utils.extinction import ebv_for, get_sfd_query
+
+
+def test_sfd_query_is_shared():
+    assert get_sfd_query() is get_sfd_query()
+
+
+def test_ebv_for_matches_single_queries():
+    ra = np.array([10.0, 150.0, 280.0, 300.5])
+    dec = np.array([-20.0, 2.5, -30.0, 45.0])
+
+    ebv = ebv_for(ra, dec)
+    assert ebv.shape == (4,)
+    for i in range(len(ra)):
+        assert np.isclose(ebv[i], ebv_for(ra[i], dec[i])[0])
+
+    assert len(ebv_for([], [])) == 0
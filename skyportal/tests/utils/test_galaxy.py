@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from skyportal.utils.galaxy import (
+    GALAXY_COLUMNS,
+    GLADE_COLUMNS,
+    IngestionProgress,
+    file_chunks,
+    parse_glade_chunks,
+    prepare_galaxies,
+)
+
+
+def write_glade(path, n_rows):
+    rng = np.random.default_rng(0)
+    with open(path, 'w') as f:
+        for ii in range(n_rows):
+            row = ['null'] * len(GLADE_COLUMNS)
+            row[GLADE_COLUMNS.index('GLADE_no')] = str(ii + 1)
+            row[GLADE_COLUMNS.index('RA')] = f'{rng.uniform(0, 360):.6f}'
+            row[GLADE_COLUMNS.index('Dec')] = f'{rng.uniform(-90, 90):.6f}'
+            row[GLADE_COLUMNS.index('z_helio')] = f'{rng.uniform(-0.01, 0.1):.6f}'
+            row[GLADE_COLUMNS.index('d_L')] = f'{rng.uniform(-1, 500):.3f}'
+            f.write(' '.join(row) + '\n')
+
+
+def test_prepare_galaxies():
+    df = prepare_galaxies(
+        pd.DataFrame(
+            {
+                'ra': [10.0, 400.0, 20.0, None, 30.0],
+                'dec': [0.0, 0.0, -95.0, 0.0, 45.0],
+                'name': ['a', 'b', 'c', 'd', 'e'],
+                'distmpc': [100.0, 100.0, 100.0, 100.0, None],
+            }
+        ),
+        'test',
+    )
+    assert df.columns.tolist() == GALAXY_COLUMNS
+    assert df['name'].tolist() == ['a', 'e']
+    assert (df['catalog_name'] == 'test').all()
+    assert df['healpix'].dtype == np.int64
+    assert df['healpix'].nunique() == 2
+
+
+def test_glade_chunks_and_progress(tmp_path):
+    path = str(tmp_path / 'GLADE+.txt')
+    write_glade(path, 1000)
+
+    chunks = file_chunks(path, chunk_size=10000)
+    assert len(chunks) > 1
+    assert chunks[0][0] == 0
+    assert all(a[1] == b[0] for a, b in zip(chunks[:-1], chunks[1:]))
+
+    names = []
+    for csv, _ in parse_glade_chunks(path, chunks):
+        names.extend(row.split(',')[2] for row in csv.splitlines())
+    single = list(parse_glade_chunks(path, [file_chunks(path)[0]]))
+    assert names == [row.split(',')[2] for row in single[0][0].splitlines()]
+    assert len(names) == len(set(names)) > 0
+
+    # parsed in worker processes, a few parts at a time, in order
+    parallel = []
+    for csv, _ in parse_glade_chunks(path, chunks, max_processes=2):
+        parallel.extend(row.split(',')[2] for row in csv.splitlines())
+    assert parallel == names
+
+    progress = IngestionProgress(str(tmp_path / 'progress'), path, chunks)
+    progress.add(0)
+    progress.add(2)
+    progress = IngestionProgress(str(tmp_path / 'progress'), path, chunks)
+    assert progress.done == {0, 2}
+    progress.clear()
+    progress = IngestionProgress(str(tmp_path / 'progress'), path, chunks)
+    assert progress.done == set()
@@ -0,0 +1,115 @@
+import healpix_alchemy as ha
+import numpy as np
+
+from skyportal.utils.moc import (
+    credible_region,
+    intersection,
+    product,
+    ranges_to_uniq,
+    union,
+)
+from skyportal.utils.tiles import uniq_to_ranges
+
+MAX_LEVEL = 4
+
+
+def random_moc(rng, max_level=MAX_LEVEL, refine=0.3):
+    """Random full-sky multi-order map, refining cells at random."""
+    uniq = []
+    cells = [(0, ipix) for ipix in range(12)]
+    while cells:
+        level, ipix = cells.pop()
+        if level < max_level and rng.random() < refine:
+            cells.extend((level + 1, 4 * ipix + i) for i in range(4))
+        else:
+            uniq.append(4 * 4**level + ipix)
+    uniq = np.array(uniq)
+    return uniq, rng.random(len(uniq))
+
+
+def rasterize(uniq, values, max_level=MAX_LEVEL):
+    """Value of each pixel at max_level (NaN where not covered)."""
+    shift = 2 * (ha.constants.LEVEL - max_level)
+    lower, upper = uniq_to_ranges(uniq)
+    raster = np.full(12 * 4**max_level, np.nan)
+    for lo, hi, value in zip(lower >> shift, upper >> shift, values):
+        raster[lo:hi] = value
+    return raster
+
+
+def test_ranges_to_uniq():
+    uniq, _ = random_moc(np.random.default_rng(0))
+    lower, upper = uniq_to_ranges(uniq)
+
+    # cells are recovered from their ranges
+    recovered, index = ranges_to_uniq(lower, upper)
+    assert sorted(recovered.tolist()) == sorted(uniq.tolist())
+    assert np.all(recovered == uniq[index])
+
+    # the whole sky is the 12 base cells
+    uniq, index = ranges_to_uniq([0], [12 * 4**ha.constants.LEVEL])
+    assert uniq.tolist() == list(range(4, 16))
+    assert index.tolist() == [0] * 12
+
+    # unaligned ranges are split into the largest cells that fit
+    uniq, _ = ranges_to_uniq([4**28 - 1], [4**28 + 4**27 + 1])
+    lower, upper = uniq_to_ranges(uniq)
+    assert lower[0] == 4**28 - 1
+    assert upper[-1] == 4**28 + 4**27 + 1
+    assert np.all(lower[1:] == upper[:-1])
+    assert len(uniq) == 3
+
+
+def test_product_matches_rasterized_product():
+    rng = np.random.default_rng(1)
+    uniq1, probdensity1 = random_moc(rng)
+    uniq2, probdensity2 = random_moc(rng)
+
+    uniq, probdensity = product(uniq1, probdensity1, uniq2, probdensity2)
+
+    expected = rasterize(uniq1, probdensity1) * rasterize(uniq2, probdensity2)
+    expected /= np.sum(expected) * 4 ** (ha.constants.LEVEL - MAX_LEVEL)
+    expected /= ha.constants.PIXEL_AREA
+    assert np.allclose(rasterize(uniq, probdensity), expected)
+
+    # the result is as fine as the finest of the two maps, not finer
+    assert len(uniq) <= len(uniq1) + len(uniq2)
+
+
+def test_intersection_and_union():
+    rng = np.random.default_rng(2)
+    uniq1, _ = random_moc(rng)
+    uniq2, _ = random_moc(rng)
+    region1 = credible_region(uniq1, rng.random(len(uniq1)), 0.5)
+    region2 = credible_region(uniq2, rng.random(len(uniq2)), 0.5)
+
+    covered1 = ~np.isnan(rasterize(region1, np.ones(len(region1))))
+    covered2 = ~np.isnan(rasterize(region2, np.ones(len(region2))))
+
+    both = intersection(region1, region2)
+    assert np.array_equal(
+        ~np.isnan(rasterize(both, np.ones(len(both)))), covered1 & covered2
+    )
+    either = union(region1, region2)
+    assert np.array_equal(
+        ~np.isnan(rasterize(either, np.ones(len(either)))), covered1 | covered2
+    )
+
+
+def test_credible_region():
+    rng = np.random.default_rng(3)
+    uniq, probdensity = random_moc(rng)
+    lower, upper = uniq_to_ranges(uniq)
+    probability = probdensity * (upper - lower)
+    probability /= np.sum(probability)
+
+    region = credible_region(uniq, probdensity, 0.9)
+    in_region = np.isin(uniq, region)
+    assert np.sum(probability[in_region]) >= 0.9
+    # removing the least dense cell of the region goes below the level
+    least_dense = np.argmin(np.where(in_region, probdensity, np.inf))
+    assert np.sum(probability[in_region]) - probability[least_dense] < 0.9
+    # all the cells outside of the region are less dense
+    assert np.max(probdensity[~in_region]) <= np.min(probdensity[in_region])
+
+    assert len(credible_region([], [], 0.9)) == 0
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from skyportal.utils.npy_files import (
+    dump_dataframe_to_directory,
+    load_dataframe_from_directory,
+    load_directory_arrays,
+    load_directory_metadata,
+    time_range_slice,
+)
+
+
+def test_npy_directory_round_trip(tmp_path):
+    df = pd.DataFrame(
+        {
+            'mjd': 60000 + np.arange(100) / 86400,
+            'flux': np.random.default_rng(0).normal(1000, 10, 100),
+            'filter': ['ztfr'] * 100,
+        }
+    )
+    path = str(tmp_path / 'series.cols')
+    dump_dataframe_to_directory(df, path, metadata={'ra': np.float64(10.5)})
+
+    assert load_directory_metadata(path) == {'ra': 10.5}
+
+    data, names = load_dataframe_from_directory(path)
+    assert names == ['mjd', 'flux', 'filter']
+    pd.testing.assert_frame_equal(data, df, check_dtype=False)
+
+    arrays, _ = load_directory_arrays(path, ['flux', 'nonexistent'])
+    assert list(arrays) == ['flux']
+    assert isinstance(arrays['flux'], np.memmap)
+    assert not arrays['flux'].flags.writeable
+
+    # saving again replaces the old columns
+    dump_dataframe_to_directory(df[['mjd']], path)
+    _, names = load_dataframe_from_directory(path)
+    assert names == ['mjd']
+
+
+def test_time_range_slice():
+    times = np.arange(10.0)
+    assert time_range_slice(times, 2, 5) == slice(2, 6)
+    assert time_range_slice(times, None, 1.5) == slice(0, 2)
+    assert time_range_slice(times, 8.5) == slice(9, 10)
+    assert time_range_slice(times, 20, 30) == slice(10, 10)
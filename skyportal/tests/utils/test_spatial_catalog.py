@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from skyportal.utils.gcn import from_cone, from_cones, from_ellipse, from_ellipses
+from skyportal.utils.spatial_catalog import catalog_shape, catalog_skymaps
+from skyportal.utils.tiles import uniq_to_ranges
+
+
+def covered_pixels(uniq, level=13):
+    """Pixels at the given level covered by a multi-order map."""
+    shift = 2 * (29 - level)
+    lower, upper = uniq_to_ranges(uniq)
+    return np.concatenate(
+        [np.arange(lo, hi) for lo, hi in zip(lower >> shift, upper >> shift)]
+    )
+
+
+def test_from_cones():
+    rng = np.random.default_rng(0)
+    ra = rng.uniform(0, 360, 20)
+    dec = rng.uniform(-89, 89, 20)
+    error = rng.choice([0.01, 0.1, 0.5], 20)
+
+    for r, d, e, (uniq, probdensity) in zip(
+        ra, dec, error, from_cones(ra, dec, error, n_sigma=2)
+    ):
+        skymap = from_cone(r, d, e, n_sigma=2)
+        assert np.all(np.diff(uniq) > 0)
+        # the same pixels, with at most a few more on the edge
+        in_cone = np.isin(uniq, skymap['uniq'])
+        assert np.sum(in_cone) == len(skymap['uniq'])
+        assert np.sum(~in_cone) < 0.02 * len(uniq)
+        assert np.allclose(probdensity[in_cone], skymap['probdensity'], rtol=1e-2)
+
+
+def test_from_ellipses():
+    rng = np.random.default_rng(1)
+    ra = rng.uniform(0, 360, 5)
+    dec = rng.uniform(-89, 89, 5)
+    amaj = rng.uniform(0.01, 0.1, 5)
+    amin = amaj * rng.uniform(0.3, 1, 5)
+    phi = rng.uniform(0, 180, 5)
+
+    for args, (uniq, probdensity) in zip(
+        zip(ra, dec, amaj, amin, phi), from_ellipses(ra, dec, amaj, amin, phi)
+    ):
+        skymap = from_ellipse('ellipse', *args)
+        # the same region, with fewer (multi-order) pixels
+        assert len(uniq) <= len(skymap['uniq'])
+        assert np.array_equal(
+            np.sort(covered_pixels(uniq)), np.sort(covered_pixels(skymap['uniq']))
+        )
+        assert np.allclose(probdensity, skymap['probdensity'][0])
+
+
+def test_catalog_skymaps():
+    catalog_data = {
+        'name': ['a', 'b', 'c'],
+        'ra': [10.0, 20.0, 30.0],
+        'dec': [-10.0, 0.0, 10.0],
+        'radius': [0.1, 0.2, 0.3],
+    }
+    assert catalog_shape(catalog_data) == 'cone'
+    assert catalog_shape({'amaj': [], 'amin': [], 'phi': []}) == 'ellipse'
+    assert catalog_shape({'ra': [], 'dec': []}) is None
+
+    df = pd.DataFrame(catalog_data)
+    chunks = [df.iloc[:2], df.iloc[2:]]
+    skymaps = [s for chunk in catalog_skymaps('cone', chunks) for s in chunk]
+    expected = from_cones(df['ra'], df['dec'], df['radius'], n_sigma=2)
+    assert len(skymaps) == 3
+    for (uniq, probdensity), (expected_uniq, expected_probdensity) in zip(
+        skymaps, expected
+    ):
+        assert np.array_equal(uniq, expected_uniq)
+        assert np.allclose(probdensity, expected_probdensity)
@@ -0,0 +1,88 @@
+from astropy.coordinates import SkyCoord
+import healpix_alchemy as ha
+import numpy as np
+import pytest
+
+from skyportal.utils.tiles import (
+    FIELDS_PER_PROCESS,
+    copy_tiles,
+    field_to_ranges,
+    fields_to_ranges,
+    polygon_to_ranges,
+    uniq_to_ranges,
+)
+
+
+def test_uniq_to_ranges():
+    # uniq = 4 * 4**level + ipix
+    lower, upper = uniq_to_ranges([4, 15, 16, 4 * 4**29 + 7])
+    assert lower.tolist() == [0, 11 * 4**29, 0, 7]
+    assert upper.tolist() == [4**29, 12 * 4**29, 4**28, 8]
+
+    # all the tiles of a level cover the sphere exactly once
+    level = 3
+    uniq = 4 * 4**level + np.arange(12 * 4**level)
+    lower, upper = uniq_to_ranges(uniq)
+    assert lower[0] == 0
+    assert np.all(lower[1:] == upper[:-1])
+    assert upper[-1] == 12 * 4**ha.constants.LEVEL
+
+
+def test_polygon_to_ranges():
+    polygon = SkyCoord([10, 12, 12, 10], [-1, -1, 1, 1], unit='deg')
+    lower, upper = polygon_to_ranges(polygon)
+    assert len(lower) > 0
+    assert [f'[{lo},{hi})' for lo, hi in zip(lower, upper)] == list(
+        ha.Tile.tiles_from_polygon_skycoord(polygon)
+    )
+
+
+def test_copy_tiles_checks_lengths():
+    assert copy_tiles(None, None, [], []) == 0
+
+    with pytest.raises(ValueError):
+        copy_tiles(None, None, [0, 1], [1])
+
+    with pytest.raises(ValueError):
+        copy_tiles(None, None, [0, 1], [1, 2], probdensity=[1.0])
+
+
+def test_fields_to_ranges_in_parallel():
+    # a grid of square fields made of two CCDs
+    rng = np.random.default_rng(0)
+    n_fields = 2 * FIELDS_PER_PROCESS
+    centers = np.stack(
+        [rng.uniform(0, 360, n_fields), rng.uniform(-60, 60, n_fields)], axis=1
+    )
+    fields = []
+    for ra, dec in centers:
+        ccd_ra = ra + np.array([[0, 1, 1, 0], [-1, 0, 0, -1]])
+        ccd_dec = dec + np.array([[-1, -1, 1, 1], [-1, -1, 1, 1]])
+        fields.append((ccd_ra, ccd_dec))
+
+    serial = list(fields_to_ranges(fields))
+    parallel = list(fields_to_ranges(fields, max_processes=2))
+    assert len(serial) == len(parallel) == n_fields
+    for (lower, upper), (parallel_lower, parallel_upper) in zip(serial, parallel):
+        assert len(lower) > 0
+        assert np.all(lower < upper)
+        assert lower.tolist() == parallel_lower.tolist()
+        assert upper.tolist() == parallel_upper.tolist()
+
+    lower, upper = field_to_ranges(fields[0])
+    assert lower.tolist() == serial[0][0].tolist()
+
+
+def test_field_to_ranges_matches_tiles_from_polygon():
+    # a field made of two CCDs, tiled as one polygon each
+    ccd_ra = 200 + np.array([[0, 1, 1, 0], [-1, 0, 0, -1]])
+    ccd_dec = 30 + np.array([[-1, -1, 1, 1], [-1, -1, 1, 1]])
+    lower, upper = field_to_ranges((ccd_ra, ccd_dec))
+
+    expected = [
+        hpx
+        for ra, dec in zip(ccd_ra, ccd_dec)
+        for hpx in ha.Tile.tiles_from_polygon_skycoord(SkyCoord(ra, dec, unit='deg'))
+    ]
+    assert len(expected) > 0
+    assert [f'[{lo},{hi})' for lo, hi in zip(lower, upper)] == expected
@@ -1,9 +1,17 @@
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
+from urllib.parse import urlparse
 import hashlib
+import json
 import os
+import sqlite3
+import threading
 import time
+import uuid
 import io
 import numpy as np
+import requests
 
 from baselayer.log import make_log
 
@@ -23,6 +31,42 @@ def array_to_bytes(array):
     return b.getvalue()
 
 
+def file_checksum(path, chunk_size=1024**2):
+    """SHA-256 checksum of the content of a file, as used by DownloadCache.
+
+    Parameters
+    ----------
+    path : Path or str
+        Path to the file.
+    chunk_size : int, optional
+        Number of bytes read at once.
+    """
+    m = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            m.update(chunk)
+    return m.hexdigest()
+
+
+def query_fingerprint(stmt, dialect=None):
+    """Hash of an SQLAlchemy statement and its bound parameters, identifying
+    queries that would return the same results.
+
+    Parameters
+    ----------
+    stmt : sqlalchemy.sql.expression.Executable
+        The statement.
+    dialect : sqlalchemy.engine.Dialect, optional
+        Dialect to compile the statement with.
+    """
+    compiled = stmt.compile(dialect=dialect)
+    params = sorted(compiled.params.items())
+    m = hashlib.sha256()
+    m.update(str(compiled).encode('utf-8'))
+    m.update(repr(params).encode('utf-8'))
+    return m.hexdigest()
+
+
 class Cache:
     def __init__(self, cache_dir, max_items=None, max_age=None):
         """
@@ -98,6 +142,41 @@ class Cache:
 
         self.clean_cache()
 
+    def get(self, name):
+        """Return the data of an item of the cache, or None if it is not
+        in the cache.
+
+        Parameters
+        ----------
+        name : str
+        """
+        cache_file = self[name]
+        if cache_file is None:
+            return None
+        try:
+            return cache_file.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def set(self, name, data, tags=()):
+        """Insert item into cache.
+
+        Parameters
+        ----------
+        name : str
+            Name for this entry.
+        data : bytes
+            Bytes to be written to file associated with this entry.
+        tags : list of str, optional
+            Ignored, this cache does not support invalidation by tag.
+        """
+        self[name] = data
+
+    def invalidate(self, tags):
+        """Entries of this cache are not tagged, and only expire with
+        `max_items` and `max_age`."""
+        pass
+
     def _remove(self, filenames):
         """Remove given items from the cache.
 
@@ -138,3 +217,432 @@ class Cache:
 
     def __len__(self):
         return len(list(self._cache_dir.glob('*')))
+
+
+class SQLiteCache:
+    """Cache stored in a single SQLite database file.
+
+    Unlike `Cache`, all the processes of the app running on the same host
+    can share this cache, entries can be tagged and invalidated by tag,
+    and the LRU/age bookkeeping uses indexed queries rather than
+    listing the cache directory.
+    """
+
+    def __init__(self, cache_file, max_items=None, max_age=None, timeout=10):
+        """
+        Parameters
+        ----------
+        cache_file : Path or str
+            Path to the SQLite database. Parent directories will be
+            created if necessary.
+        max_items : int, optional
+            Maximum number of items ever held in the cache, the least
+            recently used items being removed first. If unspecified, then
+            the cache size is only controlled by `max_age`. If zero,
+            caching will be disabled.
+        max_age : int, optional
+            Maximum time (in seconds) since an item was last used before
+            it gets removed. If unspecified, the cache size is only
+            controlled by `max_items`.
+        timeout : float, optional
+            How long (in seconds) to wait for another process holding
+            a lock on the database.
+        """
+        cache_file = Path(cache_file)
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+
+        self._cache_file = cache_file
+        self._max_items = max_items
+        self._max_age = max_age
+        self._timeout = timeout
+        self._local = threading.local()
+
+        self._connection().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed_at_index
+                ON entries (accessed_at);
+            CREATE TABLE IF NOT EXISTS tags (
+                tag TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (tag, key)
+            );
+            CREATE INDEX IF NOT EXISTS tags_key_index ON tags (key);
+            CREATE TRIGGER IF NOT EXISTS entries_delete_tags
+                AFTER DELETE ON entries
+                BEGIN
+                    DELETE FROM tags WHERE key = OLD.key;
+                END;
+            """
+        )
+
+    def _connection(self):
+        # one connection per process and thread
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            conn = sqlite3.connect(
+                self._cache_file, timeout=self._timeout, isolation_level=None
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def get(self, name):
+        """Return the data of an item of the cache, or None if it is not
+        in the cache (or has expired).
+
+        Parameters
+        ----------
+        name : str
+        """
+        if name is None:
+            return None
+
+        # Cache is disabled, return nothing
+        if self._max_items == 0:
+            return None
+
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT value, accessed_at FROM entries WHERE key = ?', (name,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, accessed_at = row
+            if self._max_age is not None and (now - accessed_at) > self._max_age:
+                conn.execute('DELETE FROM entries WHERE key = ?', (name,))
+                return None
+
+            # Make newest in cache
+            conn.execute(
+                'UPDATE entries SET accessed_at = ? WHERE key = ?', (now, name)
+            )
+
+        log(f"hit [{name}]")
+        return value
+
+    def set(self, name, data, tags=()):
+        """Insert item into cache.
+
+        Parameters
+        ----------
+        name : str
+            Name for this entry.
+        data : bytes
+            Bytes to be stored for this entry.
+        tags : list of str, optional
+            Tags of this entry, used to invalidate it (see `invalidate`).
+        """
+        # Cache is disabled, do not add entry
+        if self._max_items == 0:
+            return
+
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM entries WHERE key = ?', (name,))
+            conn.execute(
+                'INSERT INTO entries (key, value, accessed_at) VALUES (?, ?, ?)',
+                (name, sqlite3.Binary(data), now),
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO tags (tag, key) VALUES (?, ?)',
+                [(str(tag), name) for tag in tags],
+            )
+            self._clean_cache(conn, now)
+
+        log(f"save [{name}]")
+
+    def _clean_cache(self, conn, now):
+        if self._max_age is not None:
+            conn.execute(
+                'DELETE FROM entries WHERE accessed_at < ?', (now - self._max_age,)
+            )
+
+        if self._max_items is not None:
+            conn.execute(
+                """
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY accessed_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self._max_items,),
+            )
+
+    def invalidate(self, tags):
+        """Remove all the items of the cache with any of the given tags.
+
+        Parameters
+        ----------
+        tags : list of str
+        """
+        tags = [str(tag) for tag in tags]
+        if len(tags) == 0:
+            return
+
+        with self._transaction() as conn:
+            n_removed = conn.execute(
+                f"""
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM tags
+                    WHERE tag IN ({', '.join('?' * len(tags))})
+                )
+                """,
+                tags,
+            ).rowcount
+
+        if n_removed > 0:
+            log(f"invalidated {n_removed} entries")
+
+    def clean_cache(self):
+        with self._transaction() as conn:
+            self._clean_cache(conn, time.time())
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __setitem__(self, name, data):
+        self.set(name, data)
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+
+class ArrayCache:
+    def __init__(self, max_bytes, disk_cache=None):
+        """In-memory least-recently-used cache of read-only numpy arrays,
+        optionally backed by `.npy` files that are memory-mapped when read
+        back (e.g., by another process).
+
+        Parameters
+        ----------
+        max_bytes : int
+            Maximum total size of the arrays held in memory. If zero,
+            arrays are only cached on disk.
+        disk_cache : Cache, optional
+            File cache in which to also store the arrays.
+        """
+        self._max_bytes = max_bytes
+        self._disk_cache = disk_cache
+        self._arrays = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def _remember(self, name, array):
+        if array.nbytes > self._max_bytes:
+            return
+        with self._lock:
+            if name in self._arrays:
+                self._nbytes -= self._arrays.pop(name).nbytes
+            self._arrays[name] = array
+            self._nbytes += array.nbytes
+            while self._nbytes > self._max_bytes:
+                _, evicted = self._arrays.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+
+    def get(self, name):
+        """Return a cached array, or None if it is not in the cache.
+
+        Parameters
+        ----------
+        name : str
+        """
+        with self._lock:
+            array = self._arrays.get(name)
+            if array is not None:
+                self._arrays.move_to_end(name)
+                return array
+
+        if self._disk_cache is None:
+            return None
+        cache_file = self._disk_cache[name]
+        if cache_file is None:
+            return None
+        try:
+            array = np.load(cache_file, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            # removed, or still being written by another process
+            log(f"Unable to read [{name}] from [{os.path.basename(cache_file)}]: {e}")
+            return None
+        self._remember(name, array)
+        return array
+
+    def set(self, name, array):
+        """Insert an array into the cache, and return it as stored
+        (read-only).
+
+        Parameters
+        ----------
+        name : str
+        array : numpy.ndarray
+        """
+        array = np.asarray(array)
+        array.flags.writeable = False
+        self._remember(name, array)
+        if self._disk_cache is not None:
+            self._disk_cache[name] = array_to_bytes(array)
+        return array
+
+    def __len__(self):
+        return len(self._arrays)
+
+
+class DownloadCache:
+    def __init__(self, cache_dir, max_bytes, timeout=60):
+        """Content-addressed cache of files downloaded from URLs.
+
+        Each file is stored once, named by the SHA-256 checksum of its
+        content (so that URLs serving the same file share it), and is
+        revalidated with the server (ETag / Last-Modified) whenever it is
+        fetched again. The least recently used files are removed when
+        their total size exceeds `max_bytes`.
+
+        Parameters
+        ----------
+        cache_dir : Path or str
+            Path to cache.  Will be created if necessary.
+        max_bytes : int
+            Maximum total size of the cached files. The most recently
+            fetched file is always kept.
+        timeout : float, optional
+            Timeout (in seconds) of the requests to the servers.
+        """
+        self._objects_dir = Path(cache_dir) / 'objects'
+        self._urls_dir = Path(cache_dir) / 'urls'
+        self._objects_dir.mkdir(parents=True, exist_ok=True)
+        self._urls_dir.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._timeout = timeout
+
+    def _url_file(self, url):
+        m = hashlib.md5()
+        m.update(url.encode('utf-8'))
+        return self._urls_dir / f'{m.hexdigest()}.json'
+
+    def _read_entry(self, url):
+        try:
+            entry = json.loads(self._url_file(url).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        if not (self._objects_dir / entry['file']).exists():
+            return None
+        return entry
+
+    def _store(self, url, response):
+        suffixes = Path(urlparse(url).path).suffixes
+        suffix = ''.join(suffixes[-2:] if suffixes[-1:] == ['.gz'] else suffixes[-1:])
+
+        m = hashlib.sha256()
+        tmp_file = self._objects_dir / f'.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_file, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1024**2):
+                    m.update(chunk)
+                    f.write(chunk)
+            entry = {
+                'url': url,
+                'file': f'{m.hexdigest()}{suffix}',
+                'sha256': m.hexdigest(),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            os.replace(tmp_file, self._objects_dir / entry['file'])
+        finally:
+            if tmp_file.exists():
+                os.remove(tmp_file)
+
+        url_file = self._url_file(url)
+        tmp_file = url_file.with_suffix(f'.{uuid.uuid4().hex}.tmp')
+        tmp_file.write_text(json.dumps(entry))
+        os.replace(tmp_file, url_file)
+
+        log(f"save [{url}] to [{entry['file']}]")
+        return entry
+
+    def fetch(self, url):
+        """Return the path to a local copy of the file at a URL, and its
+        checksum, downloading it only if it is not cached or has changed.
+        If the server cannot be reached, a cached copy is used.
+
+        Parameters
+        ----------
+        url : str
+
+        Returns
+        -------
+        path : Path
+        checksum : str
+            SHA-256 checksum of the file.
+        """
+        entry = self._read_entry(url)
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = requests.get(
+                url, headers=headers, stream=True, timeout=self._timeout
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            if entry is None:
+                raise
+            log(f"Unable to revalidate [{url}], using cached file: {e}")
+        else:
+            with response:
+                if response.status_code == 304 and entry is not None:
+                    log(f"hit [{url}]")
+                else:
+                    entry = self._store(url, response)
+
+        path = self._objects_dir / entry['file']
+        path.touch()  # Make newest in cache
+        self.clean_cache()
+        return path, entry['sha256']
+
+    def clean_cache(self):
+        # Remove the least recently used files beyond max_bytes
+        cached_files = [
+            (f.stat().st_mtime, f.stat().st_size, f)
+            for f in self._objects_dir.glob('*')
+            if not f.name.startswith('.')
+        ]
+        cached_files = sorted(cached_files, key=lambda x: x[0], reverse=True)
+
+        total_bytes = 0
+        for i, (mtime, size, f) in enumerate(cached_files):
+            total_bytes += size
+            if i > 0 and total_bytes > self._max_bytes:
+                try:
+                    os.remove(f)
+                    log(f'cleanup [{f.name}]')
+                except FileNotFoundError:
+                    pass
+
+    def __len__(self):
+        return len(
+            [f for f in self._objects_dir.glob('*') if not f.name.startswith('.')]
+        )
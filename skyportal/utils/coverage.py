@@ -0,0 +1,137 @@
+import healpix_alchemy as ha
+import numpy as np
+
+
+def union_ranges(lower, upper):
+    """
+    Merge a set of half-open ranges [lower, upper) into
+    sorted, non-overlapping (and non-adjacent) ranges.
+
+    Parameters
+    ----------
+    lower : array-like of int
+        Lower bounds of the ranges (e.g., nested HEALPix indices
+        at the maximum resolution, as used by healpix_alchemy).
+    upper : array-like of int
+        Upper bounds (exclusive) of the ranges.
+
+    Returns
+    -------
+    lower, upper : numpy.ndarray
+        Bounds of the merged ranges, sorted by lower bound.
+    """
+    lower = np.asarray(lower, dtype=np.int64).ravel()
+    upper = np.asarray(upper, dtype=np.int64).ravel()
+    if lower.shape != upper.shape:
+        raise ValueError('lower and upper must have the same length')
+
+    # drop empty ranges, they do not cover anything
+    keep = upper > lower
+    lower, upper = lower[keep], upper[keep]
+    if len(lower) == 0:
+        return lower, upper
+
+    order = np.argsort(lower, kind='stable')
+    lower, upper = lower[order], upper[order]
+
+    # a range starts a new merged range if it begins after
+    # the end of all the ranges before it
+    running_upper = np.maximum.accumulate(upper)
+    starts = np.empty(len(lower), dtype=bool)
+    starts[0] = True
+    starts[1:] = lower[1:] > running_upper[:-1]
+
+    start_indices = np.flatnonzero(starts)
+    end_indices = np.append(start_indices[1:], len(lower)) - 1
+    return lower[start_indices], running_upper[end_indices]
+
+
+def ranges_length(lower, upper):
+    """
+    Total length of the union of a set of half-open ranges [lower, upper).
+
+    Parameters
+    ----------
+    lower, upper : array-like of int
+        Bounds of the ranges, which may overlap.
+
+    Returns
+    -------
+    int
+        Number of (maximum resolution) pixels covered by the ranges.
+    """
+    lower, upper = union_ranges(lower, upper)
+    return int(np.sum(upper - lower))
+
+
+def ranges_overlap(lower, upper, query_lower, query_upper):
+    """
+    Length of the overlap of each query range with the union of some ranges.
+
+    The union of the ranges is computed once, and each query is answered
+    with a binary search over the cumulative covered length, so that the
+    cost is O((N + M) log(N + M)) for N ranges and M queries.
+
+    Parameters
+    ----------
+    lower, upper : array-like of int
+        Bounds of the ranges (e.g., instrument field tiles),
+        which may overlap.
+    query_lower, query_upper : array-like of int
+        Bounds of the query ranges (e.g., localization tiles).
+
+    Returns
+    -------
+    numpy.ndarray of int
+        For each query range, the number of pixels it shares
+        with the union of the ranges.
+    """
+    lower, upper = union_ranges(lower, upper)
+    query_lower = np.asarray(query_lower, dtype=np.int64).ravel()
+    query_upper = np.asarray(query_upper, dtype=np.int64).ravel()
+    if len(lower) == 0:
+        return np.zeros(len(query_lower), dtype=np.int64)
+
+    lengths = upper - lower
+    # covered length before the start of each merged range
+    cumulative = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    def covered_before(x):
+        # covered length in (-inf, x): index of the last
+        # merged range starting at or before x
+        idx = np.searchsorted(lower, x, side='right') - 1
+        i = np.maximum(idx, 0)
+        covered = cumulative[i] + np.clip(x - lower[i], 0, lengths[i])
+        return np.where(idx >= 0, covered, 0)
+
+    overlap = covered_before(query_upper) - covered_before(query_lower)
+    return np.clip(overlap, 0, None)
+
+
+def coverage(lower, upper, tile_lower, tile_upper, tile_probdensity):
+    """
+    Area and integrated probability of a skymap covered by a set of ranges.
+
+    Parameters
+    ----------
+    lower, upper : array-like of int
+        Bounds of the covering ranges (e.g., the tiles of the
+        instrument fields that were observed), which may overlap.
+    tile_lower, tile_upper : array-like of int
+        Bounds of the (non-overlapping) localization tiles.
+    tile_probdensity : array-like of float
+        Probability density (per steradian) of each localization tile.
+
+    Returns
+    -------
+    area : float
+        Area (in steradians) of the localization tiles covered by the ranges.
+    probability : float
+        Integrated probability covered by the ranges.
+    """
+    overlap = ranges_overlap(lower, upper, tile_lower, tile_upper)
+    tile_probdensity = np.asarray(tile_probdensity, dtype=float).ravel()
+
+    area = float(np.sum(overlap)) * ha.constants.PIXEL_AREA
+    probability = float(np.sum(tile_probdensity * overlap)) * ha.constants.PIXEL_AREA
+    return area, probability
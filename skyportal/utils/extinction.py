@@ -0,0 +1,54 @@
+import functools
+
+from astropy import coordinates as ap_coord
+import dustmaps.sfd
+from dustmaps.config import config
+import numpy as np
+
+from baselayer.app.env import load_env
+from baselayer.log import make_log
+
+log = make_log('extinction')
+
+_, cfg = load_env()
+config['data_dir'] = cfg['misc.dustmap_folder']
+
+
+@functools.lru_cache(maxsize=1)
+def get_sfd_query():
+    """
+    Process-wide SFD dust map query object.
+
+    The SFD maps are loaded (memory-mapped by astropy) the first time this
+    is called, and the same query object is reused afterwards.
+    """
+    return dustmaps.sfd.SFDQuery()
+
+
+def ebv_for(ra, dec):
+    """
+    E(B-V) extinction at a set of positions, in a single vectorized query.
+
+    Parameters
+    ----------
+    ra : float or array-like of float
+        Right ascension(s) in degrees.
+    dec : float or array-like of float
+        Declination(s) in degrees.
+
+    Returns
+    -------
+    numpy.ndarray of float or None
+        E(B-V) for each position, or None if the dust map is not available.
+    """
+    ra = np.atleast_1d(np.asarray(ra, dtype=float))
+    dec = np.atleast_1d(np.asarray(dec, dtype=float))
+    if len(ra) == 0:
+        return np.array([], dtype=float)
+
+    try:
+        coords = ap_coord.SkyCoord(ra, dec, unit='deg')
+        return np.atleast_1d(np.asarray(get_sfd_query()(coords), dtype=float))
+    except Exception as e:
+        log(f'Failed to query the SFD dust map: {e}')
+        return None
@@ -0,0 +1,339 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import hashlib
+from io import BytesIO, StringIO
+import json
+import multiprocessing
+import os
+
+import astropy.units as u
+import healpix_alchemy as ha
+import numpy as np
+import pandas as pd
+
+# columns of the galaxys table written by COPY, in this order
+GALAXY_COLUMNS = [
+    'ra',
+    'dec',
+    'name',
+    'alt_name',
+    'distmpc',
+    'distmpc_unc',
+    'redshift',
+    'redshift_error',
+    'sfr_fuv',
+    'mstar',
+    'magb',
+    'magk',
+    'a',
+    'b2a',
+    'pa',
+    'btc',
+    'healpix',
+    'catalog_name',
+    'created_at',
+    'modified',
+]
+
+FLOAT_COLUMNS = [
+    'ra',
+    'dec',
+    'distmpc',
+    'distmpc_unc',
+    'redshift',
+    'redshift_error',
+    'sfr_fuv',
+    'mstar',
+    'magb',
+    'magk',
+    'a',
+    'b2a',
+    'pa',
+    'btc',
+]
+
+POSITIVE_DEFINITE_COLUMNS = ['distmpc', 'distmpc_unc', 'redshift_error']
+
+GLADE_COLUMNS = [
+    'GLADE_no',
+    'PGC_no',
+    'GWGC_name',
+    'HyperLEDA_name',
+    '2MASS_name',
+    'WISExSCOS_name',
+    'SDSS-DR16Q_name',
+    'Object_type',
+    'RA',
+    'Dec',
+    'B',
+    'B_err',
+    'B_flag',
+    'B_Abs',
+    'J',
+    'J_err',
+    'H',
+    'H_err',
+    'K',
+    'K_err',
+    'W1',
+    'W1_err',
+    'W2',
+    'W2_err',
+    'W1_flag',
+    'B_J',
+    'B_J_err',
+    'z_helio',
+    'z_cmb',
+    'z_flag',
+    'v_err',
+    'z_err',
+    'd_L',
+    'd_L_err',
+    'dist',
+    'Mstar',
+    'Mstar_err',
+    'Mstar_flag',
+    'Merger_rate',
+    'Merger_rate_error',
+]
+
+GLADE_RENAMED_COLUMNS = {
+    'RA': 'ra',
+    'Dec': 'dec',
+    'Mstar': 'mstar',
+    'K': 'magk',
+    'B': 'magb',
+    'z_helio': 'redshift',
+    'z_err': 'redshift_error',
+    'd_L': 'distmpc',
+    'd_L_err': 'distmpc_unc',
+}
+
+# size of the parts of the GLADE+ file parsed by each worker process
+GLADE_CHUNK_SIZE = 100 * 1024**2
+
+
+def prepare_galaxies(df, catalog_name):
+    """
+    Clean up a table of galaxies and compute their HEALPix index,
+    one column at a time.
+
+    Rows without position or name, with a position out of bounds, or with
+    a negative distance, distance uncertainty or redshift error are dropped.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Galaxies, with at least ra, dec and name columns, and optionally
+        the other columns of `GALAXY_COLUMNS`.
+    catalog_name : str
+        Name of the catalog.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Galaxies, with the columns of `GALAXY_COLUMNS`.
+    """
+    df = df.copy()
+    for col in GALAXY_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    for col in FLOAT_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    keep = df['ra'].notnull() & df['dec'].notnull() & df['name'].notnull()
+    keep &= (df['ra'] >= 0) & (df['ra'] < 360)
+    keep &= (df['dec'] >= -90) & (df['dec'] <= 90)
+    for col in POSITIVE_DEFINITE_COLUMNS:
+        keep &= ~(df[col] < 0)
+    df = df[keep]
+
+    df['healpix'] = ha.constants.HPX.lonlat_to_healpix(
+        df['ra'].to_numpy() * u.deg, df['dec'].to_numpy() * u.deg
+    ).astype(np.int64)
+    df['catalog_name'] = catalog_name
+    utcnow = datetime.datetime.utcnow().isoformat()
+    df['created_at'] = utcnow
+    df['modified'] = utcnow
+    return df[GALAXY_COLUMNS].reset_index(drop=True)
+
+
+def galaxies_to_csv(df):
+    """CSV rows of prepared galaxies, for COPY (missing values are empty)."""
+    output = StringIO()
+    df.to_csv(output, index=False, header=False)
+    return output.getvalue()
+
+
+def copy_galaxies(session, csv):
+    """
+    Insert galaxies with COPY, skipping those whose name is already in the
+    table (so that an interrupted ingestion can be resumed).
+
+    The rows are written in the current transaction of the session,
+    which must be committed by the caller.
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.Session
+        Database session.
+    csv : str
+        Galaxies, see `galaxies_to_csv`.
+
+    Returns
+    -------
+    int
+        Number of galaxies inserted.
+    """
+    columns = ', '.join(GALAXY_COLUMNS)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(
+            'CREATE TEMP TABLE galaxys_staging '
+            '(LIKE galaxys INCLUDING DEFAULTS) ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            f'COPY galaxys_staging ({columns}) FROM STDIN WITH (FORMAT csv)',
+            StringIO(csv),
+        )
+        cursor.execute(
+            f'INSERT INTO galaxys ({columns}) SELECT {columns} '
+            'FROM galaxys_staging ON CONFLICT (name) DO NOTHING'
+        )
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def file_chunks(path, chunk_size=GLADE_CHUNK_SIZE):
+    """Byte ranges (start, end) splitting a text file into parts of about
+    chunk_size bytes, at line boundaries."""
+    size = os.path.getsize(path)
+    chunks = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def parse_glade_chunk(path, start, end):
+    """
+    Parse a part of the GLADE+ catalog file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the GLADE+ file.
+    start, end : int
+        Byte range of the part, see `file_chunks`.
+
+    Returns
+    -------
+    csv : str
+        Galaxies of the part, see `galaxies_to_csv`.
+    n_blueshifted : int
+        Number of galaxies with a negative redshift.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    df = pd.read_csv(
+        BytesIO(data),
+        sep=' ',
+        header=None,
+        names=GLADE_COLUMNS,
+        usecols=['GLADE_no'] + list(GLADE_RENAMED_COLUMNS),
+        na_values=['null'],
+        dtype={'GLADE_no': str},
+    )
+    df = df.rename(columns=GLADE_RENAMED_COLUMNS)
+    df['name'] = 'GLADE-' + df['GLADE_no']
+    df = prepare_galaxies(df.drop(columns=['GLADE_no']), 'GLADE')
+    return galaxies_to_csv(df), int((df['redshift'] < 0).sum())
+
+
+class IngestionProgress:
+    def __init__(self, progress_dir, datafile, chunks):
+        """
+        Parts of a catalog file already ingested, saved after each part
+        so that an interrupted ingestion can be resumed.
+
+        Parameters
+        ----------
+        progress_dir : str
+            Directory of the progress files. Will be created if necessary.
+        datafile : str
+            Path to the catalog file.
+        chunks : list of tuple
+            Byte ranges of the parts of the file, see `file_chunks`.
+        """
+        os.makedirs(progress_dir, exist_ok=True)
+        m = hashlib.md5()
+        m.update(
+            json.dumps(
+                [os.path.abspath(datafile), os.path.getsize(datafile), chunks]
+            ).encode('utf-8')
+        )
+        self._file = os.path.join(progress_dir, f'{m.hexdigest()}.json')
+        self.done = set()
+        if os.path.isfile(self._file):
+            with open(self._file) as f:
+                self.done = set(json.load(f)['done'])
+
+    def add(self, chunk_index):
+        self.done.add(chunk_index)
+        tmp_file = f'{self._file}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'done': sorted(self.done)}, f)
+        os.replace(tmp_file, self._file)
+
+    def clear(self):
+        if os.path.isfile(self._file):
+            os.remove(self._file)
+
+
+def parse_glade_chunks(path, chunks, max_processes=1):
+    """
+    Parse parts of the GLADE+ catalog file in a pool of worker processes.
+
+    Parameters
+    ----------
+    path : str
+        Path to the GLADE+ file.
+    chunks : list of tuple
+        Byte ranges of the parts to parse, see `file_chunks`.
+    max_processes : int, optional
+        Maximum number of worker processes.
+
+    Yields
+    ------
+    csv, n_blueshifted
+        Result of `parse_glade_chunk` for each part, in order.
+    """
+    n_processes = min(max_processes, len(chunks))
+    if n_processes <= 1:
+        for start, end in chunks:
+            yield parse_glade_chunk(path, start, end)
+        return
+
+    # spawn rather than fork: this is typically called from a thread of a
+    # server process, with open database connections
+    with ProcessPoolExecutor(
+        max_workers=n_processes, mp_context=multiprocessing.get_context('spawn')
+    ) as executor:
+        # at most n_processes parts in flight, so that parsed parts do not
+        # pile up in memory when the caller consumes them more slowly
+        pending = deque()
+        for start, end in chunks:
+            if len(pending) >= n_processes:
+                yield pending.popleft().result()
+            pending.append(executor.submit(parse_glade_chunk, path, start, end))
+        while pending:
+            yield pending.popleft().result()
@@ -1,7 +1,8 @@
 # Inspired by https://github.com/growth-astro/growth-too-marshal/blob/main/growth/too/gcn.py
 
 import base64
-from cdshealpix import elliptical_cone_search
+from cdshealpix import cone_search, elliptical_cone_search
+import functools
 import os
 import numpy as np
 import scipy
@@ -11,11 +12,12 @@ import tempfile
 from urllib.parse import urlparse
 
 import astropy.units as u
+from astropy.io import fits
 from astropy.table import Table
 from astropy.time import Time
 from astropy.coordinates import SkyCoord
 
-from astropy.coordinates import ICRS, Angle, Longitude, Latitude
+from astropy.coordinates import ICRS, Angle, Longitude, Latitude, angular_separation
 from astropy_healpix import HEALPix, nside_to_level, pixel_resolution_to_nside
 import ligo.skymap.io
 import ligo.skymap.postprocess
@@ -25,6 +27,19 @@ import ligo.skymap.bayestar as ligo_bayestar
 from mocpy.mocpy import flatten_pixels
 from mocpy import MOC
 
+from baselayer.app.env import load_env
+
+from .cache import DownloadCache, file_checksum
+
+_, cfg = load_env()
+
+# skymap files downloaded from the URLs of notices,
+# shared by all the processes of the app
+skymap_cache = DownloadCache(
+    'cache/skymaps',
+    max_bytes=cfg.get('misc.skymap_cache_megabytes', 1024) * 1024**2,
+)
+
 
 def get_trigger(root):
     """Get the trigger ID from a GCN notice."""
@@ -292,6 +307,84 @@ def from_cone(ra, dec, error, n_sigma=4):
     return skymap
 
 
+def from_cones(ra, dec, error, n_sigma=4):
+    """
+    Skymaps of many error circles, as `from_cone`.
+    The pixels of all the circles with the same
+    resolution are evaluated at once, and they are
+    found with the (much faster) cone search of
+    cdshealpix, which may include a few more
+    pixels on the edge of the circles.
+
+    Parameters
+    ----------
+    ra, dec : array-like of float
+        Centers of the circles, in degrees.
+    error : array-like of float
+        1-sigma radii of the circles, in degrees.
+    n_sigma : float, optional
+        Radius of the skymaps, in units of the error.
+
+    Returns
+    -------
+    list of tuple
+        The uniq and probdensity arrays of each circle.
+    """
+    ra = np.atleast_1d(np.asarray(ra, dtype=float))
+    dec = np.atleast_1d(np.asarray(dec, dtype=float))
+    error = np.atleast_1d(np.asarray(error, dtype=float))
+
+    # Determine resolution such that there are at least
+    # 16 pixels across the error radius.
+    nside = np.atleast_1d(pixel_resolution_to_nside(error * u.deg / 16, round='up'))
+
+    skymaps = [None] * len(ra)
+    for group_nside in np.unique(nside):
+        (index,) = np.nonzero(nside == group_nside)
+        hpx = HEALPix(int(group_nside), 'nested', frame=ICRS())
+
+        # Find all pixels in the error circles.
+        ipix = [
+            cone_search(
+                Longitude(ra[i], u.deg),
+                Latitude(dec[i], u.deg),
+                Angle(n_sigma * error[i], u.deg),
+                nside_to_level(hpx.nside),
+                flat=True,
+            )[0]
+            for i in index
+        ]
+        counts = [len(p) for p in ipix]
+        circle = np.repeat(index, counts)
+        ipix = np.concatenate(ipix).astype(np.int64)
+
+        # Convert to multi-resolution pixel indices and sort for each circle.
+        i = np.lexsort((ipix, circle))
+        ipix = ipix[i]
+        circle = circle[i]
+        uniq = ligo.skymap.moc.nest2uniq(nside_to_level(hpx.nside), ipix)
+
+        # Evaluate Gaussians.
+        lon, lat = hpx.healpix_to_lonlat(ipix)
+        distance = angular_separation(lon, lat, ra[circle] * u.deg, dec[circle] * u.deg)
+        probdensity = np.exp(
+            -0.5
+            * np.square(distance / (error[circle] * u.deg)).to_value(
+                u.dimensionless_unscaled
+            )
+        )
+
+        pixel_area = hpx.pixel_area.to_value(u.steradian)
+        splits = np.cumsum(counts)[:-1]
+        for j, circle_uniq, circle_probdensity in zip(
+            index, np.split(uniq, splits), np.split(probdensity, splits)
+        ):
+            circle_probdensity /= circle_probdensity.sum() * pixel_area
+            skymaps[j] = (circle_uniq, circle_probdensity)
+
+    return skymaps
+
+
 def from_polygon(localization_name, polygon):
 
     xyz = [hp.ang2vec(r, d, lonlat=True) for r, d in polygon]
@@ -350,6 +443,52 @@ def from_ellipse(localization_name, ra, dec, amaj, amin, phi):
     return skymap
 
 
+def from_ellipses(ra, dec, amaj, amin, phi):
+    """
+    Skymaps of many error ellipses, as `from_ellipse`.
+    The cells found by the elliptical cone search are
+    kept as a multi-order map, rather than flattened to
+    the finest resolution: the region and the probability
+    density are the same, with far fewer pixels.
+
+    Parameters
+    ----------
+    ra, dec : array-like of float
+        Centers of the ellipses, in degrees.
+    amaj, amin : array-like of float
+        Semi-major and semi-minor axes of the ellipses, in degrees.
+    phi : array-like of float
+        Position angles of the ellipses, in degrees.
+
+    Returns
+    -------
+    list of tuple
+        The uniq and probdensity arrays of each ellipse.
+    """
+    max_depth = nside_to_level(2**13)
+
+    skymaps = []
+    for args in zip(ra, dec, amaj, amin, phi):
+        ipix, depth, _ = elliptical_cone_search(
+            Longitude(args[0], u.deg),
+            Latitude(args[1], u.deg),
+            Angle(args[2], unit="deg"),
+            Angle(args[3], unit="deg"),
+            Angle(args[4], unit="deg"),
+            max_depth,
+        )
+        uniq = np.sort(
+            ligo.skymap.moc.nest2uniq(
+                np.asarray(depth, dtype=np.int8), np.asarray(ipix, dtype=np.int64)
+            )
+        )
+
+        area = np.sum(4 * np.pi / (12 * 4 ** np.asarray(depth, dtype=np.float64)))
+        skymaps.append((uniq, np.full(len(uniq), 1 / area)))
+
+    return skymaps
+
+
 def from_bytes(arr):
     def get_col(m, name):
         try:
@@ -390,12 +529,19 @@ def from_bytes(arr):
     return skymap
 
 
-def get_occulted(url, nside=64):
+def get_occulted(url, nside=64, header=None):
+    """Pixels of a skymap occulted by the Earth (for Fermi GBM skymaps,
+    whose header gives the position of the Earth), or None.
+    If not given, the header is read from the skymap file
+    (a local path, or a URL fetched through skymap_cache).
+    """
+    if header is None:
+        path = url if os.path.exists(url) else skymap_cache.fetch(url)[0]
+        header = fits.getheader(path, 1)
 
-    m = Table.read(url, format='fits')
-    ra = m.meta.get('GEO_RA', None)
-    dec = m.meta.get('GEO_DEC', None)
-    error = m.meta.get('GEO_RAD', 67.5)
+    ra = header.get('GEO_RA', None)
+    dec = header.get('GEO_DEC', None)
+    error = header.get('GEO_RAD', 67.5)
 
     if (ra is None) or (dec is None) or (error is None):
         return None
@@ -412,6 +558,29 @@ def get_occulted(url, nside=64):
 
 
 def from_url(url):
+    """Localization of the skymap at a URL (or a local path).
+    The file is downloaded once (see skymap_cache)
+    and decoded once per process for each content.
+    """
+    if os.path.exists(url):
+        path, checksum = url, file_checksum(url)
+    else:
+        path, checksum = skymap_cache.fetch(url)
+    skymap = read_skymap(str(path), checksum)
+    return {
+        'localization_name': os.path.basename(urlparse(url).path),
+        **skymap,
+    }
+
+
+@functools.lru_cache(maxsize=4)
+def read_skymap(path, checksum):
+    """Decode a skymap file, once per checksum of its content,
+    into the columns of a localization (the MOC arrays, with the
+    pixels occulted by the Earth removed).
+    The returned dictionary should not be modified.
+    """
+
     def get_col(m, name):
         try:
             col = m[name]
@@ -420,12 +589,10 @@ def from_url(url):
         else:
             return col.tolist()
 
-    filename = os.path.basename(urlparse(url).path)
-
-    skymap = ligo.skymap.io.read_sky_map(url, moc=True)
+    skymap = ligo.skymap.io.read_sky_map(path, moc=True)
 
     nside = 128
-    occulted = get_occulted(url, nside=nside)
+    occulted = get_occulted(path, nside=nside, header=fits.getheader(path, 1))
     if occulted is not None:
         order = hp.nside2order(nside)
         skymap_flat = ligo_bayestar.rasterize(skymap, order)['PROB']
@@ -436,7 +603,6 @@ def from_url(url):
         skymap = ligo_bayestar.derasterize(Table([skymap_flat], names=['PROB']))
 
     skymap = {
-        'localization_name': filename,
         'uniq': get_col(skymap, 'UNIQ'),
         'probdensity': get_col(skymap, 'PROBDENSITY'),
         'distmu': get_col(skymap, 'DISTMU'),
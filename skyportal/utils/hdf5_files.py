@@ -87,3 +87,46 @@ def load_dataframe_from_bytestream(data):
             metadata = {}
 
     return data, metadata
+
+
+def load_dataframe_columns(filename, columns=None):
+    """
+    Load a pandas data frame from an HDF5 file on disk,
+    or only some of its columns.
+    Only the requested columns are read if the data
+    is stored in "table" format.
+
+    Parameters
+    ----------
+    filename: str
+        Path to the HDF5 file, which must contain a single table.
+    columns: list of str, optional
+        Names of the columns to read.
+        Columns that are not in the file are skipped.
+        If not given, all the columns are read.
+
+    Returns
+    -------
+    data: pandas.DataFrame
+        The requested columns.
+    names: list of str
+        The names of all the columns in the file.
+    """
+    with pd.HDFStore(filename, mode='r') as store:
+        keys = store.keys()
+        if len(keys) != 1:
+            raise ValueError(f'Expected 1 table in HDF5 file, got {len(keys)}. ')
+        storer = store.get_storer(keys[0])
+        if storer.is_table:
+            names = list(storer.non_index_axes[0][1])
+            if columns is None:
+                data = store.select(keys[0])
+            else:
+                data = store.select(keys[0], columns=[n for n in names if n in columns])
+        else:
+            data = store[keys[0]]
+            names = list(data.columns)
+            if columns is not None:
+                data = data[[n for n in names if n in columns]]
+
+    return data, names
@@ -0,0 +1,25 @@
+import sqlalchemy as sa
+
+# rows per INSERT statement, to stay below the bind parameters limit
+INSERT_CHUNK_SIZE = 1000
+
+
+def insert_values(table, values):
+    """Values of all the columns of a table for a Core INSERT, applying the
+    (scalar or Python callable) column defaults to missing values."""
+    row = {}
+    for col in table.columns:
+        value = values.get(col.key)
+        if value is None and col is table.autoincrement_column:
+            # left to the database sequence
+            continue
+        if value is None and col.default is not None:
+            if col.default.is_scalar:
+                value = col.default.arg
+            elif col.default.is_callable:
+                value = col.default.arg(None)
+        if value is None and isinstance(col.type, sa.JSON):
+            # SQL NULL rather than a JSON null, as for ORM inserts
+            value = sa.null()
+        row[col.key] = value
+    return row
@@ -0,0 +1,251 @@
+import io
+
+import healpix_alchemy as ha
+import ligo.skymap.io
+import numpy as np
+
+from .coverage import union_ranges
+from .tiles import uniq_to_ranges
+
+# powers of 4 and 2 up to the base resolution, to find the largest
+# HEALPix cell starting at a given pixel with binary searches
+POWERS_OF_4 = 4 ** np.arange(ha.constants.LEVEL + 1, dtype=np.int64)
+POWERS_OF_2 = 2 ** np.arange(2 * ha.constants.LEVEL + 4, dtype=np.int64)
+
+
+def ranges_to_uniq(lower, upper):
+    """
+    Decompose pixel ranges at the base resolution into the smallest
+    set of multi-order HEALPix cells.
+
+    Parameters
+    ----------
+    lower, upper : array-like of int
+        Bounds of the half-open, non-overlapping ranges [lower, upper).
+
+    Returns
+    -------
+    uniq : numpy.ndarray of int
+        NUNIQ indices of the cells.
+    index : numpy.ndarray of int
+        Index of the range each cell belongs to.
+    """
+    lower = np.asarray(lower, dtype=np.int64).ravel()
+    upper = np.asarray(upper, dtype=np.int64).ravel()
+    index = np.arange(len(lower))
+    keep = upper > lower
+    lower, upper, index = lower[keep], upper[keep], index[keep]
+
+    uniqs, indices = [], []
+    while len(lower) > 0:
+        # largest cell that starts at lower and fits in the range:
+        # its size 4**k must divide lower and not exceed upper - lower
+        k_length = np.searchsorted(POWERS_OF_4, upper - lower, side='right') - 1
+        lowest_bit = np.bitwise_and(lower, -lower)
+        k_alignment = np.where(
+            lower == 0,
+            ha.constants.LEVEL,
+            np.searchsorted(POWERS_OF_2, lowest_bit) // 2,
+        )
+        k = np.minimum(k_length, k_alignment)
+
+        level = ha.constants.LEVEL - k
+        uniqs.append(4 * POWERS_OF_4[level] + np.right_shift(lower, 2 * k))
+        indices.append(index)
+
+        lower = lower + POWERS_OF_4[k]
+        keep = lower < upper
+        lower, upper, index = lower[keep], upper[keep], index[keep]
+
+    if len(uniqs) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    uniq, index = np.concatenate(uniqs), np.concatenate(indices)
+    order = np.argsort(uniq_to_ranges(uniq)[0])
+    return uniq[order], index[order]
+
+
+def sorted_ranges(uniq):
+    """
+    Pixel ranges of the cells of a multi-order map, sorted by
+    lower bound.
+
+    Parameters
+    ----------
+    uniq : array-like of int
+        NUNIQ indices of the (non-overlapping) cells.
+
+    Returns
+    -------
+    lower, upper : numpy.ndarray of int
+        Bounds of the ranges.
+    order : numpy.ndarray of int
+        Index of the cell of each range.
+    """
+    lower, upper = uniq_to_ranges(uniq)
+    order = np.argsort(lower)
+    return lower[order], upper[order], order
+
+
+def common_segments(*maps):
+    """
+    Split the sky into the segments delimited by the cells of several
+    multi-order maps, so that each segment is within at most one cell
+    of each map.
+
+    Parameters
+    ----------
+    *maps : array-like of int
+        NUNIQ indices of the cells of each map.
+
+    Returns
+    -------
+    lower, upper : numpy.ndarray of int
+        Bounds of the segments.
+    cells : list of numpy.ndarray of int
+        For each map, the index of the cell containing each segment,
+        or -1 if the segment is not covered by the map.
+    """
+    ranges = [sorted_ranges(uniq) for uniq in maps]
+    bounds = np.unique(np.concatenate([np.concatenate(r[:2]) for r in ranges]))
+    lower, upper = bounds[:-1], bounds[1:]
+
+    cells = []
+    for cell_lower, cell_upper, order in ranges:
+        if len(order) == 0:
+            cells.append(np.full(len(lower), -1))
+            continue
+        idx = np.searchsorted(cell_lower, lower, side='right') - 1
+        i = np.maximum(idx, 0)
+        covered = (idx >= 0) & (lower < cell_upper[i])
+        cells.append(np.where(covered, order[i], -1))
+    return lower, upper, cells
+
+
+def intersection(uniq1, uniq2):
+    """
+    Region covered by both of two multi-order maps (MOCs).
+
+    Parameters
+    ----------
+    uniq1, uniq2 : array-like of int
+        NUNIQ indices of the cells of each map.
+
+    Returns
+    -------
+    numpy.ndarray of int
+        NUNIQ indices of the cells of the intersection.
+    """
+    lower, upper, (cells1, cells2) = common_segments(uniq1, uniq2)
+    keep = (cells1 >= 0) & (cells2 >= 0)
+    lower, upper = union_ranges(lower[keep], upper[keep])
+    return ranges_to_uniq(lower, upper)[0]
+
+
+def union(uniq1, uniq2):
+    """
+    Region covered by either of two multi-order maps (MOCs).
+
+    Parameters
+    ----------
+    uniq1, uniq2 : array-like of int
+        NUNIQ indices of the cells of each map.
+
+    Returns
+    -------
+    numpy.ndarray of int
+        NUNIQ indices of the cells of the union.
+    """
+    lower1, upper1 = uniq_to_ranges(uniq1)
+    lower2, upper2 = uniq_to_ranges(uniq2)
+    lower, upper = union_ranges(
+        np.concatenate([lower1, lower2]), np.concatenate([upper1, upper2])
+    )
+    return ranges_to_uniq(lower, upper)[0]
+
+
+def product(uniq1, probdensity1, uniq2, probdensity2):
+    """
+    Normalized product of two multi-order skymaps (e.g., to crossmatch
+    two localizations of the same event), without rasterizing them.
+
+    Parameters
+    ----------
+    uniq1, uniq2 : array-like of int
+        NUNIQ indices of the cells of each skymap.
+    probdensity1, probdensity2 : array-like of float
+        Probability density (per steradian) of each cell.
+
+    Returns
+    -------
+    uniq : numpy.ndarray of int
+        NUNIQ indices of the cells of the product, which is defined
+        where both skymaps are.
+    probdensity : numpy.ndarray of float
+        Probability density (per steradian) of each cell.
+    """
+    probdensity1 = np.asarray(probdensity1, dtype=float)
+    probdensity2 = np.asarray(probdensity2, dtype=float)
+
+    lower, upper, (cells1, cells2) = common_segments(uniq1, uniq2)
+    keep = (cells1 >= 0) & (cells2 >= 0)
+    lower, upper = lower[keep], upper[keep]
+    probdensity = probdensity1[cells1[keep]] * probdensity2[cells2[keep]]
+
+    norm = np.sum(probdensity * (upper - lower)) * ha.constants.PIXEL_AREA
+    if norm > 0:
+        probdensity = probdensity / norm
+
+    uniq, index = ranges_to_uniq(lower, upper)
+    return uniq, probdensity[index]
+
+
+def credible_region(uniq, probdensity, level=0.9):
+    """
+    Smallest region of a multi-order skymap containing a given probability,
+    made of the cells of highest probability density.
+
+    Parameters
+    ----------
+    uniq : array-like of int
+        NUNIQ indices of the cells of the skymap.
+    probdensity : array-like of float
+        Probability density (per steradian) of each cell.
+    level : float, optional
+        Cumulative probability of the region.
+
+    Returns
+    -------
+    numpy.ndarray of int
+        NUNIQ indices of the cells of the region.
+    """
+    uniq = np.asarray(uniq, dtype=np.int64)
+    probdensity = np.asarray(probdensity, dtype=float)
+    if len(uniq) == 0:
+        return uniq
+    lower, upper = uniq_to_ranges(uniq)
+    probability = probdensity * (upper - lower) * ha.constants.PIXEL_AREA
+
+    order = np.argsort(-probdensity, kind='stable')
+    cumulative = np.cumsum(probability[order])
+    # include the cell in which the cumulative probability reaches the level
+    n_cells = np.searchsorted(cumulative, level * cumulative[-1]) + 1
+    return uniq[np.sort(order[:n_cells])]
+
+
+def to_fits(table):
+    """
+    Multi-order FITS skymap, written in memory.
+
+    Parameters
+    ----------
+    table : astropy.table.Table
+        Skymap, with UNIQ and PROBDENSITY (and optionally distance) columns.
+
+    Returns
+    -------
+    bytes
+        Content of the FITS file.
+    """
+    buffer = io.BytesIO()
+    ligo.skymap.io.write_sky_map(buffer, table, moc=True)
+    return buffer.getvalue()
@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# JSON sidecar with the names of the columns and the metadata of the data
+METADATA_FILE = 'metadata.json'
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'Cannot serialize {type(value)} to JSON')
+
+
+def dump_dataframe_to_directory(df, path, metadata=None):
+    """
+    Save a pandas dataframe as a directory of
+    raw .npy files, one per column, and a JSON
+    sidecar with the column names and metadata.
+    Each column can then be memory-mapped on its own.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        The dataframe to save. Columns of strings
+        are saved as fixed-width unicode arrays.
+    path: str
+        The directory to save the data into.
+        If it exists, it is replaced.
+    metadata: dict
+        A dictionary of metadata to store in the sidecar.
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        values = df[name].to_numpy()
+        if values.dtype == object:
+            values = values.astype(str)
+        filename = f'column_{i}.npy'
+        np.save(os.path.join(path, filename), values, allow_pickle=False)
+        columns.append({'name': str(name), 'file': filename})
+
+    with open(os.path.join(path, METADATA_FILE), 'w') as f:
+        json.dump({'columns': columns, 'metadata': metadata or {}}, f, default=_to_json)
+
+
+def load_directory_metadata(path):
+    """
+    Load the metadata dictionary saved
+    with the data in a directory of .npy files.
+    """
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        return json.load(f)['metadata']
+
+
+def load_directory_arrays(path, columns=None, mmap_mode='r'):
+    """
+    Load (some of) the columns saved in a directory of
+    .npy files, memory-mapped by default so that nothing
+    is read from disk until the arrays are accessed.
+
+    Parameters
+    ----------
+    path: str
+        The directory with the data.
+    columns: list of str, optional
+        Names of the columns to load.
+        Columns that are not in the data are skipped.
+        If not given, all the columns are loaded.
+    mmap_mode: str, optional
+        Memory-mapping mode passed to numpy.load.
+        Use None to read the arrays into memory.
+
+    Returns
+    -------
+    arrays: dict of numpy.ndarray
+        The requested columns, in the order they were saved.
+    names: list of str
+        The names of all the columns in the data.
+    """
+    with open(os.path.join(path, METADATA_FILE)) as f:
+        saved_columns = json.load(f)['columns']
+
+    arrays = {}
+    for column in saved_columns:
+        if columns is None or column['name'] in columns:
+            arrays[column['name']] = np.load(
+                os.path.join(path, column['file']),
+                mmap_mode=mmap_mode,
+                allow_pickle=False,
+            )
+    return arrays, [column['name'] for column in saved_columns]
+
+
+def load_dataframe_from_directory(path, columns=None):
+    """
+    Load a pandas dataframe, or only some of its
+    columns, from a directory of .npy files.
+
+    Returns
+    -------
+    data: pandas.DataFrame
+        The requested columns.
+    names: list of str
+        The names of all the columns in the data.
+    """
+    arrays, names = load_directory_arrays(path, columns, mmap_mode=None)
+    return pd.DataFrame(arrays), names
+
+
+def time_range_slice(times, start=None, end=None):
+    """
+    The slice of a sorted array of times that
+    falls between start and end (inclusive).
+    Used on memory-mapped columns, only the pages
+    visited by the binary search are read from disk,
+    and slicing the other columns makes no copy.
+
+    Parameters
+    ----------
+    times: numpy.ndarray
+        Sorted times (e.g., MJDs).
+    start, end: float, optional
+        Bounds of the time range. If not given,
+        the range is not bounded on that side.
+
+    Returns
+    -------
+    slice
+    """
+    first = 0 if start is None else np.searchsorted(times, start, side='left')
+    last = len(times) if end is None else np.searchsorted(times, end, side='right')
+    return slice(int(first), int(last))
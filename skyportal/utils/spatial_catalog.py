@@ -0,0 +1,90 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from .gcn import from_cones, from_ellipses
+
+# number of catalog entries whose skymaps are computed by a worker
+# process, and that are inserted (and committed) together
+ENTRIES_CHUNK_SIZE = 1000
+
+# columns of the catalog data describing the region of each entry
+REGION_COLUMNS = {'cone': ['radius'], 'ellipse': ['amaj', 'amin', 'phi']}
+
+
+def catalog_shape(catalog_data):
+    """
+    Shape of the regions of the entries of a catalog
+    (cone or ellipse), from the columns of its data.
+
+    Parameters
+    ----------
+    catalog_data : dict
+        Columns of the catalog.
+
+    Returns
+    -------
+    str or None
+        Shape of the regions, or None if the
+        columns do not describe a region.
+    """
+    for shape, columns in REGION_COLUMNS.items():
+        if set(columns).issubset(catalog_data.keys()):
+            return shape
+    return None
+
+
+def chunk_skymaps(shape, chunk):
+    """
+    Skymaps of a chunk of catalog entries.
+
+    Parameters
+    ----------
+    shape : str
+        Shape of the regions, cone or ellipse.
+    chunk : pandas.DataFrame
+        Entries, with ra and dec columns and
+        the columns of `REGION_COLUMNS[shape]`.
+
+    Returns
+    -------
+    list of tuple
+        The uniq and probdensity arrays of each entry.
+    """
+    if shape == 'cone':
+        return from_cones(chunk['ra'], chunk['dec'], chunk['radius'], n_sigma=2)
+    return from_ellipses(
+        chunk['ra'], chunk['dec'], chunk['amaj'], chunk['amin'], chunk['phi']
+    )
+
+
+def catalog_skymaps(shape, chunks, max_processes=1):
+    """
+    Skymaps of chunks of catalog entries,
+    computed in a pool of worker processes.
+
+    Parameters
+    ----------
+    shape : str
+        Shape of the regions, cone or ellipse.
+    chunks : list of pandas.DataFrame
+        Entries, see `chunk_skymaps`.
+    max_processes : int, optional
+        Maximum number of worker processes.
+
+    Yields
+    ------
+    list of tuple
+        Result of `chunk_skymaps` for each chunk, in order.
+    """
+    n_processes = min(max_processes, len(chunks))
+    if n_processes <= 1:
+        for chunk in chunks:
+            yield chunk_skymaps(shape, chunk)
+        return
+
+    # spawn rather than fork: this is typically called from a thread of a
+    # server process, with open database connections
+    with ProcessPoolExecutor(
+        max_workers=n_processes, mp_context=multiprocessing.get_context('spawn')
+    ) as executor:
+        yield from executor.map(chunk_skymaps, [shape] * len(chunks), chunks)
@@ -0,0 +1,188 @@
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+from io import StringIO
+import multiprocessing
+
+from astropy_healpix import uniq_to_level_ipix
+import healpix_alchemy as ha
+from astropy.coordinates import SkyCoord
+from mocpy import MOC
+import numpy as np
+import pandas as pd
+
+# number of rows sent to the database per COPY statement
+COPY_CHUNK_SIZE = 100000
+
+# minimum number of fields per worker process when tiling fields in parallel
+FIELDS_PER_PROCESS = 100
+
+
+def uniq_to_ranges(uniq):
+    """
+    Convert multi-order HEALPix (UNIQ) indices to pixel ranges at the
+    base resolution, as stored by `healpix_alchemy.Tile` columns.
+
+    Parameters
+    ----------
+    uniq : array-like of int
+        NUNIQ pixel indices.
+
+    Returns
+    -------
+    lower, upper : numpy.ndarray of int
+        Bounds of the half-open ranges [lower, upper).
+    """
+    level, ipix = uniq_to_level_ipix(np.asarray(uniq, dtype=np.int64))
+    shift = 2 * (ha.constants.LEVEL - np.asarray(level, dtype=np.int64))
+    ipix = np.asarray(ipix, dtype=np.int64)
+    return np.left_shift(ipix, shift), np.left_shift(ipix + 1, shift)
+
+
+def polygon_to_ranges(polygon):
+    """
+    Pixel ranges at the base resolution covering a polygon,
+    as `healpix_alchemy.Tile.tiles_from_polygon_skycoord`.
+
+    Parameters
+    ----------
+    polygon : astropy.coordinates.SkyCoord
+        Vertices of the polygon.
+
+    Returns
+    -------
+    lower, upper : numpy.ndarray of int
+        Bounds of the half-open ranges [lower, upper).
+    """
+    moc = MOC.from_polygon_skycoord(polygon.transform_to(ha.constants.HPX.frame))
+    ranges = np.asarray(moc._interval_set.nested, dtype=np.int64).reshape(-1, 2)
+    return ranges[:, 0], ranges[:, 1]
+
+
+def copy_tiles(session, model, lower, upper, chunk_size=COPY_CHUNK_SIZE, **columns):
+    """
+    Insert tiles (rows with a `healpix_alchemy.Tile` column named `healpix`)
+    with COPY, rather than through ORM objects.
+
+    The rows are written in the current transaction of the session,
+    which must be committed by the caller.
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.Session
+        Database session.
+    model : skyportal.models.Base
+        Tile model, e.g., LocalizationTile, SpatialCatalogEntryTile
+        or InstrumentFieldTile.
+    lower, upper : array-like of int
+        Bounds of the pixel ranges of the tiles, see `uniq_to_ranges`.
+    chunk_size : int, optional
+        Number of rows sent per COPY statement.
+    **columns : scalar or array-like
+        Values of the other columns of the tiles, either one value for all
+        the tiles or one value per tile (e.g., `probdensity`).
+
+    Returns
+    -------
+    int
+        Number of tiles inserted.
+    """
+    lower = np.asarray(lower, dtype=np.int64).ravel()
+    upper = np.asarray(upper, dtype=np.int64).ravel()
+    if len(lower) != len(upper):
+        raise ValueError('lower and upper must have the same length')
+    n_tiles = len(lower)
+    if n_tiles == 0:
+        return 0
+
+    utcnow = datetime.datetime.utcnow().isoformat()
+    df = pd.DataFrame({'created_at': utcnow, 'modified': utcnow}, index=range(n_tiles))
+    for name, values in columns.items():
+        if not np.isscalar(values) and len(values) != n_tiles:
+            raise ValueError(f'{name} must have one value per tile')
+        df[name] = values
+    df['healpix'] = (
+        '[' + pd.Series(lower).astype(str) + ',' + pd.Series(upper).astype(str) + ')'
+    )
+
+    table = model.__table__.name
+    column_names = ', '.join(df.columns)
+    cursor = session.connection().connection.cursor()
+    try:
+        for start in range(0, n_tiles, chunk_size):
+            output = StringIO()
+            df.iloc[start : start + chunk_size].to_csv(
+                output, index=False, header=False
+            )
+            output.seek(0)
+            cursor.copy_expert(
+                f'COPY {table} ({column_names}) FROM STDIN WITH (FORMAT csv)',
+                output,
+            )
+    finally:
+        cursor.close()
+
+    return n_tiles
+
+
+def field_to_ranges(vertices):
+    """
+    Pixel ranges at the base resolution covering an instrument field,
+    made of one or several polygons (e.g., the CCDs of a camera).
+
+    Parameters
+    ----------
+    vertices : tuple of array-like of float
+        Right ascensions and declinations (in degrees) of the vertices,
+        with shape (number of polygons, number of vertices per polygon).
+
+    Returns
+    -------
+    lower, upper : numpy.ndarray of int
+        Bounds of the half-open ranges [lower, upper), concatenated
+        over the polygons.
+    """
+    ranges = [
+        polygon_to_ranges(SkyCoord(ra, dec, unit='deg')) for ra, dec in zip(*vertices)
+    ]
+    if len(ranges) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return (
+        np.concatenate([lower for lower, _ in ranges]),
+        np.concatenate([upper for _, upper in ranges]),
+    )
+
+
+def fields_to_ranges(fields, max_processes=1):
+    """
+    Pixel ranges of many instrument fields, computed in a pool of
+    worker processes for large grids.
+
+    Parameters
+    ----------
+    fields : list
+        Vertices of each field, see `field_to_ranges`.
+    max_processes : int, optional
+        Maximum number of worker processes. Fields are tiled in the
+        calling process when this is 1, or when there are fewer than
+        `FIELDS_PER_PROCESS` fields per worker.
+
+    Yields
+    ------
+    lower, upper : numpy.ndarray of int
+        Pixel ranges of each field, in the order of `fields`.
+    """
+    n_processes = min(max_processes, len(fields) // FIELDS_PER_PROCESS)
+    if n_processes <= 1:
+        yield from map(field_to_ranges, fields)
+        return
+
+    # spawn rather than fork: this is typically called from a thread of a
+    # server process, with open database connections
+    with ProcessPoolExecutor(
+        max_workers=n_processes, mp_context=multiprocessing.get_context('spawn')
+    ) as executor:
+        yield from executor.map(
+            field_to_ranges,
+            fields,
+            chunksize=max(1, len(fields) // (4 * n_processes)),
+        )
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+#
+# Micro-benchmark for merging multi-order HEALPix tile ranges
+#
+# PYTHONPATH=. python tools/benchmark_healpix_tuples.py \
+#     --sizes=1000,10000,100000,1000000,10000000 --repeat=3
+#
+
+import time
+
+import fire
+import numpy as np
+
+from skyportal.facility_apis.observation_plan import combine_healpix_tuples
+from skyportal.utils.coverage import ranges_length, union_ranges
+
+MAX_ORDER = 29
+
+
+def multi_order_tiles(n_tiles, min_order=6, max_order=12, seed=0):
+    """Random (possibly overlapping) multi-order tiles, as nested
+    pixel ranges at order 29 (the healpix_alchemy convention)."""
+
+    rng = np.random.default_rng(seed)
+    orders = rng.integers(min_order, max_order + 1, size=n_tiles)
+    ipix = (rng.random(n_tiles) * 12 * 4.0**orders).astype(np.int64)
+    shift = 2 * (MAX_ORDER - orders)
+    lower = np.left_shift(ipix, shift)
+    upper = np.left_shift(ipix + 1, shift)
+    return lower, upper
+
+
+def timeit(func, repeat):
+    runtimes = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        runtimes.append(time.perf_counter() - t0)
+    return min(runtimes), result
+
+
+def benchmark(sizes='1000,10000,100000,1000000,10000000', repeat=3):
+    """Time the merging of multi-order tile ranges.
+    sizes: str
+        Comma delimited list of the number of tiles
+    repeat: int
+        Number of runs per size (the fastest is reported)
+    """
+
+    if isinstance(sizes, (int, float)):
+        sizes = [int(sizes)]
+    elif isinstance(sizes, str):
+        sizes = [int(float(size)) for size in sizes.split(",")]
+    else:
+        sizes = [int(size) for size in sizes]
+
+    print(
+        f"{'tiles':>10} {'merged':>10} {'union_ranges [s]':>18} "
+        f"{'combine_healpix_tuples [s]':>28}"
+    )
+    for size in sizes:
+        lower, upper = multi_order_tiles(size)
+
+        runtime_arrays, (merged_lower, merged_upper) = timeit(
+            lambda: union_ranges(lower, upper), repeat
+        )
+
+        tuples = list(zip(lower.tolist(), upper.tolist()))
+        runtime_tuples, merged = timeit(lambda: combine_healpix_tuples(tuples), repeat)
+
+        assert len(merged) == len(merged_lower)
+        assert sum(hi - lo for lo, hi in merged) == ranges_length(lower, upper)
+
+        print(
+            f"{size:>10d} {len(merged_lower):>10d} {runtime_arrays:>18.4f} "
+            f"{runtime_tuples:>28.4f}"
+        )
+
+
+if __name__ == '__main__':
+    fire.Fire(benchmark)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# Compare the number of SQL statements (and the time) needed to serialize
+# a page of sources with their related data: one Obj at a time, as the
+# sources API used to do (one query per relation per Obj), and the whole
+# page at once with hydrate_sources (one query per relation).
+#
+# PYTHONPATH=. python tools/benchmark_hydrate_sources.py --user_id=1 --page_size=100
+#
+
+import time
+
+import fire
+import sqlalchemy as sa
+
+from baselayer.app.env import load_env
+from baselayer.app.models import init_db, DBSession
+from skyportal.handlers.api.source import hydrate_sources
+from skyportal.models import Obj, Source, User
+
+env, cfg = load_env()
+init_db(**cfg['database'])
+
+HYDRATE_KWARGS = {
+    'include_thumbnails': True,
+    'include_comments': True,
+    'include_photometry_exists': True,
+    'include_spectrum_exists': True,
+    'include_period_exists': True,
+    'include_labellers': True,
+}
+
+
+def hydrate_per_obj(session, objs):
+    return [hydrate_sources(session, [obj], **HYDRATE_KWARGS)[0] for obj in objs]
+
+
+def hydrate_page(session, objs):
+    return hydrate_sources(session, objs, **HYDRATE_KWARGS)
+
+
+def benchmark(user_id, page_size=100, repeat=3):
+    """Count the statements and time the serialization of a page of sources.
+    user_id: int
+        ID of the user the sources are serialized for
+    page_size: int
+        Number of sources on the page (the most recently saved ones)
+    repeat: int
+        Number of runs per method (the fastest is reported)
+    """
+
+    session = DBSession()
+    user = session.scalars(sa.select(User).where(User.id == user_id)).first()
+    if user is None:
+        raise ValueError(f'No user with ID {user_id}')
+    session.user_or_token = user
+
+    obj_ids = session.scalars(
+        Source.select(user, columns=[Source.obj_id])
+        .order_by(Source.saved_at.desc())
+        .limit(page_size)
+    ).all()
+    objs = session.scalars(Obj.select(user).where(Obj.id.in_(obj_ids))).all()
+    print(f'{len(objs)} sources')
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    sa.event.listen(engine, 'before_cursor_execute', count_statement)
+    try:
+        for name, hydrate in [('per obj', hydrate_per_obj), ('page', hydrate_page)]:
+            runtimes, n_statements = [], []
+            for _ in range(repeat):
+                statements.clear()
+                t0 = time.perf_counter()
+                hydrate(session, objs)
+                runtimes.append(time.perf_counter() - t0)
+                n_statements.append(len(statements))
+            print(
+                f'{name:>8}: {min(n_statements)} statements, '
+                f'{min(runtimes) * 1000:.1f} ms'
+            )
+    finally:
+        sa.event.remove(engine, 'before_cursor_execute', count_statement)
+        session.rollback()
+        session.close()
+
+
+if __name__ == '__main__':
+    fire.Fire(benchmark)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# Compare reading photometric series data saved as an HDF5 file
+# and as a directory of memory-mapped .npy columns, for a synthetic
+# series: the whole data, a single column, and a range of MJDs.
+# The files are read right after being written, so the OS page cache
+# is warm; the difference is the decoding and copying of the data.
+#
+# PYTHONPATH=. python tools/benchmark_photometric_series_formats.py --num_exp=1000000
+#
+
+import os
+import tempfile
+import time
+
+import fire
+import numpy as np
+import pandas as pd
+
+from skyportal.utils.hdf5_files import (
+    dump_dataframe_to_bytestream,
+    load_dataframe_columns,
+)
+from skyportal.utils.npy_files import (
+    dump_dataframe_to_directory,
+    load_dataframe_from_directory,
+    load_directory_arrays,
+    time_range_slice,
+)
+
+
+def make_series(num_exp, num_columns):
+    rng = np.random.default_rng(0)
+    data = {
+        'mjd': 60000 + np.arange(num_exp) / 86400,
+        'flux': rng.normal(1000, 10, num_exp),
+        'fluxerr': np.full(num_exp, 10.0),
+    }
+    for i in range(num_columns):
+        data[f'aux_{i}'] = rng.random(num_exp)
+    return pd.DataFrame(data)
+
+
+def read_range_hdf5(filename, start, end):
+    data, _ = load_dataframe_columns(filename, ['mjd', 'flux'])
+    mask = (data['mjd'] >= start) & (data['mjd'] <= end)
+    return data['flux'].to_numpy()[mask.to_numpy()].sum()
+
+
+def read_range_npy(path, start, end):
+    arrays, _ = load_directory_arrays(path, ['mjd', 'flux'])
+    return arrays['flux'][time_range_slice(arrays['mjd'], start, end)].sum()
+
+
+def benchmark(num_exp=1_000_000, num_columns=10, range_fraction=0.01, repeat=5):
+    """Time reading a synthetic series in both formats.
+    num_exp: int
+        Number of exposures of the series
+    num_columns: int
+        Number of auxiliary columns, besides mjd, flux and fluxerr
+    range_fraction: float
+        Fraction of the series read in the MJD range test
+    repeat: int
+        Number of runs per test (the fastest is reported)
+    """
+    df = make_series(num_exp, num_columns)
+    start = df['mjd'].iloc[num_exp // 2]
+    end = df['mjd'].iloc[min(num_exp - 1, num_exp // 2 + int(num_exp * range_fraction))]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        h5_file = os.path.join(tmpdir, 'series.h5')
+        with open(h5_file, 'wb') as f:
+            f.write(dump_dataframe_to_bytestream(df, encode=False))
+        npy_dir = os.path.join(tmpdir, 'series.cols')
+        dump_dataframe_to_directory(df, npy_dir)
+        print(
+            f'{num_exp} exposures, {len(df.columns)} columns: '
+            f'{os.path.getsize(h5_file) / 1024**2:.1f} MB (hdf5)'
+        )
+
+        tests = [
+            (
+                'all columns',
+                lambda: load_dataframe_columns(h5_file),
+                lambda: load_dataframe_from_directory(npy_dir),
+            ),
+            (
+                'one column',
+                lambda: load_dataframe_columns(h5_file, ['flux']),
+                lambda: load_dataframe_from_directory(npy_dir, ['flux']),
+            ),
+            (
+                'mjd range',
+                lambda: read_range_hdf5(h5_file, start, end),
+                lambda: read_range_npy(npy_dir, start, end),
+            ),
+        ]
+        for name, read_hdf5, read_npy in tests:
+            for fmt, read in [('hdf5', read_hdf5), ('npy', read_npy)]:
+                runtimes = []
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    read()
+                    runtimes.append(time.perf_counter() - t0)
+                print(f'{name:>12} {fmt:>5}: {np.min(runtimes) * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    fire.Fire(benchmark)
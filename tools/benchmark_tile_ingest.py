@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# Compare ORM and COPY ingestion of the tiles of an existing localization.
+# Both runs happen in a transaction that is rolled back, so the database
+# is left unchanged.
+#
+# PYTHONPATH=. python tools/benchmark_tile_ingest.py --localization_id=1
+#
+
+import time
+
+import fire
+import numpy as np
+import sqlalchemy as sa
+
+from baselayer.app.env import load_env
+from baselayer.app.models import init_db, DBSession
+from skyportal.models import Localization, LocalizationTile
+from skyportal.utils.tiles import copy_tiles, uniq_to_ranges
+
+env, cfg = load_env()
+init_db(**cfg['database'])
+
+
+def ingest_orm(session, localization, lower, upper):
+    session.add_all(
+        [
+            LocalizationTile(
+                localization_id=localization.id,
+                probdensity=probdensity,
+                healpix=f'[{lo},{hi})',
+            )
+            for lo, hi, probdensity in zip(
+                lower.tolist(), upper.tolist(), localization.probdensity
+            )
+        ]
+    )
+    session.flush()
+
+
+def ingest_copy(session, localization, lower, upper):
+    copy_tiles(
+        session,
+        LocalizationTile,
+        lower,
+        upper,
+        localization_id=localization.id,
+        probdensity=localization.probdensity,
+    )
+
+
+def benchmark(localization_id, repeat=3):
+    """Time the re-ingestion of the tiles of a localization.
+    localization_id: int
+        ID of the localization whose skymap is re-ingested
+    repeat: int
+        Number of runs per method (the fastest is reported)
+    """
+
+    session = DBSession()
+    localization = session.scalars(
+        sa.select(Localization).where(Localization.id == localization_id)
+    ).first()
+    if localization is None:
+        raise ValueError(f'No localization with ID {localization_id}')
+    lower, upper = uniq_to_ranges(localization.uniq)
+    print(f'{len(lower)} tiles')
+
+    for name, ingest in [('ORM', ingest_orm), ('COPY', ingest_copy)]:
+        runtimes = []
+        for _ in range(repeat):
+            session.execute(
+                sa.delete(LocalizationTile).where(
+                    LocalizationTile.localization_id == localization.id
+                )
+            )
+            t0 = time.perf_counter()
+            ingest(session, localization, lower, upper)
+            runtimes.append(time.perf_counter() - t0)
+            session.rollback()
+        print(f'{name:>5}: {np.min(runtimes):.3f} s')
+
+    session.close()
+
+
+if __name__ == '__main__':
+    fire.Fire(benchmark)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#
+# Convert the data of existing photometric series between the on-disk
+# formats (see photometric_series_format in the config): HDF5 files
+# (hdf5) and directories of memory-mappable .npy columns (npy).
+# The filename of each converted series is updated in the database;
+# the old files are only deleted with --remove_old.
+#
+# PYTHONPATH=. python tools/convert_photometric_series.py --to_format=npy
+#
+
+import os
+
+import fire
+import sqlalchemy as sa
+
+from baselayer.app.env import load_env
+from baselayer.app.models import init_db, DBSession
+from skyportal.models import PhotometricSeries
+from skyportal.models.photometric_series import DATA_FORMAT_EXTENSIONS
+from skyportal.utils.npy_files import dump_dataframe_to_directory
+
+env, cfg = load_env()
+init_db(**cfg['database'])
+
+
+def convert(to_format='npy', remove_old=False, dry_run=False, limit=None):
+    """Convert the data files of photometric series to another format.
+    to_format: str
+        Format to convert to, hdf5 or npy
+    remove_old: bool
+        Delete the files in the old format after conversion
+    dry_run: bool
+        Only list the series that would be converted
+    limit: int
+        Maximum number of series to convert
+    """
+    if to_format not in DATA_FORMAT_EXTENSIONS:
+        raise ValueError(
+            f'Unknown format "{to_format}". Use one of {list(DATA_FORMAT_EXTENSIONS)}.'
+        )
+    new_extension = DATA_FORMAT_EXTENSIONS[to_format]
+    old_extensions = tuple(
+        ext for ext in DATA_FORMAT_EXTENSIONS.values() if ext != new_extension
+    )
+
+    session = DBSession()
+    stmt = sa.select(PhotometricSeries.id).where(
+        sa.or_(*[PhotometricSeries.filename.endswith(ext) for ext in old_extensions])
+    )
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    series_ids = session.scalars(stmt.order_by(PhotometricSeries.id)).all()
+    print(f'{len(series_ids)} series to convert to {to_format}')
+
+    converted = 0
+    for series_id in series_ids:
+        ps = session.scalars(
+            sa.select(PhotometricSeries).where(PhotometricSeries.id == series_id)
+        ).first()
+        old_filename = ps.filename
+        new_filename = os.path.splitext(old_filename)[0] + new_extension
+        if dry_run:
+            print(f'{old_filename} -> {new_filename}')
+            continue
+        if not os.path.exists(old_filename):
+            print(f'Skipping series {ps.id}: {old_filename} does not exist')
+            continue
+
+        try:
+            if to_format == 'npy':
+                dump_dataframe_to_directory(
+                    ps.data, new_filename, metadata=ps.get_metadata()
+                )
+            else:
+                with open(new_filename, 'wb') as f:
+                    f.write(ps.get_data_bytes())
+            ps.filename = new_filename
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            PhotometricSeries.remove_data_path(new_filename)
+            print(f'Could not convert series {series_id}: {e}')
+            continue
+
+        if remove_old:
+            PhotometricSeries.remove_data_path(old_filename)
+        converted += 1
+
+    print(f'Converted {converted} series')
+    session.close()
+
+
+if __name__ == '__main__':
+    fire.Fire(convert)